@@ -6,48 +6,128 @@ Generates H5P slide deck presentations from PDF slides and audio files
 using the H5P.SlideDeck library format.
 """
 
+import io
 import os
 import json
 import shutil
-import zipfile
 import click
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
-from tqdm import tqdm
-from PIL import Image
+from typing import Callable, List, Dict, Tuple, Optional, Union
 import uuid
 import re
-from docx import Document
-from PyPDF2 import PdfReader, PdfWriter
-from pptx import Presentation
-import tempfile
-import zipfile as zip
+import time
+
+from h5p_package import (TemplateCache, H5PPackageWriter, CompressionPolicy, RawArchive,
+                         BytesSource, COMPRESSION_PROFILES, DEFAULT_COMPRESSION_PROFILE,
+                         read_library_index, resolve_libraries, main_library, content_libraries)
+from pdf_slides import split_pdf, resolve_workers, page_fingerprints, slide_filename
+from build_manifest import BuildManifest, MANIFEST_NAME, text_fingerprint
+from slide_images import rasterise_pdf, image_filename, IMAGE_FORMATS, SLIDE_FORMATS, DEFAULT_DPI
+from pptx_media import PptxMedia, ZipMember, AUDIO_EXTENSIONS
+from audio_transcode import transcode_audio, audio_mime_type, AUDIO_PROFILES, DEFAULT_AUDIO_PROFILE
+from build_metrics import timed_phase, MemoryMonitor
+from memory_budget import MemoryBudget, MB
+from slide_notes import read_notes_docx, text_to_html
+from audio_duration import DurationIndex, format_duration
+from build_plan import (pdf_page_info, slide_ranges, check_notes_document, library_bytes, image_megapixels,
+                        estimate_seconds, IMAGE_BYTES_PER_PIXEL, CONTENT_BYTES_PER_SLIDE)
 
 # Import project configuration
-from config import PROJECT_NAME, OUTPUT_DIR, VO_DIR, PNG_DIR, NOTES_DOCX, PROJECT_TITLE, PDF_DOC
+from config import (PROJECT_NAME, OUTPUT_DIR, VO_DIR, PNG_DIR, NOTES_DOCX, PROJECT_TITLE, PDF_DOC,
+                    create_directories)
 
 
 class H5PSlideDeckGenerator:
     """Main class for generating H5P SlideDeck presentations"""
     
-    def __init__(self, project_name: str = None, verbose: bool = False):
-        """Initialize the generator with project configuration"""
+    def __init__(self, project_name: str = None, verbose: bool = False,
+                 compression: str = DEFAULT_COMPRESSION_PROFILE, workers: int = 1,
+                 prune_resources: bool = False, incremental: bool = False,
+                 progress: Optional[Callable[[str, int, int], None]] = None,
+                 workspace: Optional[Path] = None, in_memory: bool = False,
+                 slide_format: str = 'pdf', dpi: int = DEFAULT_DPI,
+                 audio_profile: str = DEFAULT_AUDIO_PROFILE, all_libraries: bool = False,
+                 autoplay: bool = False, memory_budget: int = 0):
+        """Initialize the generator with project configuration
+        
+        ``progress(phase, done, total)`` is called as the ``split``,
+        ``extract`` and ``package`` phases advance.
+        
+        Intermediate files go to ``workspace`` (default:
+        ``00_Output/<project>``). Give each concurrent build its own
+        workspace, or use ``in_memory`` to keep slide PDFs and PPTX audio
+        off disk entirely; generators are then independent and can run in
+        parallel threads of one process.
+        
+        ``slide_format`` is ``pdf`` (H5P.PDFViewer) or an image format
+        (``webp``, ``png``) rasterised at ``dpi`` and shown with H5P.Image.
+        ``audio_profile`` re-encodes the narration (see ``audio_transcode``).
+        Packages contain only the template libraries their content needs,
+        unless ``all_libraries`` is set.
+        ``autoplay`` starts each slide's narration as the slide is shown.
+        ``memory_budget`` caps the build's resident memory at that many MB
+        where it can (see ``memory_budget``); 0 means no cap. The peak
+        memory of each phase is recorded either way.
+        """
+        if in_memory and incremental:
+            raise ValueError("Incremental builds need an on-disk workspace")
+        if slide_format not in SLIDE_FORMATS:
+            raise ValueError(f"Unknown slide format: {slide_format}")
+        if audio_profile not in AUDIO_PROFILES:
+            raise ValueError(f"Unknown audio profile: {audio_profile}")
         self.project_name = project_name or PROJECT_NAME
         self.verbose = verbose
+        self.compression = CompressionPolicy(compression)
+        self.workers = resolve_workers(workers)
+        self.prune_resources = prune_resources
+        self.incremental = incremental
+        self.progress = progress or (lambda phase, done, total: None)
+        self.slide_format = slide_format
+        self.dpi = dpi
+        self.audio_profile = audio_profile
+        self.all_libraries = all_libraries
+        self.autoplay = autoplay
         
         # Get project root directory (where this script is located)
         # SD_Generator.py is in the project root, so we use its directory
         self.project_root = Path(os.path.dirname(os.path.abspath(__file__)))
         
-        # Update paths based on project root
-        self.output_dir = self.project_root / '00_Output' / self.project_name
+        # Update paths based on project root, unless the build has its own workspace
+        self.in_memory = in_memory
+        if workspace is not None:
+            self.output_dir = Path(workspace)
+        else:
+            self.output_dir = self.project_root / '00_Output' / self.project_name
         self.pdf_dir = self.output_dir / 'pdf_slides'  # New directory for individual PDF slides
+        self.spill_dir = self.output_dir / 'spill'  # In-memory slides spilled over the memory budget
+        self.image_dir = self.output_dir / 'slide_images'  # Rasterised slides in image mode
         self.vo_dir = self.output_dir / 'VO'
         self.notes_docx = self.output_dir / f"{self.project_name}_NOTES.docx"
         self.template_dir = self.project_root / 'Template_SD'
-        self.temp_dir = self.project_root / 'temp_h5p_sd_build'
+        self.template_cache_dir = self.project_root / '.template_cache'
+        self.audio_cache_dir = self.project_root / '.audio_cache'
         self.source_pdf = None  # Will be set when processing files
         self.slide_notes = {}  # Initialize slide notes dictionary
+        self.pptx_audio: Dict[int, ZipMember] = {}  # Audio streamed from the PPTX at build time
+        self.packaged_audio: Dict[int, Union[Path, ZipMember]] = {}  # Audio after transcoding, by slide
+        self.audio_durations: Dict[int, Optional[float]] = {}  # Narration seconds, by slide
+        self.timings: Dict[str, float] = {}  # Seconds spent in each phase (see build_metrics.timed_phase)
+        self.slide_count = 0  # Slides in the last package built
+        self.memory_slides: Dict[int, Union[bytes, Path]] = {}  # Slides of in-memory builds (or their spill file), by page
+        self.image_sizes: Dict[int, Tuple[int, int]] = {}  # Slide image (width, height), by slide
+        self.memory_budget = MemoryBudget(memory_budget, self.spill_dir) if memory_budget else None
+        self.memory_monitor = MemoryMonitor()  # Peak RSS of each phase (see build_metrics.timed_phase)
+        
+        # Fingerprints of the last build, only used for incremental builds
+        self.manifest = None
+        if self.incremental:
+            self.manifest = BuildManifest.load(self.output_dir / MANIFEST_NAME, {
+                'prune_resources': self.prune_resources,
+                'compression': self.compression.key,
+                'slide_format': self.slide_format,
+                'dpi': self.dpi if self.slide_format in IMAGE_FORMATS else None,
+                'audio_profile': self.audio_profile,
+            })
         
         if self.verbose:
             click.echo(f"Project: {self.project_name}")
@@ -55,6 +135,15 @@ class H5PSlideDeckGenerator:
             click.echo(f"PDF Directory: {self.pdf_dir}")
             click.echo(f"Audio Directory: {self.vo_dir}")
             click.echo(f"Template: SlideDeck")
+            click.echo(f"Compression: {self.compression.profile}")
+            click.echo(f"Workers: {self.workers}")
+            click.echo(f"Prune slide resources: {self.prune_resources}")
+            click.echo(f"Incremental: {self.incremental}")
+            click.echo(f"In memory: {self.in_memory}")
+            click.echo(f"Slide format: {self.slide_format}")
+            click.echo(f"Audio profile: {self.audio_profile}")
+            click.echo(f"Autoplay: {self.autoplay}")
+            click.echo(f"Memory budget: {f'{memory_budget} MB' if memory_budget else 'none'}")
     
     def validate_directories(self) -> bool:
         """Validate that all required directories exist"""
@@ -72,105 +161,280 @@ class H5PSlideDeckGenerator:
         
         return True
     
-    def parse_notes_document(self) -> Dict[int, str]:
-        """Parse the Word document to extract slide notes"""
-        slide_notes = {}
+    @timed_phase('notes')
+    def parse_notes_document(self, docx_path: Optional[Path] = None) -> Optional[Dict[int, str]]:
+        """Parse the Word notes document into notes HTML per slide
+        
+        ``docx_path`` defaults to ``<project>_NOTES.docx`` in the output
+        directory. The document is streamed (see ``slide_notes``), so its
+        size and embedded images do not matter. Returns None if the
+        document cannot be parsed.
+        """
+        docx_path = Path(docx_path) if docx_path else self.notes_docx
         
-        if not self.notes_docx.exists():
+        if not docx_path.exists():
             if self.verbose:
-                click.echo(click.style(f"Warning: Notes document not found: {self.notes_docx}", fg='yellow'))
-            return slide_notes
+                click.echo(click.style(f"Warning: Notes document not found: {docx_path}", fg='yellow'))
+            return {}
         
         try:
-            doc = Document(self.notes_docx)
-            current_slide = None
-            current_text = []
-            
-            for paragraph in doc.paragraphs:
-                # Check if this is a heading (slide number)
-                if paragraph.style.name.startswith('Heading'):
-                    # Save previous slide's text if we have one
-                    if current_slide is not None and current_text:
-                        slide_notes[current_slide] = ' '.join(current_text).strip()
-                    
-                    # Extract slide number from heading
-                    heading_text = paragraph.text.strip()
-                    slide_match = re.search(r'[Ss]lide\s*(\d+)', heading_text)
-                    if slide_match:
-                        current_slide = int(slide_match.group(1))
-                        current_text = []
-                    else:
-                        current_slide = None
-                        current_text = []
-                
-                elif current_slide is not None and paragraph.text.strip():
-                    # This is content for the current slide
-                    current_text.append(paragraph.text.strip())
-            
-            # Don't forget the last slide
-            if current_slide is not None and current_text:
-                slide_notes[current_slide] = ' '.join(current_text).strip()
-            
-            if self.verbose:
-                click.echo(f"Parsed notes for {len(slide_notes)} slides from Word document")
-                
+            self.progress('notes', 0, 1)
+            slide_notes = read_notes_docx(docx_path)
+            self.progress('notes', 1, 1)
+            click.echo(f"Parsed notes for {len(slide_notes)} slides from Word document")
         except Exception as e:
             click.echo(click.style(f"Error parsing notes document: {e}", fg='red'))
+            return None
         
         return slide_notes
 
+    def slide_file(self, page_num: int) -> Path:
+        """Return the on-disk slide file of a zero-based page in the current format"""
+        if self.slide_format in IMAGE_FORMATS:
+            return self.image_dir / image_filename(page_num, self.slide_format)
+        return self.pdf_dir / slide_filename(page_num)
+    
+    @timed_phase('split')
     def split_pdf_into_slides(self) -> bool:
-        """Split the source PDF into individual slide PDFs"""
+        """Split the source PDF into individual slide PDFs
+        
+        Page ranges are spread over ``self.workers`` processes; the slide
+        files are the same whatever the worker count. With
+        ``self.prune_resources`` each slide only keeps the shared fonts,
+        images and other resources its own content uses. Incremental builds
+        only rewrite the slides whose page fingerprint changed.
+        
+        In image mode the pages are rasterised to slide images instead.
+        Under a memory budget, in-memory slides may be spilled to files.
+        """
         try:
-            # Create PDF slides directory
-            self.pdf_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Read the source PDF
-            pdf = PdfReader(self.source_pdf)
-            total_pages = len(pdf.pages)
+            if self.spill_dir.exists():
+                shutil.rmtree(self.spill_dir)
+            pages = None
+            if self.manifest is not None:
+                fingerprints = page_fingerprints(self.source_pdf, self.memory_budget)
+                self.manifest.truncate(len(fingerprints))
+                pages = []
+                for page_num, fingerprint in enumerate(fingerprints):
+                    slide_num = page_num + 1
+                    if (self.manifest.changed(slide_num, 'page', fingerprint)
+                            or not self.slide_file(page_num).exists()):
+                        pages.append(page_num)
+                        entry = self.manifest.slide(slide_num)
+                        entry.pop('pdf', None)
+                        entry['page'] = fingerprint
+                click.echo(f"Splitting {len(pages)} of {len(fingerprints)} changed slides...")
+            elif self.workers > 1:
+                click.echo(f"Splitting PDF into slides with {self.workers} workers...")
+            else:
+                click.echo("Splitting PDF into slides...")
             
-            click.echo(f"Splitting PDF into {total_pages} slides...")
+            progress = lambda done, total: self.progress('split', done, total)
+            if self.slide_format in IMAGE_FORMATS:
+                total_pages, images = rasterise_pdf(
+                    self.source_pdf, None if self.in_memory else self.image_dir, dpi=self.dpi,
+                    image_format=self.slide_format, workers=self.workers, pages=pages,
+                    progress=progress, budget=self.memory_budget)
+                self.memory_slides = {page_num: data for page_num, (data, _, _) in images.items()}
+                self.image_sizes = {page_num + 1: (width, height)
+                                    for page_num, (_, width, height) in images.items()}
+                click.echo(click.style(f"✓ PDF rasterised to {self.slide_format.upper()} "
+                                       f"at {self.dpi} DPI ({total_pages} slides)", fg='green'))
+                self.report_spilled_slides()
+                return True
             
-            # Split each page into a separate PDF
-            for page_num in range(total_pages):
-                writer = PdfWriter()
-                writer.add_page(pdf.pages[page_num])
-                
-                # Save individual slide PDF
-                output_path = self.pdf_dir / f"Slide{page_num + 1}.pdf"
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
+            total_pages, saved, self.memory_slides = split_pdf(
+                self.source_pdf, None if self.in_memory else self.pdf_dir,
+                workers=self.workers, prune=self.prune_resources, pages=pages,
+                progress=progress, budget=self.memory_budget)
             
-            click.echo(click.style("✓ PDF splitting completed successfully", fg='green'))
+            click.echo(click.style(f"✓ PDF splitting completed successfully ({total_pages} slides)", fg='green'))
+            if self.prune_resources:
+                click.echo(f"  Unused resources pruned: {saved / (1024 * 1024):.2f} MB")
+            self.report_spilled_slides()
             return True
             
         except Exception as e:
             click.echo(click.style(f"Error splitting PDF: {e}", fg='red'))
             return False
 
-    def get_slide_files(self) -> List[Tuple[int, Path, Optional[Path]]]:
-        """Get all slide PDF files and their corresponding audio files"""
+    def report_spilled_slides(self) -> None:
+        """Tell how many in-memory slides went to disk over the memory budget"""
+        spilled = sum(isinstance(data, Path) for data in self.memory_slides.values())
+        if spilled:
+            click.echo(click.style(f"  {spilled} of {len(self.memory_slides)} slides spilled to "
+                                   f"{self.spill_dir} over the memory budget", fg='yellow'))
+
+    def get_slide_files(self) -> List[Tuple[int, Union[Path, BytesSource],
+                                              Union[Path, ZipMember, None]]]:
+        """Get all slide PDF files and their corresponding audio files
+        
+        Audio kept inside the PPTX (see ``extract_audio_from_pptx``) is
+        returned as a ``ZipMember`` instead of a path in ``VO/``, and slide
+        files of in-memory builds as a ``BytesSource`` (or the path they
+        were spilled to). In image mode the slide files are the rasterised
+        images.
+        """
         slides = []
         
         # Get all PDF files
-        pdf_files = sorted(self.pdf_dir.glob("Slide*.pdf"))
+        if self.in_memory:
+            pdf_files = [data if isinstance(data, Path) else BytesSource(data, self.slide_file(page_num).name)
+                         for page_num, data in sorted(self.memory_slides.items())]
+        else:
+            pdf_files = sorted(self.slide_file(0).parent.glob("Slide*"))
+        extension = self.slide_file(0).suffix
         
         for pdf_file in pdf_files:
             # Extract slide number
-            match = re.match(r'Slide(\d+)\.pdf', pdf_file.name)
+            match = re.fullmatch(r'Slide(\d+)' + re.escape(extension), pdf_file.name)
             if match:
                 slide_num = int(match.group(1))
                 
                 # Find corresponding audio file
-                audio_file = self.vo_dir / f"media_{slide_num}.mp3"
-                if not audio_file.exists():
+                audio_file = self.pptx_audio.get(slide_num) or self.vo_audio_file(slide_num)
+                if audio_file is None:
                     click.echo(click.style(f"Warning: No audio file for slide {slide_num}", fg='yellow'))
-                    audio_file = None
                 
                 slides.append((slide_num, pdf_file, audio_file))
         
         return sorted(slides, key=lambda x: x[0])
     
+    def vo_audio_file(self, slide_num: int) -> Optional[Path]:
+        """Return the slide's audio in ``VO/`` (``media_N.mp3``, ``.m4a`` or ``.wav``), if any"""
+        for extension in AUDIO_EXTENSIONS:
+            audio_file = self.vo_dir / f"media_{slide_num}{extension}"
+            if audio_file.exists():
+                return audio_file
+        return None
+    
+    @timed_phase('transcode')
+    def transcode_slide_audio(self, sources: Dict[int, Union[Path, ZipMember]]
+                              ) -> Dict[int, Union[Path, ZipMember]]:
+        """Encode slide audio to ``self.audio_profile``, returning the audio to package
+        
+        Encoded clips come from the audio cache when the same clip was
+        encoded before; with the ``original`` profile the sources are
+        returned as they are.
+        """
+        packaged = transcode_audio(sources, self.audio_profile, self.audio_cache_dir,
+                                   workers=self.workers,
+                                   progress=lambda done, total: self.progress('transcode', done, total))
+        if self.verbose and AUDIO_PROFILES[self.audio_profile] is not None:
+            encoded = sum(1 for slide_num in sources if packaged[slide_num] is not sources[slide_num])
+            click.echo(f"Audio: {encoded} of {len(sources)} clips encoded to {self.audio_profile}")
+        return packaged
+    
+    @timed_phase('durations')
+    def measure_audio_durations(self, sources: Dict[int, Union[Path, ZipMember]]
+                                ) -> Dict[int, Optional[float]]:
+        """Return the narration length of each slide in seconds (None if unreadable)
+        
+        Lengths come from the clip headers and are cached by content hash
+        in the audio cache, so no clip is decoded.
+        """
+        return DurationIndex(self.audio_cache_dir).measure(sources, workers=self.workers)
+    
+    def duration_report(self) -> Dict:
+        """Narration seconds per slide and in total, with the slides lacking narration"""
+        known = {slide_num: seconds for slide_num, seconds in self.audio_durations.items()
+                 if seconds is not None}
+        return {
+            'slides': {slide_num: round(seconds, 3) for slide_num, seconds in sorted(known.items())},
+            'total': round(sum(known.values()), 3),
+            'unknown': sorted(set(self.audio_durations) - set(known)),
+            'silent': [slide_num for slide_num in range(1, self.slide_count + 1)
+                       if slide_num not in self.audio_durations],
+        }
+    
+    @property
+    def reader_reopens(self) -> int:
+        """Times the split reopened the source PDF to stay under the memory budget"""
+        return self.memory_budget.reopens if self.memory_budget else 0
+
+    def print_memory_report(self) -> None:
+        """Print the peak memory of each phase (verbose only) and warn if one broke the budget"""
+        peaks = self.memory_monitor.peaks
+        if self.verbose and peaks:
+            click.echo("Peak memory: " + ', '.join(f"{phase} {rss / MB:.0f} MB"
+                                                   for phase, rss in peaks.items()))
+        if self.verbose and self.reader_reopens:
+            click.echo(f"PDF reader reopened {self.reader_reopens} times to stay under the memory budget")
+        if self.memory_budget and peaks and max(peaks.values()) > self.memory_budget.limit:
+            phase = max(peaks, key=peaks.get)
+            click.echo(click.style(f"Warning: Peak memory {peaks[phase] / MB:.0f} MB during {phase} "
+                                   f"exceeded the {self.memory_budget.limit // MB} MB budget",
+                                   fg='yellow'))
+
+    def print_duration_report(self) -> None:
+        """Print the total narration time, and the time of each slide in verbose mode"""
+        report = self.duration_report()
+        click.echo(f"  Narration: {format_duration(report['total'])} on "
+                   f"{len(report['slides'])} of {self.slide_count} slides")
+        if self.verbose:
+            for slide_num, seconds in report['slides'].items():
+                click.echo(f"    Slide {slide_num}: {format_duration(seconds)}")
+        if report['unknown']:
+            click.echo(click.style(f"  Warning: Unknown narration length on slides "
+                                   f"{', '.join(map(str, report['unknown']))}", fg='yellow'))
+        if self.autoplay and report['silent']:
+            click.echo(click.style(f"  Warning: No narration to auto-play on slides "
+                                   f"{', '.join(map(str, report['silent']))}", fg='yellow'))
+    
+    def audio_fingerprint(self, audio_path: Union[Path, ZipMember]) -> str:
+        """Return a cheap change marker for a slide's audio source"""
+        if isinstance(audio_path, ZipMember):
+            return audio_path.fingerprint
+        stat = audio_path.stat()
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+    
+    def audio_reusable(self, slide_num: int, audio_path: Union[Path, ZipMember]) -> bool:
+        """Whether the last package already holds this slide's unchanged audio"""
+        entry = self.manifest.slide(slide_num)
+        return 'audio' in entry and entry.get('audio_source') == self.audio_fingerprint(audio_path)
+    
+    def add_slide_media(self, writer: H5PPackageWriter, previous: Optional[RawArchive],
+                        slide_num: int, pdf_path: Union[Path, BytesSource],
+                        audio_path: Union[Path, ZipMember, None]) -> Tuple[str, Optional[str], bool]:
+        """Add a slide's PDF and audio to the package
+        
+        In incremental builds, media whose source is unchanged since the last
+        build is copied compressed from the previous package. Returns the
+        PDF path, the audio path and whether anything had to be re-added.
+        """
+        entry = self.manifest.slide(slide_num) if self.manifest is not None else {}
+        rebuilt = False
+        
+        pdf_file = None
+        if previous is not None and 'pdf' in entry:
+            pdf_file = writer.copy_media(previous, entry['pdf'], entry['pdf_sha'])
+        if pdf_file is None:
+            if self.slide_format in IMAGE_FORMATS:
+                pdf_file = writer.add_media('images', 'image', pdf_path, IMAGE_FORMATS[self.slide_format][0])
+            else:
+                pdf_file = writer.add_media('files', 'pdf', pdf_path, '.pdf')
+            entry['pdf'], entry['pdf_sha'] = pdf_file, writer.source_digest(pdf_path)[0]
+            rebuilt = True
+        
+        audio_file = None
+        if audio_path:
+            audio_source = self.audio_fingerprint(audio_path)
+            if previous is not None and self.audio_reusable(slide_num, audio_path):
+                audio_file = writer.copy_media(previous, entry['audio'], entry['audio_sha'])
+            if audio_file is None:
+                packaged = self.packaged_audio.get(slide_num)
+                if packaged is None:
+                    packaged = self.transcode_slide_audio({slide_num: audio_path})[slide_num]
+                audio_file = writer.add_media('audios', 'audio', packaged, packaged.suffix)
+                entry['audio'], entry['audio_sha'] = audio_file, writer.source_digest(packaged)[0]
+                entry['audio_source'] = audio_source
+                rebuilt = True
+        else:
+            for key in ('audio', 'audio_sha', 'audio_source'):
+                entry.pop(key, None)
+        
+        return pdf_file, audio_file, rebuilt
+    
     def generate_unique_filename(self, extension: str) -> str:
         """Generate a unique filename for H5P content"""
         # H5P uses a specific format for filenames
@@ -205,6 +469,47 @@ class H5PSlideDeckGenerator:
         
         return element
     
+    def create_image_element(self, image_path: str, slide_num: int,
+                             size: Tuple[int, int]) -> Dict:
+        """Create an image element for a rasterised slide"""
+        width, height = size
+        element = {
+            "params": {
+                "contentName": "Image",
+                "file": {
+                    "path": image_path,
+                    "mime": IMAGE_FORMATS[self.slide_format][1],
+                    "copyright": {"license": "U"},
+                    "width": width,
+                    "height": height
+                },
+                "decorative": False,
+                "alt": f"Slide {slide_num}"
+            },
+            "library": "H5P.Image 1.1",
+            "metadata": {
+                "contentType": "Image",
+                "license": "U",
+                "title": "Untitled Image",
+                "authors": [],
+                "changes": [],
+                "extraTitle": "Untitled Image"
+            },
+            "subContentId": str(uuid.uuid4())
+        }
+        
+        return element
+    
+    def slide_image_size(self, slide_num: int, image: Union[Path, BytesSource]) -> Tuple[int, int]:
+        """Return the (width, height) of a slide image, reading its header if needed"""
+        if slide_num not in self.image_sizes:
+            from PIL import Image
+            
+            source = image if isinstance(image, Path) else io.BytesIO(image.data)
+            with Image.open(source) as img:
+                self.image_sizes[slide_num] = img.size
+        return self.image_sizes[slide_num]
+    
     def create_audio_element(self, audio_path: str) -> Dict:
         """Create an audio element for the slide"""
         element = {
@@ -219,7 +524,7 @@ class H5PSlideDeckGenerator:
                 "audioNotSupported": "Your browser does not support this audio",
                 "files": [{
                     "path": audio_path,
-                    "mime": "audio/mpeg",
+                    "mime": audio_mime_type(audio_path),
                     "copyright": {"license": "U"}
                 }]
             },
@@ -238,14 +543,22 @@ class H5PSlideDeckGenerator:
         return element
     
     def create_slide(self, slide_num: int, pdf_path: str, audio_path: Optional[str], 
-                    notes_text: str = "") -> Dict:
-        """Create a slide object for the SlideDeck presentation"""
+                    notes_html: str = "", image_size: Optional[Tuple[int, int]] = None) -> Dict:
+        """Create a slide object for the SlideDeck presentation
+        
+        ``pdf_path`` is the slide's image when ``image_size`` is given.
+        ``notes_html`` is the slide's notes as HTML paragraphs and lists.
+        """
         
         # Create the slide params content
+        if image_size is not None:
+            visual = self.create_image_element(pdf_path, slide_num, image_size)
+        else:
+            visual = self.create_pdf_element(pdf_path)
         slide_params = {
-            "image": self.create_pdf_element(pdf_path),
+            "image": visual,
             "title": f"Slide {slide_num}",
-            "notes": f"<p>{notes_text}</p>" if notes_text else ""
+            "notes": notes_html
         }
         
         # Add audio element if available
@@ -274,15 +587,185 @@ class H5PSlideDeckGenerator:
         content = {
             "slides": slides_data,
             "behaviour": {
-                "autoPlay": False,
+                "autoPlay": self.autoplay,
                 "loopSlides": False
             }
         }
         
         return content
     
-    def build_h5p_package(self, output_filename: str, slide_notes: Dict[int, str]) -> bool:
-        """Build the H5P package with all slides and content"""
+    def package_libraries(self, template_cache: TemplateCache, content: Dict,
+                          h5p_data: Dict) -> List[str]:
+        """Resolve the libraries ``content`` needs and list them in ``h5p_data``
+
+        Returns the libraries to splice into the package: the closure of
+        the preloaded and editor dependencies. ``h5p.json`` lists the
+        preloaded ones, which the player loads. Dependencies that are not
+        in the template are left to the LMS.
+        """
+        libraries, missing = template_cache.resolve(content, h5p_data['mainLibrary'])
+        preloaded, _ = template_cache.resolve(content, h5p_data['mainLibrary'], editor=False)
+        h5p_data['preloadedDependencies'] = [
+            {key: template_cache.libraries[name][key]
+             for key in ('machineName', 'majorVersion', 'minorVersion')}
+            for name in preloaded
+        ]
+        if self.verbose:
+            skipped = len(template_cache.libraries) - len(libraries)
+            click.echo(f"Libraries: {', '.join(libraries)} ({skipped} unused skipped)")
+            if missing:
+                click.echo(f"Libraries expected on the LMS: {', '.join(sorted(missing))}")
+        return libraries
+    
+    def plan_build(self, pdf_path: Path, pptx_path: Optional[Path] = None,
+                   notes_path: Optional[Path] = None, to_disk: Optional[bool] = None) -> Dict:
+        """Dry run: check the inputs and estimate the build without doing it
+        
+        Only the PDF trailer and page tree, the ZIP central directory and
+        relationship parts of the PPTX and, when audio is re-encoded, the
+        headers of the clips are read. Without a PPTX the audio in ``VO/``
+        is counted. ``to_disk`` is as for ``extract_audio_from_pptx``.
+        
+        Returns the slide count, audio coverage, predicted package bytes and
+        build seconds per phase, plus ``errors`` that would fail the build
+        and ``warnings`` (such as slides without audio).
+        """
+        started = time.perf_counter()
+        errors, warnings = [], []
+        
+        try:
+            pages, page_size = pdf_page_info(Path(pdf_path))
+            if not pages:
+                errors.append("PDF has no pages")
+        except Exception as e:
+            pages, page_size = 0, (0.0, 0.0)
+            errors.append(f"Cannot read PDF: {e}")
+        
+        audio: Dict[int, Union[Path, ZipMember]] = {}
+        pptx_slides = None
+        if pptx_path:
+            try:
+                media = PptxMedia(pptx_path).read(notes=False)
+                audio, pptx_slides = dict(media.audio), media.slide_count
+            except Exception as e:
+                errors.append(f"Cannot read PPTX: {e}")
+            if pptx_slides is not None and pages and pptx_slides != pages:
+                warnings.append(f"PPTX has {pptx_slides} slides but the PDF has {pages} pages")
+        else:
+            audio = {slide_num: self.vo_audio_file(slide_num) for slide_num in range(1, pages + 1)}
+            audio = {slide_num: path for slide_num, path in audio.items() if path is not None}
+        
+        notes_bytes, notes_error = 0, None
+        if notes_path:
+            notes_error = check_notes_document(Path(notes_path))
+            if notes_error:
+                errors.append(notes_error)
+            else:
+                notes_bytes = os.path.getsize(notes_path)
+        
+        # Audio the build would package, and the slides that would have none
+        extra = sorted(slide_num for slide_num in audio if slide_num > pages)
+        audio = {slide_num: source for slide_num, source in audio.items() if slide_num <= pages}
+        missing = [slide_num for slide_num in range(1, pages + 1) if slide_num not in audio]
+        if missing:
+            warnings.append(f"No audio for slides {slide_ranges(missing)}")
+        if extra:
+            warnings.append(f"Audio of slides {slide_ranges(extra)} has no PDF page and is ignored")
+        
+        def size(source) -> int:
+            return source.file_size if isinstance(source, ZipMember) else source.stat().st_size
+        
+        clips = {str(source): source for source in audio.values()}
+        source_bytes = sum(size(source) for source in clips.values())
+        audio_bytes, audio_seconds = source_bytes, 0.0
+        profile = AUDIO_PROFILES[self.audio_profile]
+        if profile is not None and clips:
+            # Encoded size from each clip's length at the profile's bitrate
+            durations = self.measure_audio_durations(dict(enumerate(clips.values())))
+            audio_seconds = sum(seconds or 0.0 for seconds in durations.values())
+            audio_bytes = sum(min(size(source), int(seconds * profile[3] * 1000 / 8))
+                              if seconds else size(source)
+                              for source, seconds in zip(clips.values(), durations.values()))
+        
+        if self.slide_format in IMAGE_FORMATS:
+            slide_bytes = int(pages * image_megapixels(page_size, self.dpi) * 1e6
+                              * IMAGE_BYTES_PER_PIXEL[self.slide_format])
+        else:
+            # Resources shared by several pages are copied into each slide, so
+            # decks with many shared images or fonts come out larger
+            slide_bytes = os.path.getsize(pdf_path) if pages else 0
+        
+        libraries = None
+        if not self.all_libraries and self.template_dir.exists():
+            sample = self.generate_content_json([self.create_slide(
+                slide_num=1, pdf_path='content/slide.pdf', audio_path='content/audio.mp3',
+                notes_html='', image_size=(1, 1) if self.slide_format in IMAGE_FORMATS else None)])
+            main = json.loads((self.template_dir / 'h5p.json').read_text(encoding='utf-8'))['mainLibrary']
+            index = read_library_index(self.template_dir)
+            libraries, _ = resolve_libraries(index, [main_library(index, main)]
+                                             + sorted(content_libraries(sample)))
+        template_bytes = (library_bytes(self.template_dir, self.template_cache_dir, self.compression,
+                                        libraries) if self.template_dir.exists() else 0)
+        
+        package_bytes = {
+            'slides': slide_bytes,
+            'audio': audio_bytes,
+            'libraries': template_bytes,
+            'content': pages * CONTENT_BYTES_PER_SLIDE,
+        }
+        package_bytes['total'] = sum(package_bytes.values())
+        
+        extract_bytes = source_bytes if pptx_path and (not self.in_memory if to_disk is None else to_disk) else 0
+        return {
+            'ok': not errors,
+            'errors': errors,
+            'warnings': warnings,
+            'slides': pages,
+            'pptx_slides': pptx_slides,
+            'audio': {
+                'slides': len(audio),
+                'coverage': round(len(audio) / pages, 3) if pages else 0.0,
+                'missing': missing,
+                'extra': extra,
+                'clips': len(clips),
+            },
+            'notes': bool(notes_path) and notes_error is None,
+            'package_bytes': package_bytes,
+            'build_seconds': estimate_seconds(pages, page_size, self.slide_format, self.dpi, self.workers,
+                                              extract_bytes, notes_bytes, audio_seconds,
+                                              package_bytes['total']),
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+    
+    def print_plan(self, plan: Dict) -> None:
+        """Print a dry-run plan from ``plan_build``"""
+        for error in plan['errors']:
+            click.echo(click.style(f"Error: {error}", fg='red'))
+        for warning in plan['warnings']:
+            click.echo(click.style(f"Warning: {warning}", fg='yellow'))
+        audio = plan['audio']
+        click.echo(f"Slides: {plan['slides']}")
+        click.echo(f"Audio: {audio['slides']} of {plan['slides']} slides ({audio['coverage']:.0%}), "
+                   f"{audio['clips']} clips")
+        sizes = plan['package_bytes']
+        click.echo(f"Predicted package size: {sizes['total'] / (1024 * 1024):.2f} MB "
+                   f"(slides {sizes['slides'] / (1024 * 1024):.2f}, audio {sizes['audio'] / (1024 * 1024):.2f}, "
+                   f"libraries {sizes['libraries'] / (1024 * 1024):.2f})")
+        seconds = plan['build_seconds']
+        phases = ', '.join(f"{phase} {value:.2f}s" for phase, value in seconds.items() if phase != 'total')
+        click.echo(f"Estimated build time: {seconds['total']:.1f}s ({phases})")
+        if self.verbose:
+            click.echo(f"Planned in {plan['seconds'] * 1000:.0f} ms")
+    
+    @timed_phase('package')
+    def build_h5p_package(self, output_filename: str, slide_notes: Dict[int, str],
+                          destination=None) -> bool:
+        """Build the H5P package with all slides and content
+        
+        The package is streamed straight into ``destination`` (a path or any
+        writable file-like object). Without a destination it is written to
+        ``output_filename`` relative to the project root.
+        """
         try:
             # Debug: Print template directory path
             click.echo(f"Template directory: {self.template_dir}")
@@ -293,33 +776,12 @@ class H5PSlideDeckGenerator:
                 click.echo(click.style(f"Error: Template directory not found: {self.template_dir}", fg='red'))
                 return False
             
-            # Create temporary directory for building
-            self.temp_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Copy entire template directory structure
-            click.echo("Copying SlideDeck template files...")
-            
-            # Copy all template files and directories
-            for item in self.template_dir.iterdir():
-                if item.is_file():
-                    # Copy files in root (like h5p.json)
-                    shutil.copy2(str(item), str(self.temp_dir / item.name))
-                elif item.is_dir() and item.name != 'content':
-                    # Copy library directories (H5P.*, H5PEditor.*, FontAwesome-4.5)
-                    dest_dir = self.temp_dir / item.name
-                    if dest_dir.exists():
-                        shutil.rmtree(str(dest_dir))
-                    shutil.copytree(str(item), str(dest_dir))
-            
-            # Create content directory structure
-            content_dir = self.temp_dir / 'content'
-            content_dir.mkdir(exist_ok=True)
-            
-            # Create subdirectories for files and audios
-            files_dir = content_dir / 'files'
-            files_dir.mkdir(exist_ok=True)
-            audios_dir = content_dir / 'audios'
-            audios_dir.mkdir(exist_ok=True)
+            # Load the pre-compressed library entries (built once per template hash)
+            template_cache = TemplateCache.get(self.template_dir, self.template_cache_dir,
+                                             self.compression)
+            if self.verbose:
+                click.echo(f"Template cache: {template_cache.archive_path.name} "
+                           f"({len(template_cache.entries)} library files)")
             
             # Get all slides
             slides = self.get_slide_files()
@@ -328,81 +790,125 @@ class H5PSlideDeckGenerator:
                 return False
             
             click.echo(f"Found {len(slides)} slides")
-            
-            # Create slides data
-            slides_data = []
-            
-            # Process each slide
-            for slide_num, pdf_path, audio_path in tqdm(slides, desc="Processing slides"):
-                # Generate unique filenames
-                pdf_filename = f"pdf-{self.generate_unique_filename('pdf')}.pdf"
-                audio_filename = f"audio-{self.generate_unique_filename('audio')}.mp3" if audio_path else None
-                
-                # Copy PDF file to content/files
-                shutil.copy2(pdf_path, files_dir / pdf_filename)
-                
-                # Copy audio file if exists
-                if audio_path:
-                    shutil.copy2(audio_path, audios_dir / audio_filename)
-                
-                # Get notes for this slide
-                notes_text = slide_notes.get(slide_num, "")
-                
-                # Create slide object with relative paths
-                slide = self.create_slide(
-                    slide_num=slide_num,
-                    pdf_path=f"files/{pdf_filename}",
-                    audio_path=f"audios/{audio_filename}" if audio_filename else None,
-                    notes_text=notes_text
-                )
-                
-                slides_data.append(slide)
-            
-            # Generate content.json
-            content_data = self.generate_content_json(slides_data)
-            
-            # Save content.json
-            content_path = content_dir / 'content.json'
-            with open(content_path, 'w', encoding='utf-8') as f:
-                json.dump(content_data, f, indent=2)
+            self.slide_count = len(slides)
             
             # Update h5p.json with project title
-            h5p_json_path = self.temp_dir / 'h5p.json'
-            if h5p_json_path.exists():
-                with open(h5p_json_path, 'r', encoding='utf-8') as f:
-                    h5p_data = json.load(f)
-                
-                # Update title if project_title is set
-                if hasattr(self, 'project_title') and self.project_title:
-                    h5p_data['title'] = self.project_title
-                    h5p_data['extraTitle'] = self.project_title
-                else:
-                    h5p_data['title'] = self.project_name
-                    h5p_data['extraTitle'] = self.project_name
-                
-                with open(h5p_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(h5p_data, f, separators=(',', ':'))
+            with open(self.template_dir / 'h5p.json', 'r', encoding='utf-8') as f:
+                h5p_data = json.load(f)
+            
+            if hasattr(self, 'project_title') and self.project_title:
+                h5p_data['title'] = self.project_title
+                h5p_data['extraTitle'] = self.project_title
+            else:
+                h5p_data['title'] = self.project_name
+                h5p_data['extraTitle'] = self.project_name
             
             # Create H5P package
             click.echo(f"Creating H5P SlideDeck package: {output_filename}")
-            self.output_path = self.project_root / output_filename
+            if destination is None:
+                self.output_path = self.project_root / output_filename
+                destination = self.output_path
+            elif isinstance(destination, (str, Path)):
+                self.output_path = Path(destination)
+                destination = self.output_path
+            else:
+                self.output_path = None
+            
+            # Incremental builds reuse media entries of the last package
+            previous_path = None
+            if self.manifest is not None and self.output_path:
+                previous_path = self.manifest.previous_package(self.output_path)
+                if previous_path:
+                    previous_path = self.output_path.with_name(self.output_path.name + '.prev')
+                    os.replace(self.output_path, previous_path)
+            previous = RawArchive(previous_path) if previous_path else None
+            rebuilt_slides = 0
             
-            with zip.ZipFile(self.output_path, 'w', zip.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(self.temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, self.temp_dir)
-                        zipf.write(file_path, arcname)
+            from tqdm import tqdm
+            
+            try:
+                # Encode the audio that cannot be copied from the previous package
+                sources = {slide_num: audio_path for slide_num, _, audio_path in slides
+                           if audio_path and not (previous is not None
+                                                  and self.audio_reusable(slide_num, audio_path))}
+                self.packaged_audio = self.transcode_slide_audio(sources)
+                # Transcoding keeps the length, so the sources are measured
+                self.audio_durations = self.measure_audio_durations(
+                    {slide_num: audio_path for slide_num, _, audio_path in slides if audio_path})
+                
+                with H5PPackageWriter(destination, self.compression) as writer:
+                    # Create slides data
+                    slides_data = []
+                    
+                    # Process each slide, streaming its media into content/
+                    self.progress('package', 0, len(slides))
+                    for done, (slide_num, pdf_path, audio_path) in enumerate(
+                            tqdm(slides, desc="Processing slides"), 1):
+                        # Media is named by content hash; repeated files are stored once
+                        pdf_file, audio_file, rebuilt = self.add_slide_media(
+                            writer, previous, slide_num, pdf_path, audio_path)
+                        
+                        # Get notes for this slide
+                        notes_html = slide_notes.get(slide_num, "")
+                        if self.manifest is not None:
+                            notes_fingerprint = text_fingerprint(notes_html)
+                            rebuilt = rebuilt or self.manifest.changed(slide_num, 'notes', notes_fingerprint)
+                            self.manifest.slide(slide_num)['notes'] = notes_fingerprint
+                        rebuilt_slides += rebuilt
+                        
+                        # Create slide object with relative paths
+                        slide = self.create_slide(
+                            slide_num=slide_num,
+                            pdf_path=pdf_file,
+                            audio_path=audio_file,
+                            notes_html=notes_html,
+                            image_size=(self.slide_image_size(slide_num, pdf_path)
+                                        if self.slide_format in IMAGE_FORMATS else None)
+                        )
+                        
+                        slides_data.append(slide)
+                        self.progress('package', done, len(slides))
+                    
+                    # Generate content.json
+                    content_data = self.generate_content_json(slides_data)
+                    writer.add_json('content/content.json', content_data, indent=2)
+                    
+                    # Splice the cached library entries without recompressing them
+                    libraries = None
+                    if not self.all_libraries:
+                        libraries = self.package_libraries(template_cache, content_data, h5p_data)
+                    writer.add_json('h5p.json', h5p_data, separators=(',', ':'))
+                    writer.add_template(template_cache, libraries)
+            except Exception:
+                # Never leave a truncated package behind
+                if self.output_path and self.output_path.exists():
+                    self.output_path.unlink()
+                if previous_path:
+                    previous.close()
+                    os.replace(previous_path, self.output_path)
+                raise
             
-            # Clean up temporary directory
-            shutil.rmtree(self.temp_dir)
+            if previous_path:
+                previous.close()
+                previous_path.unlink()
+            if self.manifest is not None and self.output_path:
+                self.manifest.truncate(len(slides))
+                self.manifest.record_package(self.output_path)
+                self.manifest.save()
             
             # Print success message with package details
-            file_size = self.output_path.stat().st_size / (1024 * 1024)  # Convert to MB
             click.echo(click.style(f"✓ H5P SlideDeck package created successfully: {output_filename}", fg='green'))
             click.echo(f"  Total slides: {len(slides)}")
-            click.echo(f"  File size: {file_size:.2f} MB")
+            if self.manifest is not None:
+                click.echo(f"  Changed slides: {rebuilt_slides}")
+            if writer.dedup_count:
+                saved = writer.dedup_bytes / (1024 * 1024)
+                click.echo(f"  Deduplicated media: {writer.dedup_count} files, {saved:.2f} MB saved")
+            if self.output_path:
+                file_size = self.output_path.stat().st_size / (1024 * 1024)  # Convert to MB
+                click.echo(f"  File size: {file_size:.2f} MB")
             click.echo(f"  Format: SlideDeck")
+            self.print_duration_report()
             
             return True
             
@@ -410,58 +916,60 @@ class H5PSlideDeckGenerator:
             click.echo(click.style(f"Error building H5P package: {e}", fg='red'))
             return False
 
-    def extract_audio_from_pptx(self, pptx_path: Path) -> Tuple[bool, Dict[int, str]]:
-        """Extract audio files and notes from PPTX presentation"""
-        slide_notes = {}
+    @timed_phase('extract')
+    def extract_audio_from_pptx(self, pptx_path: Path,
+                                to_disk: Optional[bool] = None) -> Tuple[bool, Dict[int, str]]:
+        """Extract audio files and notes from PPTX presentation
+        
+        Notes are returned as HTML, one paragraph per line of the notes
+        slide. The PPTX is opened once; only its notes parts and audio entries are
+        read. Audio is streamed in chunks to ``VO/``, or with ``to_disk=False``
+        left in the PPTX and streamed straight into the package at build time.
+        ``to_disk`` defaults to False for in-memory builds and True otherwise.
+        """
+        if to_disk is None:
+            to_disk = not self.in_memory
         try:
-            # Create VO directory if it doesn't exist
-            self.vo_dir.mkdir(parents=True, exist_ok=True)
+            media = PptxMedia(pptx_path).read()
+            slide_notes = {slide_num: text_to_html(text) for slide_num, text in media.slide_notes.items()}
             
-            # Open the PPTX file
-            prs = Presentation(pptx_path)
+            if not media.media_count:
+                click.echo(click.style("Warning: No media files found in PPTX", fg='yellow'))
+            else:
+                click.echo(f"Found {media.media_count} media files in PPTX")
             
-            # Extract notes from each slide
-            for idx, slide in enumerate(prs.slides, 1):
-                if slide.has_notes_slide:
-                    notes_slide = slide.notes_slide
-                    notes_text = ""
-                    for shape in notes_slide.shapes:
-                        if hasattr(shape, "text"):
-                            notes_text += shape.text + "\n"
-                    if notes_text.strip():
-                        slide_notes[idx] = notes_text.strip()
+            if to_disk:
+                # Create VO directory if it doesn't exist
+                self.vo_dir.mkdir(parents=True, exist_ok=True)
+                self.progress('extract', 0, len(media.audio))
+                for done, (slide_num, member) in enumerate(sorted(media.audio.items()), 1):
+                    self.progress('extract', done - 1, len(media.audio))
+                    # Keep the clip's own format; renaming WAV or M4A to .mp3 mislabels it
+                    output_path = self.vo_dir / f"media_{slide_num}{member.suffix}"
+                    for extension in AUDIO_EXTENSIONS:
+                        stale = output_path.with_suffix(extension)
+                        if extension != member.suffix and stale.exists():
+                            stale.unlink()
+                    if (self.manifest is not None and output_path.exists()
+                            and not self.manifest.changed(slide_num, 'pptx_audio', member.fingerprint)):
+                        continue
+                    # Copy to VO directory with standardized name
+                    member.copy_to(output_path)
+                    if self.manifest is not None:
+                        self.manifest.slide(slide_num)['pptx_audio'] = member.fingerprint
+                    if self.verbose:
+                        click.echo(f"Extracted audio for slide {slide_num}")
+                self.pptx_audio = {}
+                self.progress('extract', len(media.audio), len(media.audio))
+            else:
+                self.pptx_audio = dict(media.audio)
+                self.progress('extract', len(media.audio), len(media.audio))
+                if self.verbose:
+                    click.echo(f"Indexed audio for {len(media.audio)} slides")
             
-            # Open the PPTX file as a ZIP archive for audio extraction
-            with zip.ZipFile(pptx_path, 'r') as pptx_zip:
-                # Get all media files
-                media_files = [f for f in pptx_zip.namelist() if f.startswith('ppt/media/')]
-                
-                if not media_files:
-                    click.echo(click.style("Warning: No media files found in PPTX", fg='yellow'))
-                else:
-                    click.echo(f"Found {len(media_files)} media files in PPTX")
-                    
-                    # Extract and process each media file
-                    for media_file in media_files:
-                        # Extract the file to a temporary location
-                        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                            temp_file.write(pptx_zip.read(media_file))
-                            temp_path = temp_file.name
-                        
-                        # Check if it's an audio file
-                        if media_file.lower().endswith(('.mp3', '.wav', '.m4a')):
-                            # Get slide number from filename (assuming format like media1.mp3)
-                            match = re.search(r'media(\d+)', media_file)
-                            if match:
-                                slide_num = int(match.group(1))
-                                # Copy to VO directory with standardized name
-                                output_path = self.vo_dir / f"media_{slide_num}.mp3"
-                                shutil.copy2(temp_path, output_path)
-                                if self.verbose:
-                                    click.echo(f"Extracted audio for slide {slide_num}")
-                        
-                        # Clean up temporary file
-                        os.unlink(temp_path)
+            if media.shared_audio and self.verbose:
+                for name, slide_nums in media.shared_audio.items():
+                    click.echo(f"Audio {name} is shared by slides {', '.join(map(str, slide_nums))}")
             
             if slide_notes:
                 click.echo(f"Extracted notes from {len(slide_notes)} slides")
@@ -481,13 +989,61 @@ class H5PSlideDeckGenerator:
 @click.command()
 @click.option('--project', '-p', help='Project name (overrides config.py)')
 @click.option('--output', '-o', default=None, help='Output filename (default: PROJECT_NAME_SlideDeck.h5p)')
+@click.option('--pdf', '-f', help='Path to source PDF (default: 00_Output/<project>/<project>.pdf)')
 @click.option('--pptx', '-x', help='Path to PPTX file containing audio and notes')
+@click.option('--notes', '-n', help='Notes DOCX with a "Slide N" heading per slide '
+                                    '(default: 00_Output/<project>/<project>_NOTES.docx, if present)')
+@click.option('--compression', '-c', type=click.Choice(list(COMPRESSION_PROFILES)),
+              default=DEFAULT_COMPRESSION_PROFILE, show_default=True,
+              help='Package compression profile (speed or size trade-off)')
+@click.option('--workers', '-w', type=click.IntRange(min=0), default=1, show_default=True,
+              help='Worker processes for PDF splitting (0 = one per CPU)')
+@click.option('--prune-resources', is_flag=True,
+              help='Drop fonts and images a slide does not use from its PDF')
+@click.option('--incremental', '-i', is_flag=True,
+              help='Only rebuild slides whose page, audio or notes changed since the last build')
+@click.option('--slide-format', '-s', type=click.Choice(SLIDE_FORMATS), default='pdf', show_default=True,
+              help='Show slides as PDFs or as rasterised images (needs PyMuPDF)')
+@click.option('--dpi', type=click.IntRange(min=36, max=600), default=DEFAULT_DPI, show_default=True,
+              help='Resolution of rasterised slide images')
+@click.option('--audio-profile', '-a', type=click.Choice(list(AUDIO_PROFILES)),
+              default=DEFAULT_AUDIO_PROFILE, show_default=True,
+              help='Re-encode narration audio (needs ffmpeg), or keep the original clips')
+@click.option('--all-libraries', is_flag=True,
+              help='Package every template library, not only the ones the content needs')
+@click.option('--autoplay', is_flag=True,
+              help="Play each slide's narration as soon as the slide is shown")
+@click.option('--memory-budget', type=click.IntRange(min=0), default=0, show_default=True,
+              help='Keep the resident memory of the build under this many MB where possible (0: no limit)')
+@click.option('--dry-run', is_flag=True,
+              help='Check the inputs and estimate the package size and build time without building')
 @click.option('--verbose', '-v', is_flag=True, help='Enable verbose output')
-def main(project, output, pptx, verbose):
+def main(project, output, pdf, pptx, notes, compression, workers, prune_resources, incremental,
+         slide_format, dpi, audio_profile, all_libraries, autoplay, memory_budget, dry_run, verbose):
     """Generate H5P SlideDeck presentation from PDF and audio files"""
     
+    # The default project's folders are created on demand, not on import of config
+    if not project:
+        create_directories()
+    
     # Initialize generator
-    generator = H5PSlideDeckGenerator(project_name=project, verbose=verbose)
+    generator = H5PSlideDeckGenerator(project_name=project, verbose=verbose,
+                                      compression=compression, workers=workers,
+                                      prune_resources=prune_resources, incremental=incremental,
+                                      slide_format=slide_format, dpi=dpi,
+                                      audio_profile=audio_profile, all_libraries=all_libraries,
+                                      autoplay=autoplay, memory_budget=memory_budget)
+    generator.source_pdf = Path(pdf) if pdf else generator.output_dir / f"{generator.project_name}.pdf"
+    
+    if dry_run:
+        for path, kind in ((generator.source_pdf, 'Source PDF'), (pptx, 'PPTX file'), (notes, 'Notes document')):
+            if path and not Path(path).exists():
+                click.echo(click.style(f"Error: {kind} not found: {path}", fg='red'))
+                return
+        notes_path = Path(notes) if notes else generator.notes_docx
+        generator.print_plan(generator.plan_build(generator.source_pdf, Path(pptx) if pptx else None,
+                                                  notes_path if notes_path.exists() else None))
+        return
     
     # Extract audio and notes from PPTX if provided
     slide_notes = {}
@@ -500,16 +1056,34 @@ def main(project, output, pptx, verbose):
         if not extracted:
             return
     
+    # Notes from the Word document replace the PPTX notes of the same slides
+    if notes and not Path(notes).exists():
+        click.echo(click.style(f"Error: Notes document not found: {notes}", fg='red'))
+        return
+    document_notes = generator.parse_notes_document(Path(notes) if notes else None)
+    if document_notes is None:
+        return
+    slide_notes = {**slide_notes, **document_notes}
+    
     # Validate directories
     if not generator.validate_directories():
         return
     
+    # Split the source PDF into per-slide PDFs
+    if not generator.split_pdf_into_slides():
+        return
+    
     # Set output filename
     if not output:
         output = f"{generator.project_name}_SlideDeck.h5p"
     
     # Build the package
     generator.build_h5p_package(output, slide_notes)
+    
+    if verbose:
+        timings = ', '.join(f"{phase} {seconds:.2f}s" for phase, seconds in generator.timings.items())
+        click.echo(f"Phase timings: {timings}")
+    generator.print_memory_report()
 
 
 if __name__ == '__main__':
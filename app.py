@@ -1,10 +1,17 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, after_this_request
+from flask import Flask, Response, render_template, request, jsonify, send_file, redirect, url_for
 import os
 from werkzeug.utils import secure_filename
 from SD_Generator import H5PSlideDeckGenerator
-import tempfile
+from build_jobs import BuildJob, JobQueue, Sweeper, DONE, PHASES
+from build_metrics import BuildMetrics, log_build
+from h5p_package import hash_source
+from result_cache import ResultCache, build_key
+from chunked_upload import UploadError, UploadStore
+import re
+import time
 import uuid
 import shutil
+import tempfile
 from pathlib import Path
 import logging
 
@@ -14,25 +21,217 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Jobs, uploads and metrics live in this process, so a second worker process
+# would answer for jobs it never saw; see gunicorn.conf.py
+if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+    raise RuntimeError('The app keeps build jobs in its process and must run as a single '
+                       'worker process; use threads (gunicorn --threads) instead of WEB_CONCURRENCY')
+
 # Configure upload folder
 UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max request size (multipart upload or chunk)
+# Files sent through the chunked upload API may be larger than one request
+app.config['MAX_UPLOAD_MB'] = int(os.environ.get('MAX_UPLOAD_MB', 1024))
+app.config['UPLOAD_CHUNK_MB'] = int(os.environ.get('UPLOAD_CHUNK_MB', 8))
+# Seconds an unfinished chunked upload is kept after its last chunk
+app.config['UPLOAD_TTL'] = int(os.environ.get('UPLOAD_TTL', 24 * 3600))
+# Worker processes for PDF splitting; uploads may ask for fewer, never more
+app.config['SPLIT_WORKERS'] = int(os.environ.get('SPLIT_WORKERS', os.cpu_count() or 1))
+# Strip resources a slide does not use from each per-slide PDF
+app.config['PRUNE_RESOURCES'] = os.environ.get('PRUNE_RESOURCES', '1') != '0'
+# Builds running at once; further uploads wait in the queue
+app.config['BUILD_WORKERS'] = int(os.environ.get('BUILD_WORKERS', 2))
+# Seconds a finished job and its package are kept after the build or the last download
+app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 3600))
+# Seconds between retention sweeps of expired jobs, packages and uploads; 0 disables them
+app.config['SWEEP_INTERVAL'] = int(os.environ.get('SWEEP_INTERVAL', 300))
+# Let the front proxy send packages: '', 'X-Sendfile' (Apache, lighttpd) or
+# 'X-Accel-Redirect' (nginx, with UPLOAD_FOLDER mapped to an internal location)
+app.config['SENDFILE_HEADER'] = os.environ.get('SENDFILE_HEADER', '')
+app.config['ACCEL_REDIRECT_PREFIX'] = os.environ.get('ACCEL_REDIRECT_PREFIX', '/protected')
+app.config['USE_X_SENDFILE'] = app.config['SENDFILE_HEADER'] == 'X-Sendfile'
+# Keep slide PDFs in memory instead of the job workspace
+app.config['BUILD_IN_MEMORY'] = os.environ.get('BUILD_IN_MEMORY', '0') == '1'
+# Slide visuals: 'pdf', or 'webp'/'png' images rasterised at SLIDE_DPI (needs PyMuPDF)
+app.config['SLIDE_FORMAT'] = os.environ.get('SLIDE_FORMAT', 'pdf')
+app.config['SLIDE_DPI'] = int(os.environ.get('SLIDE_DPI', 150))
+# Narration audio profile, e.g. 'speech' for mono 64 kbps MP3 (needs ffmpeg)
+app.config['AUDIO_PROFILE'] = os.environ.get('AUDIO_PROFILE', 'original')
+# Play each slide's narration as soon as the slide is shown
+app.config['AUTOPLAY'] = os.environ.get('AUTOPLAY', '0') == '1'
+# Resident memory (MB) a build tries to stay under; 0 disables the limit.
+# The limit is checked against the whole process, builds running in parallel included
+app.config['MEMORY_BUDGET_MB'] = int(os.environ.get('MEMORY_BUDGET_MB', 0))
+# Log every finished build as one JSON line (phase timings, sizes, status)
+app.config['BUILD_LOG_JSON'] = os.environ.get('BUILD_LOG_JSON', '0') == '1'
+# Finished packages kept for identical re-uploads; 0 MB disables the cache
+app.config['RESULT_CACHE_DIR'] = os.environ.get('RESULT_CACHE_DIR', os.path.join(UPLOAD_FOLDER, 'cache'))
+app.config['RESULT_CACHE_MB'] = int(os.environ.get('RESULT_CACHE_MB', 2048))
+
+metrics = BuildMetrics()
+result_cache = ResultCache(app.config['RESULT_CACHE_DIR'], app.config['RESULT_CACHE_MB'] * 1024 * 1024)
+upload_store = UploadStore(os.path.join(UPLOAD_FOLDER, 'partial'), app.config['MAX_UPLOAD_MB'] * 1024 * 1024,
+                           ttl=app.config['UPLOAD_TTL'])
+
 
-ALLOWED_EXTENSIONS = {'pptx', 'pdf'}
+def finish_build(job):
+    """Record a finished build job in the metrics and, if enabled, the build log"""
+    package_bytes = job.output_path.stat().st_size if job.output_path and job.output_path.exists() else 0
+    metrics.record(job.status, job.timings, upload_bytes=job.upload_bytes,
+                   package_bytes=package_bytes, slides=job.slides if job.status == DONE else 0,
+                   failed_phase=job.failed_phase(), cache_hit=job.cache_hit, peak_rss=job.peak_rss,
+                   reader_reopens=job.reader_reopens)
+    if app.config['BUILD_LOG_JSON']:
+        log_build({
+            'event': 'build',
+            'job_id': job.id,
+            'project': job.project_name,
+            'status': job.status,
+            'cached': job.cache_hit,
+            'error': job.error,
+            'failed_phase': job.failed_phase(),
+            'seconds': round(job.finished - job.created, 3),
+            'timings': {phase: round(seconds, 3) for phase, seconds in job.timings.items()},
+            'upload_bytes': job.upload_bytes,
+            'package_bytes': package_bytes,
+            'slides': job.slides,
+            'narration_seconds': job.durations['total'] if job.durations else None,
+            'peak_rss_mb': job.to_dict()['peak_rss_mb'],
+            'reader_reopens': job.reader_reopens,
+        })
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+JOBS_FOLDER = os.path.join(UPLOAD_FOLDER, 'jobs')
+job_queue = JobQueue(max_workers=app.config['BUILD_WORKERS'], ttl=app.config['JOB_TTL'],
+                     on_finish=finish_build)
+
+ALLOWED_EXTENSIONS = {'pptx', 'pdf', 'docx'}
+
+def allowed_file(filename, extension):
+    """Whether ``filename`` has the extension its upload field expects (``pdf``, ``pptx`` or ``docx``)"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() == extension
 
 def get_project_name(filename):
     """Extract project name from filename without extension"""
     return os.path.splitext(filename)[0]
 
+def build_settings():
+    """Settings that change the package contents, part of the result cache key"""
+    return {key: app.config[key] for key in ('PRUNE_RESOURCES', 'SLIDE_FORMAT', 'SLIDE_DPI',
+                                             'AUDIO_PROFILE', 'AUTOPLAY')}
+
+def make_generator(project_name, split_workers, workspace, progress=None):
+    """Return a generator with the configured build settings"""
+    return H5PSlideDeckGenerator(project_name=project_name, workers=split_workers,
+                                 prune_resources=app.config['PRUNE_RESOURCES'],
+                                 progress=progress,
+                                 workspace=workspace,
+                                 in_memory=app.config['BUILD_IN_MEMORY'],
+                                 slide_format=app.config['SLIDE_FORMAT'],
+                                 dpi=app.config['SLIDE_DPI'],
+                                 audio_profile=app.config['AUDIO_PROFILE'],
+                                 autoplay=app.config['AUTOPLAY'],
+                                 memory_budget=app.config['MEMORY_BUDGET_MB'])
+
+def plan_files(project_name, split_workers, pdf_path, pptx_path, notes_path):
+    """Dry-run plan of a build of these files (see H5PSlideDeckGenerator.plan_build)"""
+    generator = make_generator(project_name, split_workers, Path(JOBS_FOLDER) / 'plan')
+    # Builds stream the audio from the PPTX rather than extracting it
+    return generator.plan_build(pdf_path, pptx_path, notes_path, to_disk=False)
+
+def run_build(job, pdf_path, pptx_path, notes_path, split_workers, digests=None):
+    """Run the whole pipeline for a queued job and return the package path
+
+    Notes from the notes document (``notes_path``) replace the PPTX notes
+    of the same slides.
+
+    An identical earlier build (same files, title and settings) is served
+    from the result cache without running the pipeline. ``digests`` are
+    the file hashes already computed by chunked uploads.
+    """
+    generator = None
+    output_filename = f"{job.project_name}.h5p"
+    target_path = job.workspace / output_filename
+    try:
+        cache_key = None
+        if result_cache.max_bytes > 0:
+            cache_key = build_key(pdf_path, pptx_path, job.project_title, build_settings(), digests,
+                                  notes_path=notes_path)
+            job.cache_hit = result_cache.copy_to(cache_key, target_path) is not None
+            if job.cache_hit:
+                for phase in PHASES:
+                    job.skip(phase)
+                job.package_sha256 = hash_source(target_path)[0]
+                return target_path
+
+        # Each job builds in its own workspace, so uploads with the same
+        # name never share intermediate files
+        generator = make_generator(job.project_name, split_workers, job.workspace / 'build',
+                                   progress=job.progress)
+        generator.project_title = job.project_title
+        generator.source_pdf = Path(pdf_path)
+
+        # Process files
+        if not generator.split_pdf_into_slides():
+            raise RuntimeError('Failed to process PDF')
+
+        # Extract audio and notes from PPTX if provided
+        slide_notes = {}
+        if pptx_path:
+            # Audio stays in the uploaded PPTX and is streamed into the package
+            success, slide_notes = generator.extract_audio_from_pptx(pptx_path, to_disk=False)
+            if not success:
+                raise RuntimeError('Failed to extract audio and notes from PPTX')
+        else:
+            job.skip('extract')
+
+        if notes_path:
+            document_notes = generator.parse_notes_document(notes_path)
+            if document_notes is None:
+                raise RuntimeError('Failed to parse notes document')
+            slide_notes = {**slide_notes, **document_notes}
+        else:
+            job.skip('notes')
+
+        # Generate the H5P package straight into the job workspace
+        if not generator.build_h5p_package(output_filename, slide_notes, destination=target_path):
+            raise RuntimeError('Failed to generate H5P package')
+
+        if cache_key is not None:
+            try:
+                result_cache.put(cache_key, target_path)
+            except OSError as e:
+                logger.warning(f"Could not cache package of job {job.id}: {e}")
+        job.package_sha256 = hash_source(target_path)[0]
+        return target_path
+    finally:
+        if generator is not None:
+            job.timings = dict(generator.timings)
+            job.slides = generator.slide_count
+            job.durations = generator.duration_report()
+            job.peak_rss = dict(generator.memory_monitor.peaks)
+            job.reader_reopens = generator.reader_reopens
+        shutil.rmtree(job.workspace / 'build', ignore_errors=True)
+        # The uploads are no longer needed once the package exists
+        for path in (pdf_path, pptx_path, notes_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+def get_split_workers(requested):
+    """Clamp the worker count requested by an upload to the configured maximum"""
+    max_workers = app.config['SPLIT_WORKERS']
+    try:
+        workers = int(requested)
+    except (TypeError, ValueError):
+        return max_workers
+    return max(1, min(workers, max_workers))
+
 def cleanup_project_files(project_name):
-    """Clean up all project-related files after download"""
+    """Clean up all project-related files of a package in the uploads folder"""
     try:
         # Remove H5P package from uploads folder
         h5p_file = os.path.join(app.config['UPLOAD_FOLDER'], f"{project_name}.h5p")
@@ -50,112 +249,281 @@ def cleanup_project_files(project_name):
     except Exception as e:
         logger.error(f"Error cleaning up files: {e}")
 
+def sweep_expired():
+    """Delete expired jobs, stale chunked uploads and old packages in the uploads folder"""
+    job_queue.expire()
+    upload_store.expire()
+    cutoff = time.time() - app.config['JOB_TTL']
+    for package in Path(app.config['UPLOAD_FOLDER']).glob('*.h5p'):
+        try:
+            expired = package.stat().st_mtime < cutoff
+        except FileNotFoundError:
+            continue
+        if expired:
+            cleanup_project_files(get_project_name(package.name))
+
+sweeper = Sweeper(sweep_expired, app.config['SWEEP_INTERVAL'])
+
+@app.before_request
+def start_sweeper():
+    """Start retention sweeps with the first request, so importing the app starts no threads"""
+    sweeper.start()
+
+def serve_package(path, etag=True):
+    """Send a package as an attachment
+
+    Range requests resume interrupted downloads, and If-None-Match or
+    If-Range requests are answered from ``etag``: the package hash, or
+    True for one derived from the file's size and modification time. With
+    SENDFILE_HEADER set, the front proxy sends the file instead.
+    """
+    path = Path(path)
+    if app.config['SENDFILE_HEADER'] != 'X-Accel-Redirect':
+        # Also covers X-Sendfile through USE_X_SENDFILE
+        return send_file(path, as_attachment=True, etag=etag, conditional=True)
+
+    # nginx serves the bytes, and the Range requests, from its internal location
+    if isinstance(etag, str) and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    relative = path.resolve().relative_to(Path(app.config['UPLOAD_FOLDER']).resolve())
+    response = Response(mimetype='application/zip')
+    response.headers['X-Accel-Redirect'] = f"{app.config['ACCEL_REDIRECT_PREFIX'].rstrip('/')}/{relative.as_posix()}"
+    response.headers.set('Content-Disposition', 'attachment', filename=path.name)
+    if isinstance(etag, str):
+        response.set_etag(etag)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Open a chunked upload for a file of the given name, kind and size"""
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename', ''))
+    kind = data.get('kind')
+    size = data.get('size')
+
+    if kind not in ALLOWED_EXTENSIONS or not filename.lower().endswith(f".{kind}"):
+        return jsonify({'error': 'Invalid file type'}), 400
+    if not isinstance(size, int):
+        return jsonify({'error': 'No file size provided'}), 400
+
+    try:
+        session = upload_store.create(filename, kind, size)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    return jsonify({'upload_id': session.id,
+                    'upload_url': url_for('upload_chunk', upload_id=session.id),
+                    'chunk_size': app.config['UPLOAD_CHUNK_MB'] * 1024 * 1024}), 201
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append one chunk, sent as the raw body with a Content-Range header"""
+    session = upload_store.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+
+    match = CONTENT_RANGE.fullmatch(request.headers.get('Content-Range', ''))
+    if not match:
+        return jsonify({'error': 'Content-Range header missing or invalid'}), 400
+    start, end, total = (int(value) for value in match.groups())
+    length = end - start + 1
+    if total != session.size or length <= 0 or request.content_length != length:
+        return jsonify({'error': 'Content-Range does not match the upload'}), 400
+
+    try:
+        session.write_chunk(start, request.stream, length)
+    except UploadError as e:
+        return jsonify({'error': str(e), 'offset': session.offset}), e.status
+    return jsonify(session.to_dict())
+
+@app.route('/uploads/<upload_id>')
+def upload_status(upload_id):
+    """Report the bytes received so far, so an interrupted upload can resume"""
+    session = upload_store.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    return jsonify(session.to_dict())
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'pdf' not in request.files:
+    """Queue a build
+
+    The PDF, PPTX and notes DOCX are sent either as multipart files
+    (``pdf``, ``pptx``, ``notes``) or as the ids of complete chunked uploads
+    (``pdf_upload``, ``pptx_upload``, ``notes_upload``).
+    """
+    pdf_upload = request.form.get('pdf_upload')
+    pptx_upload = request.form.get('pptx_upload')
+    notes_upload = request.form.get('notes_upload')
+    try:
+        pdf_session = upload_store.completed(pdf_upload, 'pdf') if pdf_upload else None
+        pptx_session = upload_store.completed(pptx_upload, 'pptx') if pptx_upload else None
+        notes_session = upload_store.completed(notes_upload, 'docx') if notes_upload else None
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    if pdf_session is None and 'pdf' not in request.files:
         return jsonify({'error': 'No PDF file provided'}), 400
     
-    pdf_file = request.files['pdf']
+    pdf_file = request.files.get('pdf')
     pptx_file = request.files.get('pptx')
+    notes_file = request.files.get('notes')
     project_title = request.form.get('title', '')
+    split_workers = get_split_workers(request.form.get('workers'))
+    pdf_filename = pdf_session.filename if pdf_session else pdf_file.filename
 
-    if pdf_file.filename == '':
+    if pdf_filename == '':
         return jsonify({'error': 'No selected PDF file'}), 400
     
-    if not allowed_file(pdf_file.filename):
+    if not allowed_file(pdf_filename, 'pdf'):
         return jsonify({'error': 'Invalid PDF file type'}), 400
     
-    if pptx_file and pptx_file.filename != '' and not allowed_file(pptx_file.filename):
+    if pptx_file and pptx_file.filename != '' and not allowed_file(pptx_file.filename, 'pptx'):
         return jsonify({'error': 'Invalid PPTX file type'}), 400
+    
+    if notes_file and notes_file.filename != '' and not allowed_file(notes_file.filename, 'docx'):
+        return jsonify({'error': 'Invalid notes file type'}), 400
+
+    # Get project name from PDF filename
+    project_name = get_project_name(pdf_filename)
+    if not project_title:
+        project_title = project_name
 
     try:
-        # Create a temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Save uploaded files
-            pdf_path = os.path.join(temp_dir, secure_filename(pdf_file.filename))
+        # Save uploaded files into the job's own workspace
+        job = BuildJob(project_name, project_title, JOBS_FOLDER)
+        job.workspace.mkdir(parents=True)
+        digests = {}
+        pdf_path = job.workspace / secure_filename(pdf_filename)
+        if pdf_session:
+            digests['pdf'] = upload_store.claim(pdf_upload, 'pdf', pdf_path)
+        else:
             pdf_file.save(pdf_path)
-            
-            pptx_path = None
-            if pptx_file and pptx_file.filename != '':
-                pptx_path = os.path.join(temp_dir, secure_filename(pptx_file.filename))
-                pptx_file.save(pptx_path)
-
-            # Get project name from PDF filename
-            project_name = get_project_name(pdf_file.filename)
-            if not project_title:
-                project_title = project_name
-
-            # Initialize generator
-            generator = H5PSlideDeckGenerator(project_name=project_name)
-            generator.project_title = project_title
-            generator.source_pdf = Path(pdf_path)
-            
-            # Process files
-            success = generator.split_pdf_into_slides()
-            if not success:
-                return jsonify({'error': 'Failed to process PDF'}), 500
-
-            # Extract audio and notes from PPTX if provided
-            slide_notes = {}
-            if pptx_path:
-                success, slide_notes = generator.extract_audio_from_pptx(pptx_path)
-                if not success:
-                    return jsonify({'error': 'Failed to extract audio and notes from PPTX'}), 500
-
-            # Generate the H5P package
-            output_filename = f"{project_name}.h5p"
-            if not generator.build_h5p_package(output_filename, slide_notes):
-                return jsonify({'error': 'Failed to generate H5P package'}), 500
-
-            # Move the generated file to uploads folder
-            source_path = generator.output_path
-            target_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-            
-            # Remove target file if it exists
-            if os.path.exists(target_path):
-                os.remove(target_path)
-            
-            # Use shutil.move instead of os.rename for cross-device compatibility
-            shutil.move(str(source_path), target_path)
 
-            # Redirect to download page
-            return redirect(url_for('download', 
-                                  filename=output_filename,
-                                  project_name=project_name,
-                                  project_title=project_title))
+        pptx_path = None
+        if pptx_session:
+            pptx_path = job.workspace / secure_filename(pptx_session.filename)
+            digests['pptx'] = upload_store.claim(pptx_upload, 'pptx', pptx_path)
+        elif pptx_file and pptx_file.filename != '':
+            pptx_path = job.workspace / secure_filename(pptx_file.filename)
+            pptx_file.save(pptx_path)
+
+        notes_path = None
+        if notes_session:
+            notes_path = job.workspace / secure_filename(notes_session.filename)
+            digests['notes'] = upload_store.claim(notes_upload, 'docx', notes_path)
+        elif notes_file and notes_file.filename != '':
+            notes_path = job.workspace / secure_filename(notes_file.filename)
+            notes_file.save(notes_path)
+
+        job.upload_bytes = sum(os.path.getsize(path) for path in (pdf_path, pptx_path, notes_path) if path)
 
+        # Reject files the build would fail on before they take up a worker
+        job.plan = plan_files(project_name, split_workers, pdf_path, pptx_path, notes_path)
+        if not job.plan['ok']:
+            shutil.rmtree(job.workspace, ignore_errors=True)
+            return jsonify({'error': job.plan['errors'][0], 'plan': job.plan}), 422
+
+        job_queue.submit(job, lambda job: run_build(job, pdf_path, pptx_path, notes_path,
+                                                    split_workers, digests))
     except Exception as e:
-        logger.error(f"Error processing files: {str(e)}")
-        return jsonify({'error': 'An error occurred during processing'}), 500
+        logger.error(f"Error queueing build: {str(e)}")
+        return jsonify({'error': 'An error occurred while queueing the build'}), 500
+
+    return jsonify({'job_id': job.id,
+                    'status_url': url_for('job_status', job_id=job.id),
+                    'plan': job.plan}), 202
+
+@app.route('/plan', methods=['POST'])
+def plan_upload():
+    """Dry run: check the files of a build and estimate it without queueing it
+
+    Takes the same fields as ``/upload``. Chunked uploads are read where
+    they are and stay available for the build.
+    """
+    with tempfile.TemporaryDirectory(dir=app.config['UPLOAD_FOLDER']) as workspace:
+        paths = {}
+        for field, kind in (('pdf', 'pdf'), ('pptx', 'pptx'), ('notes', 'docx')):
+            upload_id = request.form.get(f"{field}_upload")
+            upload = request.files.get(field)
+            if upload_id:
+                try:
+                    paths[field] = upload_store.completed(upload_id, kind).data_path
+                except UploadError as e:
+                    return jsonify({'error': str(e)}), e.status
+            elif upload and upload.filename != '':
+                if not allowed_file(upload.filename, kind):
+                    return jsonify({'error': f"Invalid {field} file type"}), 400
+                paths[field] = Path(workspace) / f"{field}.{kind}"
+                upload.save(paths[field])
+        if 'pdf' not in paths:
+            return jsonify({'error': 'No PDF file provided'}), 400
+
+        plan = plan_files('plan', get_split_workers(request.form.get('workers')),
+                          paths['pdf'], paths.get('pptx'), paths.get('notes'))
+    return jsonify(plan), 200 if plan['ok'] else 422
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Build metrics in the Prometheus text format"""
+    gauges = {'jobs': ('Known build jobs by status', job_queue.counts())}
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    status = job.to_dict()
+    if job.status == DONE:
+        status['download_url'] = url_for('job_download', job_id=job.id)
+        status['download_page'] = url_for('download',
+                                          filename=job.output_path.name,
+                                          project_name=job.project_name,
+                                          project_title=job.project_title,
+                                          job_id=job.id)
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return "File not found", 404
+    if job.status != DONE:
+        return jsonify({'error': 'Build is not finished', 'status': job.status}), 409
+
+    # The package stays available for repeated and resumed downloads until
+    # the retention sweep removes it
+    job.downloaded = time.time()
+    return serve_package(job.output_path, job.package_sha256 or True)
 
 @app.route('/download/<filename>')
 def download(filename):
     project_name = request.args.get('project_name', '')
     project_title = request.args.get('project_title', project_name)
+    job_id = request.args.get('job_id')
     return render_template('download.html', 
                          filename=filename,
                          project_name=project_name,
-                         project_title=project_title)
+                         project_title=project_title,
+                         job_id=job_id)
 
 @app.route('/download_file/<filename>')
 def download_file(filename):
     try:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
         if not os.path.exists(file_path):
             return "File not found", 404
-            
-        @after_this_request
-        def cleanup(response):
-            # Extract project name from filename
-            project_name = get_project_name(filename)
-            cleanup_project_files(project_name)
-            return response
-            
-        return send_file(file_path, as_attachment=True)
+        return serve_package(file_path)
     except Exception as e:
         logger.error(f"Error serving file: {e}")
         return str(e), 500
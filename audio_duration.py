@@ -0,0 +1,259 @@
+"""
+Audio Duration Index
+
+Narration lengths read from the container headers, without decoding any
+audio: the Xing/Info or VBRI tag (or the bitrate of the first frame) of
+an MP3, the ``mvhd`` box of an M4A and the ``fmt``/``data`` chunks of a
+WAV file. Only a few kilobytes of each clip are read.
+
+Durations are cached in ``<cache_dir>/durations.json`` by content hash:
+the CRC-32 and size from the central directory for clips inside a PPTX,
+and a hash of the size, first and last 64 KB of other files.
+"""
+
+import os
+import json
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+from h5p_package import open_source
+from pdf_slides import resolve_workers
+
+
+logger = logging.getLogger(__name__)
+
+# Bytes searched for the first MP3 frame after the ID3v2 tag
+HEADER_SCAN = 64 * 1024
+# Bytes hashed at each end of a file for its cache key
+KEY_SAMPLE = 64 * 1024
+CACHE_NAME = 'durations.json'
+
+# MP3 bitrates (kbps) by (MPEG-1, layer) and bitrate index
+MP3_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by version bits (0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1)
+MP3_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+
+def mp3_frame(header: bytes) -> Optional[Dict]:
+    """Decode a 4-byte MP3 frame header, or None if it is not one"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    samples = 384 if layer == 1 else 1152 if mpeg1 or layer == 2 else 576
+    padding = (header[2] >> 1) & 1
+    slot = 4 if layer == 1 else 1
+    return {
+        'mpeg1': mpeg1,
+        'mono': header[3] >> 6 == 3,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'samples': samples,
+        'length': (samples // 8 * bitrate // sample_rate // slot + padding) * slot,
+    }
+
+
+def mp3_duration(stream: BinaryIO, size: int) -> Optional[float]:
+    """Seconds of an MP3 stream, from its Xing/Info or VBRI tag or its bitrate"""
+    head = stream.read(10)
+    offset = 0
+    if head[:3] == b'ID3':
+        # Skip the ID3v2 tag (its size is syncsafe: 7 bits per byte), which may hold cover art
+        offset = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+        if head[5] & 0x10:
+            offset += 10
+        stream.seek(offset)
+        head = b''
+    data = head + stream.read(HEADER_SCAN)
+
+    # The first frame header whose successor is also a frame header
+    position = data.find(b'\xff')
+    while position != -1:
+        frame = mp3_frame(data[position:position + 4])
+        if frame:
+            following = data[position + frame['length']:position + frame['length'] + 4]
+            if len(following) < 4 or mp3_frame(following):
+                break
+        position = data.find(b'\xff', position + 1)
+    if position == -1:
+        return None
+
+    # Xing/Info follows the side information; VBRI always starts 32 bytes in
+    side_info = (32 if not frame['mono'] else 17) if frame['mpeg1'] else (17 if not frame['mono'] else 9)
+    xing = position + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+            return frames * frame['samples'] / frame['sample_rate']
+    vbri = position + 36
+    if data[vbri:vbri + 4] == b'VBRI':
+        frames = struct.unpack('>I', data[vbri + 14:vbri + 18])[0]
+        return frames * frame['samples'] / frame['sample_rate']
+
+    # Constant bitrate: the audio bytes at the first frame's rate
+    return max(size - offset - position, 0) * 8 / frame['bitrate']
+
+
+def mp4_duration(stream: BinaryIO, size: int) -> Optional[float]:
+    """Seconds of an MP4/M4A stream from the movie header (``moov/mvhd``)
+
+    Boxes other than ``moov`` are skipped without being read, so the
+    position of the media data does not matter.
+    """
+    position, end = 0, size
+    while position + 8 <= end:
+        stream.seek(position)
+        box_size, box_type = struct.unpack('>I4s', stream.read(8))
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack('>Q', stream.read(8))[0]
+            header = 16
+        elif box_size == 0:
+            box_size = end - position
+        if box_size < header:
+            return None
+        if box_type == b'moov':
+            # Descend into the movie box
+            position, end = position + header, position + box_size
+            continue
+        if box_type == b'mvhd':
+            version = stream.read(4)[0]
+            if version == 1:
+                timescale, duration = struct.unpack('>IQ', stream.read(28)[16:])
+            else:
+                timescale, duration = struct.unpack('>II', stream.read(16)[8:])
+            return duration / timescale if timescale else None
+        position += box_size
+    return None
+
+
+def wav_duration(stream: BinaryIO, size: int) -> Optional[float]:
+    """Seconds of a WAV stream: the ``data`` chunk size over the byte rate"""
+    position, byte_rate = 12, 0
+    while position + 8 <= size:
+        stream.seek(position)
+        chunk_id, chunk_size = struct.unpack('<4sI', stream.read(8))
+        if chunk_id == b'fmt ':
+            byte_rate = struct.unpack('<I', stream.read(12)[8:])[0]
+        elif chunk_id == b'data':
+            return min(chunk_size, size - position - 8) / byte_rate if byte_rate else None
+        # Chunks are padded to an even size
+        position += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def audio_duration(source) -> Optional[float]:
+    """Return the length in seconds of an audio path or ``ZipMember``, or None
+
+    The format is sniffed from the first bytes rather than taken from
+    the file name.
+    """
+    size = source.file_size if hasattr(source, 'file_size') else os.path.getsize(source)
+    try:
+        with open_source(source) as stream:
+            magic = stream.read(12)
+            stream.seek(0)
+            if magic[:4] == b'RIFF' and magic[8:12] == b'WAVE':
+                return wav_duration(stream, size)
+            if magic[4:8] == b'ftyp':
+                return mp4_duration(stream, size)
+            return mp3_duration(stream, size)
+    except (OSError, struct.error, IndexError) as e:
+        logger.warning(f"Could not read the duration of {source}: {e}")
+        return None
+
+
+def duration_key(source) -> str:
+    """Return the content hash the duration of ``source`` is cached under"""
+    if hasattr(source, 'crc'):
+        return f"crc32-{source.fingerprint}"
+    digest = hashlib.sha256()
+    size = os.path.getsize(source)
+    digest.update(str(size).encode('ascii'))
+    with open(source, 'rb') as f:
+        digest.update(f.read(KEY_SAMPLE))
+        if size > KEY_SAMPLE:
+            f.seek(max(size - KEY_SAMPLE, KEY_SAMPLE))
+            digest.update(f.read())
+    return f"sample-{digest.hexdigest()[:32]}"
+
+
+class DurationIndex:
+    """Clip durations in ``<cache_dir>/durations.json``, by content hash"""
+
+    def __init__(self, cache_dir: Path):
+        self.path = Path(cache_dir) / CACHE_NAME
+        self._lock = threading.Lock()
+        self.durations = self._read()
+
+    def _read(self) -> Dict[str, Optional[float]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, new: Dict[str, Optional[float]]) -> None:
+        """Add ``new`` entries, keeping those other builds wrote meanwhile"""
+        if not new:
+            return
+        with self._lock:
+            self.durations = {**self._read(), **new}
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd, partial = tempfile.mkstemp(dir=self.path.parent, suffix='.partial')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self.durations, f)
+                os.replace(partial, self.path)
+            except OSError as e:
+                # The durations are still used for this build
+                logger.warning(f"Could not save the duration index: {e}")
+
+    def measure(self, sources: Dict[int, object], workers: int = 1) -> Dict[int, Optional[float]]:
+        """Return {slide number: seconds or None} for audio paths or ``ZipMember`` entries
+
+        Each distinct clip missing from the index is read once, on
+        ``workers`` threads (0 means one per CPU).
+        """
+        if not sources:
+            return {}
+        workers = min(resolve_workers(workers), len(sources))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            keys = dict(zip(sources, executor.map(duration_key, sources.values())))
+            pending = {}
+            for slide_num, key in keys.items():
+                if key not in self.durations and key not in pending:
+                    pending[key] = sources[slide_num]
+            new = dict(zip(pending, executor.map(audio_duration, pending.values())))
+        self.save(new)
+        return {slide_num: self.durations.get(key) for slide_num, key in keys.items()}
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """Format seconds as m:ss (or h:mm:ss), '?' when unknown"""
+    if seconds is None:
+        return '?'
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
@@ -0,0 +1,202 @@
+"""
+Audio Transcoding Helpers
+
+Re-encodes narration clips to a bitrate profile with ffmpeg, spread over
+a pool of worker threads (each running its own ffmpeg process). Results
+are cached by the SHA-256 of the input clip and the profile, so a clip is
+only ever encoded once per profile, across builds and projects.
+
+Clips already at or below a profile's bitrate and channel count are
+packaged as they are rather than re-encoded.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from h5p_package import hash_source, open_source
+from pdf_slides import resolve_workers
+
+
+# MIME types of the audio formats a PPTX may contain
+AUDIO_MIME_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/mp4',
+    '.wav': 'audio/wav',
+}
+
+# Profiles: output extension, channels, sample rate and bitrate (kbps).
+# 'original' packages the clips exactly as they are in the PPTX.
+AUDIO_PROFILES = {
+    'original': None,
+    'speech-low': ('.mp3', 1, 22050, 32),
+    'speech': ('.mp3', 1, 44100, 64),
+    'music': ('.mp3', 2, 44100, 128),
+}
+DEFAULT_AUDIO_PROFILE = 'original'
+
+
+def audio_mime_type(path: str) -> str:
+    """Return the MIME type for an audio file name"""
+    return AUDIO_MIME_TYPES.get(os.path.splitext(path)[1].lower(), 'audio/mpeg')
+
+
+def find_ffmpeg() -> str:
+    """Return the ffmpeg executable, explaining how to get it when it is missing"""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("Audio transcoding needs ffmpeg on the PATH")
+    return ffmpeg
+
+
+def probe_audio(path: Path) -> Dict:
+    """Return codec, channels and bitrate (kbps) of an audio file via ffprobe
+
+    Returns an empty dict when ffprobe is missing or cannot read the file.
+    """
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return {}
+    result = subprocess.run([ffprobe, '-v', 'error', '-select_streams', 'a:0',
+                             '-show_entries', 'stream=codec_name,channels,bit_rate',
+                             '-of', 'json', str(path)],
+                            capture_output=True, text=True)
+    streams = json.loads(result.stdout or '{}').get('streams') if result.returncode == 0 else None
+    if not streams:
+        return {}
+    stream = streams[0]
+    return {
+        'codec': stream.get('codec_name'),
+        'channels': int(stream.get('channels') or 0),
+        'bitrate': int(stream.get('bit_rate') or 0) // 1000,
+    }
+
+
+def fits_profile(probe: Dict, profile: str) -> bool:
+    """Whether a probed clip is already no larger than the profile would make it"""
+    extension, channels, _, bitrate = AUDIO_PROFILES[profile]
+    return (probe.get('codec') == 'mp3' and extension == '.mp3'
+            and 0 < probe['channels'] <= channels and 0 < probe['bitrate'] <= bitrate)
+
+
+def transcode_file(source: Path, destination: Path, profile: str) -> None:
+    """Encode ``source`` to ``destination`` with the settings of ``profile``"""
+    _, channels, sample_rate, bitrate = AUDIO_PROFILES[profile]
+    result = subprocess.run([find_ffmpeg(), '-nostdin', '-v', 'error', '-y', '-i', str(source),
+                             '-vn', '-map_metadata', '-1', '-ac', str(channels),
+                             '-ar', str(sample_rate), '-c:a', 'libmp3lame', '-b:a', f"{bitrate}k",
+                             '-f', 'mp3', str(destination)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed on {source.name}: {result.stderr.strip()}")
+
+
+class AudioCache:
+    """Transcoded clips in ``<cache_dir>/audio-<input hash>-<profile><ext>``
+
+    A clip that already fits the profile is recorded as an empty
+    ``.keep`` marker, so it is not probed again and is packaged as is.
+    """
+
+    def __init__(self, cache_dir: Path, profile: str):
+        self.cache_dir = Path(cache_dir)
+        self.profile = profile
+        self.extension = AUDIO_PROFILES[profile][0]
+
+    def path(self, digest: str) -> Path:
+        return self.cache_dir / f"audio-{digest[:32]}-{self.profile}{self.extension}"
+
+    def keep_marker(self, digest: str) -> Path:
+        return self.cache_dir / f"audio-{digest[:32]}-{self.profile}.keep"
+
+    def lookup(self, digest: str, source):
+        """Return the cached clip for ``digest``, ``source`` itself if it fits, else None"""
+        if self.path(digest).exists():
+            return self.path(digest)
+        if self.keep_marker(digest).exists():
+            return source
+        return None
+
+    def transcode(self, digest: str, source):
+        """Encode ``source`` into the cache, returning what to package
+
+        Sources inside a PPTX are spooled to a temporary file first, as
+        ffmpeg needs a seekable input for M4A clips.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, spool = tempfile.mkstemp(dir=self.cache_dir, suffix=getattr(source, 'suffix', ''))
+        try:
+            if isinstance(source, Path):
+                os.close(fd)
+                input_path = source
+            else:
+                with os.fdopen(fd, 'wb') as f, open_source(source) as stream:
+                    shutil.copyfileobj(stream, f, 1024 * 1024)
+                input_path = Path(spool)
+
+            if fits_profile(probe_audio(input_path), self.profile):
+                self.keep_marker(digest).touch()
+                return source
+
+            # Encode to a private file first so concurrent builds, in other
+            # processes or threads, never see or clobber a partial clip
+            fd, partial = tempfile.mkstemp(dir=self.cache_dir, suffix='.partial')
+            os.close(fd)
+            try:
+                transcode_file(input_path, Path(partial), self.profile)
+                os.replace(partial, self.path(digest))
+            finally:
+                if os.path.exists(partial):
+                    os.unlink(partial)
+            return self.path(digest)
+        finally:
+            if os.path.exists(spool):
+                os.unlink(spool)
+
+
+def transcode_audio(sources: Dict[int, object], profile: str, cache_dir: Path, workers: int = 1,
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict[int, object]:
+    """Transcode the audio of each slide to ``profile``
+
+    ``sources`` maps slide numbers to audio paths or ``ZipMember`` entries.
+    Clips are hashed first; each distinct clip missing from the cache is
+    encoded once, on ``workers`` threads (0 means one per CPU).
+
+    Returns {slide number: audio to package}, a cached ``.mp3`` or the
+    original source for clips that already fit the profile.
+    """
+    progress = progress or (lambda done, total: None)
+    if AUDIO_PROFILES[profile] is None:
+        progress(len(sources), len(sources))
+        return dict(sources)
+
+    cache = AudioCache(cache_dir, profile)
+    digests = {slide_num: hash_source(source)[0] for slide_num, source in sources.items()}
+
+    results: Dict[str, object] = {}
+    pending: Dict[str, object] = {}
+    for slide_num, digest in digests.items():
+        cached = cache.lookup(digest, sources[slide_num])
+        if cached is not None:
+            results[digest] = cached
+        elif digest not in pending:
+            pending[digest] = sources[slide_num]
+
+    total = len(results) + len(pending)
+    progress(len(results), total)
+    if pending:
+        find_ffmpeg()
+        with ThreadPoolExecutor(max_workers=min(resolve_workers(workers), len(pending))) as executor:
+            futures = {executor.submit(cache.transcode, digest, source): digest
+                       for digest, source in pending.items()}
+            for future in as_completed(futures):
+                # Propagate the first encoder error, if any
+                results[futures[future]] = future.result()
+                progress(len(results), total)
+
+    return {slide_num: results[digest] for slide_num, digest in digests.items()}
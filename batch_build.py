@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+H5P SlideDeck Batch Builder
+
+Builds many decks in one run: every PDF in a directory (with the PPTX and
+``_NOTES.docx`` of the same name, if there are any) or every entry of a
+JSON manifest. Decks
+are built across a process pool, largest first, failed builds are
+retried, and a summary report is written next to the packages.
+"""
+
+import os
+import sys
+import json
+import time
+import traceback
+import click
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout, redirect_stderr
+from pathlib import Path
+from typing import Dict, List
+
+from h5p_package import COMPRESSION_PROFILES, DEFAULT_COMPRESSION_PROFILE
+from slide_images import SLIDE_FORMATS, DEFAULT_DPI
+from audio_transcode import AUDIO_PROFILES, DEFAULT_AUDIO_PROFILE
+
+
+REPORT_NAME = 'batch_report.json'
+
+
+def find_decks(source: Path) -> List[Dict]:
+    """Return the decks to build from a directory or a JSON manifest
+
+    A manifest is a list of objects with a ``pdf`` path and optional
+    ``pptx``, ``notes``, ``project`` and ``title`` keys; relative paths are
+    resolved against the manifest's directory.
+    """
+    source = Path(source)
+    decks = []
+    if source.is_dir():
+        for pdf_path in sorted(source.glob('*.pdf')):
+            pptx_path = pdf_path.with_suffix('.pptx')
+            notes_path = pdf_path.with_name(f"{pdf_path.stem}_NOTES.docx")
+            decks.append({
+                'pdf': str(pdf_path),
+                'pptx': str(pptx_path) if pptx_path.exists() else None,
+                'notes': str(notes_path) if notes_path.exists() else None,
+                'project': pdf_path.stem,
+                'title': pdf_path.stem,
+            })
+        return decks
+
+    with open(source, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    for entry in entries:
+        pdf_path = source.parent / entry['pdf']
+        pptx_path = source.parent / entry['pptx'] if entry.get('pptx') else None
+        notes_path = source.parent / entry['notes'] if entry.get('notes') else None
+        project = entry.get('project') or pdf_path.stem
+        decks.append({
+            'pdf': str(pdf_path),
+            'pptx': str(pptx_path) if pptx_path else None,
+            'notes': str(notes_path) if notes_path else None,
+            'project': project,
+            'title': entry.get('title') or project,
+        })
+    return decks
+
+
+def deck_size(deck: Dict) -> int:
+    """Total input size of a deck, used to schedule the largest decks first"""
+    return sum(os.path.getsize(deck[key]) for key in ('pdf', 'pptx', 'notes')
+               if deck.get(key) and os.path.exists(deck[key]))
+
+
+def build_deck(deck: Dict, output_dir: str, options: Dict) -> Dict:
+    """Build one deck; runs in a worker process
+
+    The generator's console output goes to ``logs/<project>.log`` in the
+    output directory. Returns the deck's report entry.
+    """
+    # Imported here so the parent process never pays for the PDF libraries
+    from SD_Generator import H5PSlideDeckGenerator
+
+    output_dir = Path(output_dir)
+    log_path = output_dir / 'logs' / f"{deck['project']}.log"
+    package_path = output_dir / f"{deck['project']}.h5p"
+    started = time.perf_counter()
+    result = {'project': deck['project'], 'pdf': deck['pdf'], 'pptx': deck['pptx'],
+              'package': str(package_path)}
+
+    generator = None
+    with open(log_path, 'w', encoding='utf-8') as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            generator = H5PSlideDeckGenerator(project_name=deck['project'],
+                                              compression=options['compression'],
+                                              workers=options['split_workers'],
+                                              prune_resources=options['prune_resources'],
+                                              incremental=options['incremental'],
+                                              slide_format=options['slide_format'],
+                                              dpi=options['dpi'],
+                                              audio_profile=options['audio_profile'],
+                                              all_libraries=options['all_libraries'],
+                                              autoplay=options['autoplay'],
+                                              memory_budget=options['memory_budget'])
+            generator.project_title = deck['title']
+            generator.source_pdf = Path(deck['pdf'])
+
+            if not generator.split_pdf_into_slides():
+                raise RuntimeError('Failed to split PDF')
+            slide_notes = {}
+            if deck['pptx']:
+                extracted, slide_notes = generator.extract_audio_from_pptx(Path(deck['pptx']))
+                if not extracted:
+                    raise RuntimeError('Failed to extract audio and notes from PPTX')
+            if deck.get('notes'):
+                document_notes = generator.parse_notes_document(Path(deck['notes']))
+                if document_notes is None:
+                    raise RuntimeError('Failed to parse notes document')
+                slide_notes = {**slide_notes, **document_notes}
+            if not generator.build_h5p_package(package_path.name, slide_notes,
+                                               destination=package_path):
+                raise RuntimeError('Failed to build H5P package')
+
+            durations = generator.duration_report()
+            result.update(status='ok', size=package_path.stat().st_size,
+                          narration_seconds=durations['total'], durations=durations)
+        except Exception as e:
+            traceback.print_exc()
+            result.update(status='failed', error=str(e))
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    if generator is not None and generator.memory_monitor.peaks:
+        result['peak_rss_mb'] = round(max(generator.memory_monitor.peaks.values()) / (1024 * 1024), 1)
+        result['reader_reopens'] = generator.reader_reopens
+    return result
+
+
+def plan_batch(decks: List[Dict], options: Dict) -> List[Dict]:
+    """Dry-run every deck in this process and return the plans, with their project names
+
+    Planning only reads the file headers, so it is fast enough to run
+    serially before (or instead of) the batch.
+    """
+    from SD_Generator import H5PSlideDeckGenerator
+
+    plans = []
+    for deck in decks:
+        generator = H5PSlideDeckGenerator(project_name=deck['project'],
+                                          compression=options['compression'],
+                                          workers=options['split_workers'],
+                                          slide_format=options['slide_format'],
+                                          dpi=options['dpi'],
+                                          audio_profile=options['audio_profile'],
+                                          all_libraries=options['all_libraries'])
+        plan = generator.plan_build(Path(deck['pdf']), Path(deck['pptx']) if deck['pptx'] else None,
+                                    Path(deck['notes']) if deck.get('notes') else None)
+        plans.append({'project': deck['project'], **plan})
+    return plans
+
+
+def run_batch(decks: List[Dict], output_dir: Path, jobs: int, retries: int,
+              options: Dict) -> Dict:
+    """Build ``decks`` on ``jobs`` processes and return the summary report"""
+    output_dir = Path(output_dir)
+    (output_dir / 'logs').mkdir(parents=True, exist_ok=True)
+
+    # Largest decks first, so a big deck does not start last and hold up the run
+    pending = sorted(decks, key=deck_size, reverse=True)
+    attempts: Dict[str, int] = {}
+    results: Dict[str, Dict] = {}
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+
+        def submit(deck):
+            attempts[deck['project']] = attempts.get(deck['project'], 0) + 1
+            futures[executor.submit(build_deck, deck, str(output_dir), options)] = deck
+
+        for deck in pending:
+            submit(deck)
+
+        while futures:
+            future = next(as_completed(futures))
+            deck = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died
+                result = {'project': deck['project'], 'status': 'failed', 'error': str(e)}
+            result['attempts'] = attempts[deck['project']]
+            results[deck['project']] = result
+
+            if result['status'] == 'ok':
+                click.echo(click.style(f"✓ {deck['project']} ({result['seconds']:.1f}s)", fg='green'))
+            elif attempts[deck['project']] <= retries:
+                click.echo(click.style(f"Retrying {deck['project']}: {result['error']}", fg='yellow'))
+                submit(deck)
+            else:
+                click.echo(click.style(f"✗ {deck['project']}: {result['error']}", fg='red'))
+
+    ordered = [results[deck['project']] for deck in pending]
+    return {
+        'decks': ordered,
+        'total': len(ordered),
+        'succeeded': sum(1 for result in ordered if result['status'] == 'ok'),
+        'failed': sum(1 for result in ordered if result['status'] != 'ok'),
+        'package_bytes': sum(result.get('size', 0) for result in ordered),
+        'narration_seconds': round(sum(result.get('narration_seconds', 0) for result in ordered), 3),
+        'seconds': round(time.perf_counter() - started, 3),
+        'jobs': jobs,
+    }
+
+
+@click.command()
+@click.argument('source', type=click.Path(exists=True, path_type=Path))
+@click.option('--output-dir', '-o', type=click.Path(path_type=Path), default=Path('batch_output'),
+              show_default=True, help='Directory for the packages, logs and report')
+@click.option('--jobs', '-j', type=click.IntRange(min=0), default=0, show_default=True,
+              help='Decks built at once (0 = one per CPU)')
+@click.option('--retries', '-r', type=click.IntRange(min=0), default=1, show_default=True,
+              help='Times a failed deck is retried')
+@click.option('--compression', '-c', type=click.Choice(list(COMPRESSION_PROFILES)),
+              default=DEFAULT_COMPRESSION_PROFILE, show_default=True,
+              help='Package compression profile (speed or size trade-off)')
+@click.option('--split-workers', '-w', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Worker processes for PDF splitting within each deck')
+@click.option('--prune-resources', is_flag=True,
+              help='Drop fonts and images a slide does not use from its PDF')
+@click.option('--incremental', '-i', is_flag=True,
+              help='Only rebuild slides that changed since the last build of each deck')
+@click.option('--slide-format', '-s', type=click.Choice(SLIDE_FORMATS), default='pdf', show_default=True,
+              help='Show slides as PDFs or as rasterised images (needs PyMuPDF)')
+@click.option('--dpi', type=click.IntRange(min=36, max=600), default=DEFAULT_DPI, show_default=True,
+              help='Resolution of rasterised slide images')
+@click.option('--audio-profile', '-a', type=click.Choice(list(AUDIO_PROFILES)),
+              default=DEFAULT_AUDIO_PROFILE, show_default=True,
+              help='Re-encode narration audio (needs ffmpeg), or keep the original clips')
+@click.option('--all-libraries', is_flag=True,
+              help='Package every template library, not only the ones the content needs')
+@click.option('--autoplay', is_flag=True,
+              help="Play each slide's narration as soon as the slide is shown")
+@click.option('--memory-budget', type=click.IntRange(min=0), default=0, show_default=True,
+              help='Keep the resident memory of each deck build under this many MB where possible (0: no limit)')
+@click.option('--dry-run', is_flag=True,
+              help='Check every deck and estimate package sizes and build times without building')
+def batch(source, output_dir, jobs, retries, compression, split_workers, prune_resources, incremental,
+          slide_format, dpi, audio_profile, all_libraries, autoplay, memory_budget, dry_run):
+    """Build every deck in SOURCE, a directory of PDF/PPTX pairs or a JSON manifest"""
+    decks = find_decks(source)
+    if not decks:
+        click.echo(click.style(f"Error: No decks found in {source}", fg='red'))
+        sys.exit(1)
+
+    projects = [deck['project'] for deck in decks]
+    duplicates = sorted({project for project in projects if projects.count(project) > 1})
+    if duplicates:
+        click.echo(click.style(f"Error: Duplicate project names: {', '.join(duplicates)}", fg='red'))
+        sys.exit(1)
+
+    jobs = min(jobs or os.cpu_count() or 1, len(decks))
+
+    options = {
+        'compression': compression,
+        'split_workers': split_workers,
+        'prune_resources': prune_resources,
+        'incremental': incremental,
+        'slide_format': slide_format,
+        'dpi': dpi,
+        'audio_profile': audio_profile,
+        'all_libraries': all_libraries,
+        'autoplay': autoplay,
+        'memory_budget': memory_budget,
+    }
+    if dry_run:
+        plans = plan_batch(decks, options)
+        for plan in plans:
+            if plan['ok']:
+                click.echo(f"{plan['project']}: {plan['slides']} slides, audio on {plan['audio']['slides']}, "
+                           f"~{plan['package_bytes']['total'] / (1024 * 1024):.1f} MB, "
+                           f"~{plan['build_seconds']['total']:.1f}s")
+                for warning in plan['warnings']:
+                    click.echo(click.style(f"  Warning: {warning}", fg='yellow'))
+            else:
+                click.echo(click.style(f"✗ {plan['project']}: {'; '.join(plan['errors'])}", fg='red'))
+        # Decks run ``jobs`` at a time, largest first
+        total_seconds = sum(plan['build_seconds']['total'] for plan in plans)
+        click.echo(f"Estimated: {sum(plan['package_bytes']['total'] for plan in plans) / (1024 * 1024):.1f} MB, "
+                   f"about {total_seconds / jobs:.1f}s with {jobs} workers")
+        if not all(plan['ok'] for plan in plans):
+            sys.exit(1)
+        return
+
+    click.echo(f"Building {len(decks)} decks with {jobs} workers...")
+    report = run_batch(decks, output_dir, jobs, retries, options)
+
+    report_path = Path(output_dir) / REPORT_NAME
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    click.echo(f"Built {report['succeeded']} of {report['total']} decks in {report['seconds']:.1f}s "
+               f"({report['package_bytes'] / (1024 * 1024):.2f} MB)")
+    click.echo(f"Report: {report_path}")
+    if report['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    batch()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+H5P SlideDeck Benchmarks
+
+Generates synthetic decks (PDF, PPTX with narration audio, notes DOCX) of
+10 to 500 slides and runs every pipeline phase on them: PDF splitting,
+PPTX extraction, notes parsing and packaging. Each phase is timed, and
+both the peak RSS so far and the phase's own peak are recorded, along
+with input and package sizes. ``--memory-budget`` runs the decks as a
+memory-bounded build.
+Results are saved as JSON, and ``--compare`` prints the change against an
+earlier run.
+
+The decks are generated from a fixed seed, so two runs with the same
+options build byte-identical inputs.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import statistics
+import subprocess
+import tempfile
+import zipfile
+import click
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from h5p_package import COMPRESSION_PROFILES, DEFAULT_COMPRESSION_PROFILE
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS figures
+    resource = None
+
+
+RESULTS_VERSION = 1
+DEFAULT_SIZES = (10, 50, 100, 250, 500)
+PHASES = ('split', 'extract', 'notes', 'package')
+SEED = 20240501
+
+PRESENTATION_NS = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+DRAWING_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def make_pdf(path: Path, slides: int, image_kb: int, rng: random.Random) -> None:
+    """Write a PDF whose pages share one resource dictionary
+
+    Every page draws its title with a shared font; odd pages also draw a
+    shared image of ``image_kb`` KB, like a logo on an exported deck.
+    """
+    image = rng.randbytes(image_kb * 1024)
+    objects = {
+        3: b'<< /Font << /F1 4 0 R >> /XObject << /Im1 5 0 R >> >>',
+        4: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        5: (b'<< /Type /XObject /Subtype /Image /Width %d /Height 1024 /ColorSpace /DeviceGray '
+            b'/BitsPerComponent 8 /Length %d >>\nstream\n' % (image_kb, len(image))
+            + image + b'\nendstream'),
+    }
+    kids = []
+    number = 6
+    for page in range(slides):
+        content = b'BT /F1 36 Tf 72 700 Td (Slide %d) Tj ET' % (page + 1)
+        if page % 2:
+            content += b' q 200 0 0 200 72 72 cm /Im1 Do Q'
+        objects[number] = b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream'
+        objects[number + 1] = (b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 960 540] '
+                               b'/Resources 3 0 R /Contents %d 0 R >>' % number)
+        kids.append(number + 1)
+        number += 2
+    objects[1] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objects[2] = (b'<< /Type /Pages /Kids [' + b' '.join(b'%d 0 R' % kid for kid in kids)
+                  + b'] /Count %d >>' % slides)
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = {}
+    for key in sorted(objects):
+        offsets[key] = len(output)
+        output += b'%d 0 obj\n' % key + objects[key] + b'\nendobj\n'
+    xref = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % number
+    for key in range(1, number):
+        output += b'%010d 00000 n \n' % offsets[key]
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (number, xref)
+    path.write_bytes(bytes(output))
+
+
+def make_pptx(path: Path, slides: int, audio_kb: int, rng: random.Random) -> None:
+    """Write a PPTX with notes and one narration clip of ``audio_kb`` KB per slide
+
+    Only the parts the pipeline reads are written. The audio is random
+    bytes, which compress as badly as real MP3 data.
+    """
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as pptx:
+        slide_ids = ''.join(f'<p:sldId id="{256 + n}" r:id="rId{n}"/>' for n in range(1, slides + 1))
+        pptx.writestr('ppt/presentation.xml',
+                      f'<p:presentation xmlns:p="{PRESENTATION_NS}" xmlns:r="{REL_TYPE}">'
+                      f'<p:sldIdLst>{slide_ids}</p:sldIdLst></p:presentation>')
+        rels = ''.join(f'<Relationship Id="rId{n}" Type="{REL_TYPE}/slide" Target="slides/slide{n}.xml"/>'
+                       for n in range(1, slides + 1))
+        pptx.writestr('ppt/_rels/presentation.xml.rels',
+                      f'<Relationships xmlns="{RELS_NS}">{rels}</Relationships>')
+
+        for n in range(1, slides + 1):
+            pptx.writestr(f'ppt/slides/slide{n}.xml', f'<p:sld xmlns:p="{PRESENTATION_NS}"/>')
+            pptx.writestr(f'ppt/slides/_rels/slide{n}.xml.rels',
+                          f'<Relationships xmlns="{RELS_NS}">'
+                          f'<Relationship Id="rId1" Type="{REL_TYPE}/notesSlide" '
+                          f'Target="../notesSlides/notesSlide{n}.xml"/>'
+                          f'<Relationship Id="rId2" Type="{REL_TYPE}/audio" Target="../media/media{n}.mp3"/>'
+                          f'</Relationships>')
+            pptx.writestr(f'ppt/notesSlides/notesSlide{n}.xml',
+                          f'<p:notes xmlns:p="{PRESENTATION_NS}" xmlns:a="{DRAWING_NS}"><p:cSld><p:spTree>'
+                          f'<p:sp><p:nvSpPr><p:nvPr><p:ph type="body"/></p:nvPr></p:nvSpPr>'
+                          f'<p:txBody><a:p><a:r><a:t>Speaker notes for slide {n}.</a:t></a:r></a:p>'
+                          f'</p:txBody></p:sp></p:spTree></p:cSld></p:notes>')
+            pptx.writestr(zipfile.ZipInfo(f'ppt/media/media{n}.mp3'), rng.randbytes(audio_kb * 1024),
+                          compress_type=zipfile.ZIP_STORED)
+
+
+def make_notes_docx(path: Path, slides: int) -> None:
+    """Write a notes document with a ``Slide N`` heading and two paragraphs per slide"""
+    from docx import Document
+
+    document = Document()
+    for n in range(1, slides + 1):
+        document.add_heading(f"Slide {n}", level=1)
+        document.add_paragraph(f"Notes for slide {n}.")
+        document.add_paragraph("A second paragraph of notes.")
+    document.save(path)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process and its finished children, in MB"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * unit / (1024 * 1024), 1)
+
+
+def run_deck(slides: int, audio_kb: int, image_kb: int, options: Dict) -> Dict:
+    """Generate a deck and run every phase on it; runs in a fresh process
+
+    A fresh process per deck keeps the peak RSS of one deck from hiding
+    that of the next.
+    """
+    # Imported in the worker, outside the timed phases
+    from SD_Generator import H5PSlideDeckGenerator
+
+    rng = random.Random(SEED + slides)
+    with tempfile.TemporaryDirectory(prefix='h5p-bench-') as tmp:
+        tmp = Path(tmp)
+        pdf_path, pptx_path = tmp / 'deck.pdf', tmp / 'deck.pptx'
+        make_pdf(pdf_path, slides, image_kb, rng)
+        make_pptx(pptx_path, slides, audio_kb, rng)
+
+        generator = H5PSlideDeckGenerator(project_name='bench', workers=options['workers'],
+                                          compression=options['compression'],
+                                          prune_resources=options['prune_resources'],
+                                          workspace=tmp / 'build', in_memory=options['in_memory'],
+                                          memory_budget=options['memory_budget'])
+        generator.source_pdf = pdf_path
+        generator.output_dir.mkdir(parents=True, exist_ok=True)
+        make_notes_docx(generator.notes_docx, slides)
+        package_path = tmp / 'deck.h5p'
+
+        slide_notes: Dict[int, str] = {}
+
+        def extract() -> bool:
+            extracted, pptx_notes = generator.extract_audio_from_pptx(pptx_path)
+            slide_notes.update(pptx_notes)
+            return extracted
+
+        def parse_notes() -> bool:
+            # Notes from the Word document replace the PPTX notes of the same slides
+            document_notes = generator.parse_notes_document()
+            if document_notes is None:
+                return False
+            slide_notes.update(document_notes)
+            return True
+
+        phases = {}
+        steps = (
+            ('split', generator.split_pdf_into_slides),
+            ('extract', extract),
+            ('notes', parse_notes),
+            ('package', lambda: generator.build_h5p_package(
+                package_path.name, slide_notes, destination=package_path)),
+        )
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+            for phase, step in steps:
+                started = time.perf_counter()
+                if not step():
+                    raise RuntimeError(f"Phase {phase} failed for {slides} slides")
+                # The phase's own peak leaves out memory freed by earlier phases
+                # and, unlike ru_maxrss, the split worker processes
+                phase_rss = generator.memory_monitor.peaks.get(phase)
+                phases[phase] = {'seconds': round(time.perf_counter() - started, 4),
+                                 'peak_rss_mb': peak_rss_mb(),
+                                 'phase_rss_mb': round(phase_rss / (1024 * 1024), 1) if phase_rss else None}
+            phases['split']['reader_reopens'] = generator.reader_reopens
+
+        return {
+            'slides': slides,
+            'audio_kb': audio_kb,
+            'phases': phases,
+            'total_seconds': round(sum(phase['seconds'] for phase in phases.values()), 4),
+            'input_bytes': {'pdf': pdf_path.stat().st_size, 'pptx': pptx_path.stat().st_size,
+                            'docx': generator.notes_docx.stat().st_size},
+            'package_bytes': package_path.stat().st_size,
+        }
+
+
+def environment() -> Dict:
+    """Describe the machine and code revision the benchmark ran on"""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        revision = ''
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'revision': revision or None,
+    }
+
+
+def summarise(runs: List[Dict]) -> Dict[int, Dict[str, float]]:
+    """Median seconds per phase (and in total) for each deck size"""
+    by_size: Dict[int, List[Dict]] = {}
+    for run in runs:
+        by_size.setdefault(run['slides'], []).append(run)
+    summary = {}
+    for slides, group in sorted(by_size.items()):
+        summary[slides] = {phase: statistics.median(run['phases'][phase]['seconds'] for run in group)
+                           for phase in PHASES}
+        summary[slides]['total'] = statistics.median(run['total_seconds'] for run in group)
+    return summary
+
+
+def print_comparison(previous: Dict, current: Dict) -> None:
+    """Print the change in median phase times between two result files"""
+    before, after = summarise(previous['runs']), summarise(current['runs'])
+    click.echo(f"{'slides':>6}  {'phase':<8} {'before':>9} {'after':>9} {'change':>8}")
+    for slides in sorted(set(before) & set(after)):
+        for phase in PHASES + ('total',):
+            old, new = before[slides][phase], after[slides][phase]
+            change = (new - old) / old * 100 if old else 0.0
+            colour = 'green' if change < -5 else 'red' if change > 5 else None
+            click.echo(f"{slides:>6}  {phase:<8} {old:>8.3f}s {new:>8.3f}s "
+                       + click.style(f"{change:>+7.1f}%", fg=colour))
+
+
+@click.command()
+@click.option('--sizes', default=','.join(map(str, DEFAULT_SIZES)), show_default=True,
+              help='Comma-separated deck sizes in slides')
+@click.option('--audio-kb', type=click.IntRange(min=1), default=256, show_default=True,
+              help='Narration audio per slide, in KB')
+@click.option('--image-kb', type=click.IntRange(min=1), default=64, show_default=True,
+              help='Size of the image shared by the PDF pages, in KB')
+@click.option('--repeat', '-r', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Runs per deck size; comparisons use the median')
+@click.option('--workers', '-w', type=click.IntRange(min=0), default=1, show_default=True,
+              help='Worker processes for PDF splitting (0 = one per CPU)')
+@click.option('--compression', '-c', type=click.Choice(list(COMPRESSION_PROFILES)),
+              default=DEFAULT_COMPRESSION_PROFILE, show_default=True,
+              help='Package compression profile')
+@click.option('--prune-resources', is_flag=True, help='Prune unused resources from slide PDFs')
+@click.option('--in-memory', is_flag=True, help='Keep slides and audio off disk')
+@click.option('--memory-budget', type=click.IntRange(min=0), default=0, show_default=True,
+              help='Memory budget of each build in MB (0: no limit)')
+@click.option('--output', '-o', type=click.Path(path_type=Path), default=None,
+              help='Results file (default: benchmark_results/benchmark-<time>.json)')
+@click.option('--compare', type=click.Path(exists=True, path_type=Path), default=None,
+              help='Earlier results file to compare against')
+def benchmark(sizes, audio_kb, image_kb, repeat, workers, compression, prune_resources, in_memory,
+              memory_budget, output, compare):
+    """Time every pipeline phase on synthetic decks and save the results as JSON"""
+    try:
+        sizes = [int(size) for size in sizes.split(',') if size.strip()]
+    except ValueError:
+        click.echo(click.style(f"Error: Invalid --sizes: {sizes}", fg='red'))
+        sys.exit(1)
+
+    options = {'workers': workers, 'compression': compression,
+               'prune_resources': prune_resources, 'in_memory': in_memory,
+               'memory_budget': memory_budget}
+    runs = []
+    for slides in sizes:
+        for attempt in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                run = executor.submit(run_deck, slides, audio_kb, image_kb, options).result()
+            runs.append(run)
+            phase_times = '  '.join(f"{phase} {run['phases'][phase]['seconds']:.2f}s" for phase in PHASES)
+            click.echo(f"{slides:>4} slides: {phase_times}  "
+                       f"peak {run['phases']['package']['peak_rss_mb'] or 0:.0f} MB  "
+                       f"package {run['package_bytes'] / (1024 * 1024):.1f} MB")
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'options': dict(options, audio_kb=audio_kb, image_kb=image_kb, repeat=repeat),
+        'runs': runs,
+    }
+
+    if output is None:
+        output = Path('benchmark_results') / f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f"Results: {output}")
+
+    if compare:
+        with open(compare, 'r', encoding='utf-8') as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == '__main__':
+    benchmark()
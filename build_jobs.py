@@ -0,0 +1,208 @@
+"""
+Build Jobs
+
+A bounded, in-process queue for package builds. The web app enqueues a
+job per upload and returns at once; a pool of worker threads runs the
+builds and records per-phase progress that clients can poll.
+"""
+
+import time
+import uuid
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Build phases in the order they run
+PHASES = ('split', 'extract', 'notes', 'transcode', 'package')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class BuildJob:
+    """State of one queued or running build
+
+    ``workspace`` is a directory under ``jobs_dir`` owned by the job; it
+    holds the uploaded files and the finished package, and is deleted when
+    the job is removed.
+    """
+
+    def __init__(self, project_name: str, project_title: str, jobs_dir: Path):
+        self.id = uuid.uuid4().hex
+        self.project_name = project_name
+        self.project_title = project_title
+        self.workspace = Path(jobs_dir) / self.id
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.output_path: Optional[Path] = None
+        self.phases: Dict[str, Dict] = {phase: {'state': 'pending', 'done': 0, 'total': 0}
+                                        for phase in PHASES}
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.downloaded: Optional[float] = None
+        # SHA-256 of the finished package, served as its ETag
+        self.package_sha256: Optional[str] = None
+        # Filled in by the build for metrics and logs
+        self.upload_bytes = 0
+        self.cache_hit: Optional[bool] = None
+        self.slides = 0
+        self.timings: Dict[str, float] = {}
+        # Narration seconds per slide and in total (see H5PSlideDeckGenerator.duration_report)
+        self.durations: Optional[Dict] = None
+        # Peak resident memory in bytes, by phase (see build_metrics.MemoryMonitor)
+        self.peak_rss: Dict[str, int] = {}
+        # Source PDF reader reopens under the memory budget
+        self.reader_reopens = 0
+        # Dry-run checks and estimates made before the job was queued
+        self.plan: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    def progress(self, phase: str, done: int, total: int) -> None:
+        """Record progress of a phase; used as the generator's progress callback"""
+        with self._lock:
+            self.phases[phase].update(state=DONE if done >= total else RUNNING,
+                                      done=done, total=total)
+
+    def skip(self, phase: str) -> None:
+        """Mark a phase that does not apply to this build (e.g. no PPTX)"""
+        with self._lock:
+            self.phases[phase]['state'] = 'skipped'
+
+    def failed_phase(self) -> Optional[str]:
+        """The first phase that neither finished nor was skipped, for failed jobs"""
+        if self.status != FAILED:
+            return None
+        with self._lock:
+            return next((phase for phase in PHASES
+                         if self.phases[phase]['state'] not in (DONE, 'skipped')), PHASES[-1])
+
+    def to_dict(self) -> Dict:
+        """Return a JSON-serialisable snapshot of the job"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'project_name': self.project_name,
+                'project_title': self.project_title,
+                'status': self.status,
+                'cached': bool(self.cache_hit),
+                'error': self.error,
+                'phases': {phase: dict(state) for phase, state in self.phases.items()},
+                'timings': {phase: round(seconds, 3) for phase, seconds in self.timings.items()},
+                'created': self.created,
+                'finished': self.finished,
+                'sha256': self.package_sha256,
+                'durations': self.durations,
+                'peak_rss_mb': {phase: round(rss / (1024 * 1024), 1) for phase, rss in self.peak_rss.items()},
+                'reader_reopens': self.reader_reopens,
+                'plan': self.plan,
+            }
+
+
+class JobQueue:
+    """Runs build jobs on a bounded pool of worker threads
+
+    Finished jobs are kept for ``ttl`` seconds after they finished or were
+    last downloaded, so their status and package can still be fetched,
+    then forgotten and their workspace removed.
+    ``on_finish(job)`` is called after every build, successful or not.
+    """
+
+    def __init__(self, max_workers: int = 2, ttl: float = 3600,
+                 on_finish: Optional[Callable[[BuildJob], None]] = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='build')
+        self.ttl = ttl
+        self.on_finish = on_finish
+        self.jobs: Dict[str, BuildJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job: BuildJob, build: Callable[[BuildJob], Path]) -> BuildJob:
+        """Queue ``build(job)``, which returns the path of the finished package"""
+        self.expire()
+        with self._lock:
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, build)
+        return job
+
+    def get(self, job_id: str) -> Optional[BuildJob]:
+        """Return a job by id, if it is still known"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def remove(self, job_id: str) -> None:
+        """Forget a job and delete its workspace"""
+        with self._lock:
+            job = self.jobs.pop(job_id, None)
+        if job is not None:
+            shutil.rmtree(job.workspace, ignore_errors=True)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of known jobs in each status"""
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def expire(self) -> None:
+        """Remove finished jobs not used within the time-to-live"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job.id for job in self.jobs.values()
+                       if job.finished is not None and max(job.finished, job.downloaded or 0) < cutoff]
+        for job_id in expired:
+            self.remove(job_id)
+
+    def _run(self, job: BuildJob, build: Callable[[BuildJob], Path]) -> None:
+        job.status = RUNNING
+        try:
+            job.output_path = build(job)
+            job.status = DONE
+        except Exception as e:
+            logger.error(f"Build job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            if self.on_finish is not None:
+                try:
+                    self.on_finish(job)
+                except Exception as e:
+                    logger.error(f"Finishing build job {job.id} failed: {e}")
+
+
+class Sweeper:
+    """Calls ``sweep()`` every ``interval`` seconds on a daemon thread
+
+    Used for retention: expired jobs, packages and uploads are deleted in
+    the background instead of by the requests that happen to touch them.
+    """
+
+    def __init__(self, sweep: Callable[[], None], interval: float):
+        self.sweep = sweep
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the sweep thread; further calls do nothing"""
+        with self._lock:
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._run, name='sweeper', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
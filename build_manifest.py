@@ -0,0 +1,105 @@
+"""
+Build Manifest
+
+Records what went into the last build of a project: a fingerprint of each
+slide's source page, audio and notes, the package paths of its media, and
+the package that was produced. The next build compares against it and only
+regenerates the slides that changed.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+
+MANIFEST_NAME = 'build_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def text_fingerprint(text: str) -> str:
+    """Return a hash of a notes text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """Per-slide fingerprints of the last build, stored as JSON in the project directory
+
+    ``options`` holds the build settings that affect every slide (pruning,
+    compression). When they differ from the last build, every slide counts
+    as changed.
+    """
+
+    def __init__(self, path: Path, options: Optional[Dict] = None):
+        self.path = Path(path)
+        self.options = options or {}
+        self.slides: Dict[int, Dict[str, str]] = {}
+        self.package: Dict = {}
+
+    @classmethod
+    def load(cls, path: Path, options: Optional[Dict] = None) -> 'BuildManifest':
+        """Load the manifest at ``path``
+
+        A missing or unreadable manifest, or one written with different
+        options, yields an empty manifest, i.e. a full rebuild.
+        """
+        manifest = cls(path, options)
+        try:
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if data.get('version') != MANIFEST_VERSION or data.get('options') != manifest.options:
+            return manifest
+        manifest.slides = {int(num): entry for num, entry in data.get('slides', {}).items()}
+        manifest.package = data.get('package', {})
+        return manifest
+
+    def save(self) -> None:
+        """Write the manifest, replacing the previous one atomically"""
+        data = {
+            'version': MANIFEST_VERSION,
+            'options': self.options,
+            'slides': {str(num): entry for num, entry in sorted(self.slides.items())},
+            'package': self.package,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def slide(self, slide_num: int) -> Dict[str, str]:
+        """Return the recorded entry of a slide, creating an empty one if needed"""
+        return self.slides.setdefault(slide_num, {})
+
+    def changed(self, slide_num: int, key: str, fingerprint: Optional[str]) -> bool:
+        """Check whether ``fingerprint`` differs from the recorded one"""
+        return self.slides.get(slide_num, {}).get(key) != fingerprint
+
+    def truncate(self, total_slides: int) -> None:
+        """Forget slides beyond ``total_slides`` after the deck got shorter"""
+        self.slides = {num: entry for num, entry in self.slides.items() if num <= total_slides}
+
+    def record_package(self, package_path: Path) -> None:
+        """Remember the package built from the recorded slides"""
+        stat = Path(package_path).stat()
+        self.package = {
+            'path': str(Path(package_path).resolve()),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+
+    def previous_package(self, package_path: Path) -> Optional[Path]:
+        """Return ``package_path`` if it is still the package of the last build"""
+        package_path = Path(package_path)
+        if not self.package or self.package.get('path') != str(package_path.resolve()):
+            return None
+        try:
+            stat = package_path.stat()
+        except OSError:
+            return None
+        if stat.st_size != self.package.get('size') or stat.st_mtime_ns != self.package.get('mtime_ns'):
+            return None
+        return package_path
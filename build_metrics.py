@@ -0,0 +1,269 @@
+"""
+Build Metrics
+
+Phase timers and memory peaks for the generator, and a small in-process
+metrics registry for the web app. Finished builds are recorded as
+counters and histograms (phase seconds and peak memory, upload and
+package bytes, failures by phase) and rendered in the Prometheus text
+exposition format. Each build can also be logged as one structured JSON
+line.
+
+The registry lives in the process, so with several gunicorn worker
+processes each one reports its own builds. Memory is the resident set
+size of the whole process (Linux only), so builds running in parallel
+threads see each other's memory, and PDF split worker processes are not
+included.
+"""
+
+import os
+import time
+import json
+import logging
+import functools
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds
+PHASE_SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(n * 1024 * 1024 for n in (1, 5, 10, 25, 50, 100, 250, 500))
+RSS_BYTES_BUCKETS = tuple(n * 1024 * 1024 for n in (64, 128, 256, 512, 1024, 2048, 4096))
+
+# Seconds between memory samples while a phase runs
+MEMORY_SAMPLE_INTERVAL = 0.01
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, or None where it cannot be read"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryMonitor:
+    """Peak resident memory of each generator phase
+
+    While any phase runs, a background thread samples the process RSS
+    every ``interval`` seconds; every sample counts towards all phases
+    running at that moment, so an outer phase's peak includes its nested
+    ones.
+    """
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peaks: Dict[str, int] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> None:
+        """Count the current RSS towards every running phase"""
+        rss = current_rss()
+        if rss is None:
+            return
+        with self._lock:
+            for phase in self._active:
+                self.peaks[phase] = max(self.peaks.get(phase, 0), rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def enter(self, phase: str) -> None:
+        with self._lock:
+            self._active[phase] = self._active.get(phase, 0) + 1
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='memory-monitor', daemon=True)
+                self._thread.start()
+        self.sample()
+
+    def exit(self, phase: str) -> None:
+        self.sample()
+        thread = None
+        with self._lock:
+            self._active[phase] -= 1
+            if not self._active[phase]:
+                del self._active[phase]
+            if not self._active:
+                thread, self._thread = self._thread, None
+                self._stop.set()
+        if thread is not None:
+            thread.join()
+
+
+def timed_phase(phase: str):
+    """Add the run time of a generator method to ``self.timings[phase]``
+
+    Time is recorded whether the method succeeds, fails or raises. A
+    timed phase run from inside another (audio transcoding during
+    packaging) is only counted once, under its own name. The phase's
+    peak memory goes to ``self.memory_monitor``, if the object has one.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            outer_nested = getattr(self, '_nested_seconds', None)
+            self._nested_seconds = 0.0
+            monitor = getattr(self, 'memory_monitor', None)
+            if monitor is not None:
+                monitor.enter(phase)
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.timings[phase] = self.timings.get(phase, 0.0) + elapsed - self._nested_seconds
+                self._nested_seconds = None if outer_nested is None else outer_nested + elapsed
+                if monitor is not None:
+                    monitor.exit(phase)
+        return wrapper
+    return decorator
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else str(bound)
+
+
+class BuildMetrics:
+    """Counters and histograms of finished builds
+
+    ``record`` is called once per finished build job. ``render`` returns
+    the metrics in the Prometheus text format, plus any gauges passed in.
+    """
+
+    def __init__(self, prefix: str = 'h5p'):
+        self.prefix = prefix
+        self.builds: Dict[str, int] = {}
+        self.failures: Dict[str, int] = {}
+        self.phase_seconds: Dict[str, Histogram] = {}
+        self.phase_peak_rss: Dict[str, Histogram] = {}
+        self.upload_bytes = Histogram(BYTES_BUCKETS)
+        self.package_bytes = Histogram(BYTES_BUCKETS)
+        self.slides_total = 0
+        self.reader_reopens_total = 0
+        self.cache: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, status: str, timings: Dict[str, float], upload_bytes: int = 0,
+               package_bytes: int = 0, slides: int = 0, failed_phase: Optional[str] = None,
+               cache_hit: Optional[bool] = None, peak_rss: Optional[Dict[str, int]] = None,
+               reader_reopens: int = 0) -> None:
+        """Record one finished build; ``cache_hit`` is None when no cache was consulted
+
+        ``peak_rss`` maps phases to their peak resident memory in bytes, and
+        ``reader_reopens`` counts the PDF reader reopens under a memory budget.
+        """
+        with self._lock:
+            if cache_hit is not None:
+                result = 'hit' if cache_hit else 'miss'
+                self.cache[result] = self.cache.get(result, 0) + 1
+            self.builds[status] = self.builds.get(status, 0) + 1
+            if failed_phase:
+                self.failures[failed_phase] = self.failures.get(failed_phase, 0) + 1
+            for phase, seconds in timings.items():
+                self.phase_seconds.setdefault(phase, Histogram(PHASE_SECONDS_BUCKETS)).observe(seconds)
+            for phase, rss in (peak_rss or {}).items():
+                self.phase_peak_rss.setdefault(phase, Histogram(RSS_BYTES_BUCKETS)).observe(rss)
+            if upload_bytes:
+                self.upload_bytes.observe(upload_bytes)
+            if package_bytes:
+                self.package_bytes.observe(package_bytes)
+            self.slides_total += slides
+            self.reader_reopens_total += reader_reopens
+
+    def render(self, gauges: Optional[Dict[str, Tuple[str, Dict[str, float]]]] = None) -> str:
+        """Return all metrics in the Prometheus text exposition format
+
+        ``gauges`` maps a metric name to (help text, {label value: value})
+        for values sampled at scrape time, e.g. jobs by status.
+        """
+        lines = []
+
+        def header(name: str, kind: str, help_text: str) -> str:
+            lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+            return f"{self.prefix}_{name}"
+
+        def histogram(metric: str, values: Histogram, labels: Dict[str, str]) -> None:
+            for bound, count in zip(values.buckets, values.counts):
+                lines.append(f"{metric}_bucket{format_labels({**labels, 'le': format_bound(bound)})} {count}")
+            lines.append(f"{metric}_bucket{format_labels({**labels, 'le': '+Inf'})} {values.count}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {round(values.sum, 6)}")
+            lines.append(f"{metric}_count{format_labels(labels)} {values.count}")
+
+        with self._lock:
+            metric = header('builds_total', 'counter', 'Finished builds by status')
+            for status, count in sorted(self.builds.items()):
+                lines.append(f"{metric}{format_labels({'status': status})} {count}")
+
+            metric = header('build_failures_total', 'counter', 'Failed builds by the phase that failed')
+            for phase, count in sorted(self.failures.items()):
+                lines.append(f"{metric}{format_labels({'phase': phase})} {count}")
+
+            metric = header('phase_seconds', 'histogram', 'Time spent in each build phase')
+            for phase, values in sorted(self.phase_seconds.items()):
+                histogram(metric, values, {'phase': phase})
+
+            metric = header('phase_peak_rss_bytes', 'histogram', 'Peak resident memory of each build phase')
+            for phase, values in sorted(self.phase_peak_rss.items()):
+                histogram(metric, values, {'phase': phase})
+
+            metric = header('upload_bytes', 'histogram', 'Size of the uploaded PDF and PPTX per build')
+            histogram(metric, self.upload_bytes, {})
+
+            metric = header('package_bytes', 'histogram', 'Size of the finished H5P packages')
+            histogram(metric, self.package_bytes, {})
+
+            metric = header('slides_total', 'counter', 'Slides in successfully built packages')
+            lines.append(f"{metric} {self.slides_total}")
+
+            metric = header('pdf_reader_reopens_total', 'counter',
+                            'Source PDF reader reopens to stay under the memory budget')
+            lines.append(f"{metric} {self.reader_reopens_total}")
+
+            metric = header('result_cache_total', 'counter', 'Result cache lookups by outcome')
+            for result, count in sorted(self.cache.items()):
+                lines.append(f"{metric}{format_labels({'result': result})} {count}")
+
+        for name, (help_text, values) in (gauges or {}).items():
+            metric = header(name, 'gauge', help_text)
+            for label, value in sorted(values.items()):
+                lines.append(f"{metric}{format_labels({'status': label})} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def log_build(record: Dict) -> None:
+    """Log a finished build as a single JSON line"""
+    logger.info(json.dumps(record, sort_keys=True))
@@ -0,0 +1,147 @@
+"""
+Build Planner Helpers
+
+The cheap reads and the cost model behind a dry run
+(``H5PSlideDeckGenerator.plan_build``). The PDF is only read as far as
+its trailer and page tree, and notes documents only as far as the ZIP
+central directory; no page content, image or audio data is decoded.
+
+Build times come from rough single-core costs measured on the synthetic
+decks of ``benchmark.py`` (see the constants below). They are meant to
+tell a one-minute build from a one-hour build, not to predict seconds.
+"""
+
+import zipfile as zip
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from h5p_package import (CompressionPolicy, TemplateCache, list_template_files,
+                         read_library_index, template_fingerprint)
+from pdf_slides import MIN_PAGES_PER_RANGE, resolve_workers
+
+
+MB = 1024 * 1024
+
+# Seconds per unit of work on one core. Split, extract, notes and package
+# costs are medians of ``python benchmark.py --sizes 10,50,100,250 --repeat 3``;
+# the split cost is fitted as a fixed part (loading PyPDF2, reading the
+# xref) plus a part per page. Raster costs come from ``rasterise_pdf`` on
+# a 50-page benchmark deck at 150 DPI. Transcoding was not measured (it
+# needs ffmpeg) and is a guess.
+SPLIT_SECONDS_FIXED = 0.05
+SPLIT_SECONDS_PER_PAGE = 0.0012
+RASTER_SECONDS_PER_MEGAPIXEL = {'webp': 0.09, 'png': 0.10}
+EXTRACT_SECONDS_PER_MB = 0.015
+NOTES_SECONDS_PER_MB = 1.0
+TRANSCODE_SECONDS_PER_AUDIO_SECOND = 0.01
+PACKAGE_SECONDS_PER_MB = 0.015
+
+# Typical encoded size of a rasterised slide, per pixel
+IMAGE_BYTES_PER_PIXEL = {'webp': 0.15, 'png': 0.6}
+# content.json bytes per slide
+CONTENT_BYTES_PER_SLIDE = 2500
+
+# Points per inch in PDF user space
+POINTS_PER_INCH = 72
+
+
+def slide_ranges(slide_nums: Iterable[int]) -> str:
+    """Format slide numbers compactly, e.g. '1-4, 7, 9-12'"""
+    ranges = []
+    for slide_num in sorted(slide_nums):
+        if ranges and slide_num == ranges[-1][1] + 1:
+            ranges[-1][1] = slide_num
+        else:
+            ranges.append([slide_num, slide_num])
+    return ', '.join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+def pdf_page_info(pdf_path: Path) -> Tuple[int, Tuple[float, float]]:
+    """Return the page count and the first page's (width, height) in points
+
+    The count is the ``/Count`` of the page tree root; only the page tree
+    nodes leading to the first page are read.
+    """
+    from PyPDF2 import PdfReader
+
+    # An open file keeps PdfReader from reading the whole PDF into memory
+    with open(pdf_path, 'rb') as f:
+        reader = PdfReader(f)
+        if reader.is_encrypted and not reader.decrypt(''):
+            raise ValueError('PDF is encrypted')
+        node = reader.trailer['/Root']['/Pages']
+        count = int(node.get('/Count', 0))
+        media_box = node.get('/MediaBox')
+        while count and '/Kids' in node:
+            node = node['/Kids'][0].get_object()
+            media_box = node.get('/MediaBox', media_box)
+        if media_box is None:
+            return count, (0.0, 0.0)
+        left, bottom, right, top = (float(value) for value in media_box)
+        return count, (abs(right - left), abs(top - bottom))
+
+
+def check_notes_document(docx_path: Path) -> Optional[str]:
+    """Return why a notes document cannot be read, or None if it looks fine"""
+    from slide_notes import DOCUMENT_PART
+
+    try:
+        with zip.ZipFile(docx_path, 'r') as zipf:
+            if DOCUMENT_PART not in zipf.NameToInfo:
+                return 'Notes document has no word/document.xml'
+    except (OSError, zip.BadZipFile) as e:
+        return f"Cannot read notes document: {e}"
+    return None
+
+
+def library_bytes(template_dir: Path, cache_dir: Path, policy: CompressionPolicy,
+                  libraries: Optional[Iterable[str]] = None) -> int:
+    """Bytes the template libraries add to a package
+
+    Compressed sizes come from the template cache archive when it has
+    been built; otherwise the uncompressed file sizes are an upper bound.
+    ``libraries`` limits the count to those libraries.
+    """
+    directories = None
+    if libraries is not None:
+        index = read_library_index(template_dir)
+        directories = {index[name]['directory'] for name in libraries}
+
+    def wanted(rel_path: str) -> bool:
+        return directories is None or rel_path.split('/', 1)[0] in directories
+
+    archive_path = TemplateCache(template_dir, template_fingerprint(template_dir), cache_dir,
+                                 policy).archive_path
+    if archive_path.exists():
+        with zip.ZipFile(archive_path, 'r') as zipf:
+            return sum(info.compress_size for info in zipf.infolist() if wanted(info.filename))
+    return sum(stat.st_size for rel_path, stat in list_template_files(template_dir)
+               if wanted(rel_path))
+
+
+def image_megapixels(page_size: Tuple[float, float], dpi: int) -> float:
+    """Megapixels of a page of ``page_size`` points rasterised at ``dpi``"""
+    width, height = page_size
+    return (width / POINTS_PER_INCH * dpi) * (height / POINTS_PER_INCH * dpi) / 1e6
+
+
+def estimate_seconds(pages: int, page_size: Tuple[float, float], slide_format: str, dpi: int,
+                     workers: int, extract_bytes: int, notes_bytes: int, transcode_seconds: float,
+                     package_bytes: int) -> Dict[str, float]:
+    """Estimated seconds of each build phase and in total"""
+    # Splitting and encoding use up to ``workers`` processes or threads
+    split_workers = max(1, min(resolve_workers(workers), -(-pages // MIN_PAGES_PER_RANGE)))
+    if slide_format == 'pdf':
+        split = pages * SPLIT_SECONDS_PER_PAGE
+    else:
+        split = pages * image_megapixels(page_size, dpi) * RASTER_SECONDS_PER_MEGAPIXEL[slide_format]
+    seconds = {
+        'split': SPLIT_SECONDS_FIXED + split / split_workers,
+        'extract': extract_bytes / MB * EXTRACT_SECONDS_PER_MB,
+        'notes': notes_bytes / MB * NOTES_SECONDS_PER_MB,
+        'transcode': transcode_seconds * TRANSCODE_SECONDS_PER_AUDIO_SECOND / resolve_workers(workers),
+        'package': package_bytes / MB * PACKAGE_SECONDS_PER_MB,
+    }
+    seconds = {phase: round(value, 3) for phase, value in seconds.items()}
+    seconds['total'] = round(sum(seconds.values()), 3)
+    return seconds
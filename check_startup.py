@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Startup Budget Check
+
+Imports each entry-point module in a fresh interpreter under
+``python -X importtime`` and fails when an import takes longer than its
+budget, loads one of the heavy libraries that should only be imported on
+the paths that use them, or creates directories as a side effect.
+
+Run it before merging changes to module-level imports:
+
+    python check_startup.py
+"""
+
+import os
+import sys
+import json
+import subprocess
+import click
+from typing import Dict, List, Tuple
+
+
+# Entry points and their import budgets in milliseconds (best of --runs)
+IMPORT_BUDGETS = {
+    'config': 20,
+    'SD_Generator': 200,
+    'batch_build': 200,
+}
+
+# Loaded by the functions that use them, never on import of an entry point
+LAZY_MODULES = ('PyPDF2', 'docx', 'PIL', 'tqdm', 'pymupdf')
+
+# Runs in the child interpreter: imports the module and reports what it did
+PROBE = """
+import os, sys, json
+def folders():
+    return {root for root, _, _ in os.walk('00_Output')}
+before = folders()
+import %s
+print(json.dumps({'modules': sorted(sys.modules), 'created': sorted(folders() - before)}))
+"""
+
+
+def measure_import(module: str) -> Tuple[float, Dict]:
+    """Import ``module`` in a fresh interpreter
+
+    Returns the cumulative import time in milliseconds and the probe
+    report (loaded modules and directories created by the import).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE % module],
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()}")
+
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module and not parts[2][1:].startswith(' '):
+            cumulative_us = int(parts[1])
+    return cumulative_us / 1000, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_module(module: str, budget_ms: float, runs: int) -> List[str]:
+    """Return the budget and side-effect violations of one entry point"""
+    timings = []
+    for _ in range(runs):
+        elapsed_ms, report = measure_import(module)
+        timings.append(elapsed_ms)
+    best_ms = min(timings)
+
+    problems = []
+    if best_ms > budget_ms:
+        problems.append(f"import took {best_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    loaded = [name for name in LAZY_MODULES if name in report['modules']]
+    if loaded:
+        problems.append(f"imports {', '.join(loaded)} eagerly")
+    if report['created']:
+        problems.append(f"created {', '.join(report['created'])} on import")
+
+    style = 'red' if problems else 'green'
+    mark = '✗' if problems else '✓'
+    click.echo(click.style(f"{mark} {module}: {best_ms:.0f} ms", fg=style))
+    for problem in problems:
+        click.echo(click.style(f"    {problem}", fg=style))
+    return problems
+
+
+@click.command()
+@click.option('--runs', '-n', type=click.IntRange(min=1), default=3, show_default=True,
+              help='Imports per module; the fastest counts')
+@click.option('--scale', '-s', type=click.FloatRange(min=0, min_open=True), default=1.0,
+              show_default=True, help='Multiply every budget, e.g. on slow CI machines')
+def check(runs, scale):
+    """Check the import time and side effects of the entry-point modules"""
+    failed = 0
+    for module, budget_ms in IMPORT_BUDGETS.items():
+        failed += bool(check_module(module, budget_ms * scale, runs))
+    if failed:
+        click.echo(click.style(f"{failed} of {len(IMPORT_BUDGETS)} modules over budget", fg='red'))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    check()
@@ -0,0 +1,296 @@
+"""
+Chunked Uploads
+
+Resumable uploads for large decks. A client opens an upload session with
+the file name and size, then sends the file in sequential chunks. Each
+chunk is streamed straight to disk and into a SHA-256 digest, so neither
+the file nor a chunk is ever held in memory. After a dropped connection
+the client asks for the received offset and carries on from there.
+
+PDF uploads also get a page count while they arrive. It is exact for
+linearized PDFs, whose first bytes give the page count. Otherwise it is
+an estimate from the page objects seen so far. It becomes exact shortly
+after the upload completes, when a background thread has read the page
+tree root of the complete file.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER = 64 * 1024
+
+# ``/N`` of the linearization dictionary at the start of a linearized PDF
+LINEARIZED_PAGES = re.compile(rb'/Linearized\b.{0,512}?/N\s+(\d+)', re.DOTALL)
+# An uncompressed page object (``/Type /Page``, not ``/Pages``)
+PAGE_OBJECT = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+# Bytes carried over between chunks so a token split by a chunk boundary is still found
+SCAN_OVERLAP = 32
+
+
+class UploadError(Exception):
+    """A chunk that cannot be accepted; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class PageCounter:
+    """Counts the pages of a PDF as its bytes arrive"""
+
+    def __init__(self):
+        self.pages = 0
+        self.exact = False
+        self._head = b''
+        self._tail = b''
+
+    def feed(self, data: bytes) -> None:
+        if self.exact:
+            return
+        if len(self._head) < 1024:
+            self._head += data[:1024 - len(self._head)]
+            match = LINEARIZED_PAGES.search(self._head)
+            if match:
+                self.pages, self.exact = int(match.group(1)), True
+                return
+        window = self._tail + data
+        # Matches ending inside the overlap were counted last time; a match
+        # touching the end of the window waits for the next byte, which
+        # tells ``/Page`` from ``/Pages``
+        self.pages += sum(1 for match in PAGE_OBJECT.finditer(window)
+                          if len(self._tail) <= match.end() < len(window))
+        self._tail = window[-SCAN_OVERLAP:]
+
+    def finish(self, path: Path) -> None:
+        """Replace the estimate with the real page count of the complete file
+
+        The count is read on a background thread, so the request sending
+        the last chunk does not wait for it. The file is opened here, so
+        the upload can be claimed (moved) in the meantime.
+        """
+        try:
+            f = open(path, 'rb')
+        except OSError as e:
+            logger.warning(f"Could not count pages of {path.name}: {e}")
+            return
+        threading.Thread(target=self._count, args=(f, path.name), name='page-count',
+                         daemon=True).start()
+
+    def _count(self, f: BinaryIO, name: str) -> None:
+        from PyPDF2 import PdfReader
+
+        try:
+            # An open file keeps PdfReader from reading the whole PDF into
+            # memory, and only the trailer and page tree root are parsed
+            with f:
+                pages = int(PdfReader(f).trailer['/Root']['/Pages']['/Count'])
+            self.pages, self.exact = pages, True
+        except Exception as e:
+            logger.warning(f"Could not count pages of {name}: {e}")
+
+
+class UploadSession:
+    """One resumable upload in ``<root>/<id>/``
+
+    ``data`` holds the bytes received so far and ``upload.json`` the
+    declared name, kind and size. The digest and page count are kept in
+    memory and rebuilt from ``data`` if the process restarted mid-upload.
+    """
+
+    def __init__(self, directory: Path, filename: str, kind: str, size: int,
+                 created: Optional[float] = None):
+        self.directory = Path(directory)
+        self.id = self.directory.name
+        self.filename = filename
+        self.kind = kind
+        self.size = size
+        self.created = created or time.time()
+        self.data_path = self.directory / 'data'
+        self.lock = threading.Lock()
+        self._digest = hashlib.sha256()
+        self._hashed = 0
+        self._pages = PageCounter() if kind == 'pdf' else None
+
+    @classmethod
+    def create(cls, root: Path, filename: str, kind: str, size: int) -> 'UploadSession':
+        session = cls(Path(root) / uuid.uuid4().hex, filename, kind, size)
+        session.directory.mkdir(parents=True)
+        session.data_path.touch()
+        with open(session.directory / 'upload.json', 'w', encoding='utf-8') as f:
+            json.dump({'filename': filename, 'kind': kind, 'size': size, 'created': session.created}, f)
+        return session
+
+    @classmethod
+    def load(cls, directory: Path) -> 'UploadSession':
+        with open(Path(directory) / 'upload.json', 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return cls(directory, state['filename'], state['kind'], state['size'], state['created'])
+
+    @property
+    def offset(self) -> int:
+        """Bytes received so far"""
+        return self.data_path.stat().st_size
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.size
+
+    def _update(self, data: bytes) -> None:
+        self._digest.update(data)
+        self._hashed += len(data)
+        if self._pages is not None:
+            self._pages.feed(data)
+
+    def _catch_up(self) -> None:
+        """Hash bytes on disk that this process has not seen (after a restart)"""
+        if self._hashed == self.offset:
+            return
+        with open(self.data_path, 'rb') as f:
+            f.seek(self._hashed)
+            for data in iter(lambda: f.read(COPY_BUFFER), b''):
+                self._update(data)
+
+    def write_chunk(self, start: int, stream: BinaryIO, length: int) -> int:
+        """Append ``length`` bytes read from ``stream`` at ``start``; returns the new offset
+
+        A chunk that was already received (a retry after a lost response)
+        is read and discarded. A chunk beyond the current offset is
+        rejected with the offset the client should resume from.
+        """
+        with self.lock:
+            offset = self.offset
+            if start + length <= offset:
+                while stream.read(COPY_BUFFER):
+                    pass
+                return offset
+            if start != offset:
+                raise UploadError(f"Expected a chunk starting at byte {offset}", 409)
+            if start + length > self.size:
+                raise UploadError(f"Chunk ends past the declared size of {self.size} bytes")
+
+            self._catch_up()
+            received = 0
+            with open(self.data_path, 'ab') as f:
+                while received < length:
+                    data = stream.read(min(COPY_BUFFER, length - received))
+                    if not data:
+                        break
+                    f.write(data)
+                    self._update(data)
+                    received += len(data)
+            if received < length:
+                # Connection dropped mid-chunk; keep what arrived, the client resumes from it
+                raise UploadError(f"Chunk ended after {received} of {length} bytes", 400)
+
+            if self.complete and self._pages is not None:
+                self._pages.finish(self.data_path)
+            return self.offset
+
+    @property
+    def sha256(self) -> Optional[str]:
+        """Hex digest of the complete file"""
+        if not self.complete:
+            return None
+        with self.lock:
+            self._catch_up()
+            return self._digest.hexdigest()
+
+    def to_dict(self) -> Dict:
+        status = {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'kind': self.kind,
+            'size': self.size,
+            'offset': self.offset,
+            'complete': self.complete,
+            'sha256': self.sha256,
+        }
+        if self._pages is not None:
+            with self.lock:
+                self._catch_up()
+                status.update(pages=self._pages.pages, pages_exact=self._pages.exact)
+        return status
+
+
+class UploadStore:
+    """The upload sessions under ``root``
+
+    Sessions that receive no chunk for ``ttl`` seconds are deleted.
+    """
+
+    def __init__(self, root: Path, max_size: int, ttl: float = 24 * 3600):
+        self.root = Path(root)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename: str, kind: str, size: int) -> UploadSession:
+        if size <= 0:
+            raise UploadError('Upload size must be positive')
+        if size > self.max_size:
+            raise UploadError(f"File is larger than the {self.max_size // (1024 * 1024)} MB limit", 413)
+        self.expire()
+        session = UploadSession.create(self.root, filename, kind, size)
+        with self._lock:
+            self.sessions[session.id] = session
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        """Return a session, reloading it from disk after a restart"""
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+            return None
+        with self._lock:
+            session = self.sessions.get(upload_id)
+            if session is None and (self.root / upload_id / 'upload.json').exists():
+                session = self.sessions[upload_id] = UploadSession.load(self.root / upload_id)
+        return session
+
+    def completed(self, upload_id: str, kind: str) -> UploadSession:
+        """Return a complete upload of ``kind``, or raise UploadError"""
+        session = self.get(upload_id)
+        if session is None or session.kind != kind:
+            raise UploadError(f"Unknown {kind} upload", 404)
+        if not session.complete:
+            raise UploadError(f"The {kind} upload is not complete", 409)
+        return session
+
+    def claim(self, upload_id: str, kind: str, destination: Path) -> str:
+        """Move a complete upload to ``destination`` and forget the session
+
+        Returns the SHA-256 hex digest of the file.
+        """
+        session = self.completed(upload_id, kind)
+        sha256 = session.sha256
+        with self._lock:
+            self.sessions.pop(upload_id, None)
+        os.replace(session.data_path, destination)
+        shutil.rmtree(session.directory, ignore_errors=True)
+        return sha256
+
+    def expire(self) -> None:
+        """Delete sessions idle for longer than the time-to-live"""
+        cutoff = time.time() - self.ttl
+        if not self.root.exists():
+            return
+        for directory in self.root.iterdir():
+            try:
+                expired = (directory / 'data').stat().st_mtime < cutoff
+            except FileNotFoundError:
+                continue
+            if expired:
+                with self._lock:
+                    self.sessions.pop(directory.name, None)
+                shutil.rmtree(directory, ignore_errors=True)
@@ -16,9 +16,9 @@ PDF_DOC = os.path.join(OUTPUT_DIR, f"{PROJECT_NAME}.pdf")
 
 
 def create_directories():
-    """Create all necessary directories"""
+    """Create the default project's output and audio directories
+
+    Not called on import, so importing config never touches the filesystem.
+    """
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     os.makedirs(VO_DIR, exist_ok=True)
-
-# Create directories on import
-create_directories()
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""
+Gunicorn Settings
+
+Build jobs, chunked uploads and metrics are kept in the app process, so
+the app runs as one worker process with several threads. Gunicorn loads
+this file from the working directory; more workers, from ``-w`` or
+``WEB_CONCURRENCY``, stop the server at startup.
+"""
+
+import sys
+
+bind = '0.0.0.0:8000'
+workers = 1
+threads = 8
+
+
+def on_starting(server):
+    if server.cfg.workers > 1:
+        server.log.error(f"The app must run as a single worker process (got {server.cfg.workers}); "
+                         f"use --threads for concurrency")
+        sys.exit(1)
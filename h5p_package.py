@@ -0,0 +1,543 @@
+"""
+H5P Package Helpers
+
+Builds the library part of the SlideDeck template once and splices the
+already-compressed entries into every generated .h5p package, and streams
+the per-build entries straight into the destination archive. Slide media
+is named by content hash so identical files are stored once.
+
+Only the libraries a package's content needs are spliced in: the
+``preloadedDependencies`` of the libraries named in content.json, without
+editor widgets or sub-content types the content does not use.
+"""
+
+import io
+import os
+import re
+import copy
+import json
+import time
+import struct
+import hashlib
+import threading
+import zipfile as zip
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+# Size of the fixed part of a ZIP local file header
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_STRUCT = struct.Struct('<4s5H3L2H')
+
+# Media formats that are already compressed; DEFLATE only costs CPU on them
+STORED_EXTENSIONS = {
+    '.mp3', '.m4a', '.aac', '.ogg', '.mp4', '.webm',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp',
+    '.woff', '.woff2',
+}
+
+# Compression profiles selectable from the CLI and the generator
+COMPRESSION_PROFILES = {
+    # Fastest builds: PDFs stored as-is, text formats at the lowest DEFLATE level
+    'speed': {'level': 1, 'store_pdf': True},
+    # Default: PDFs and text formats deflated at zlib's default level
+    'balanced': {'level': 6, 'store_pdf': False},
+    # Smallest packages: everything compressible at the highest level
+    'size': {'level': 9, 'store_pdf': False},
+}
+DEFAULT_COMPRESSION_PROFILE = 'balanced'
+
+# A library reference in content.json, e.g. "H5P.Image 1.1"
+LIBRARY_STRING = re.compile(r'^(\S+) (\d+)\.(\d+)$')
+
+# Process-wide caches, shared by every generator instance
+_fingerprint_memo: Dict[Tuple, str] = {}
+_template_caches: Dict[Tuple[str, str], 'TemplateCache'] = {}
+_cache_lock = threading.Lock()
+
+
+def is_library_path(rel_path: str) -> bool:
+    """Check whether a template path belongs to a library directory
+
+    Root files (h5p.json) and the content directory change with every build
+    and are never part of the cached archive.
+    """
+    parts = Path(rel_path).parts
+    return len(parts) > 1 and parts[0] != 'content'
+
+
+def list_template_files(template_dir: Path) -> List[Tuple[str, os.stat_result]]:
+    """List all library files of a template as (relative path, stat) pairs"""
+    entries = []
+    for root, dirs, files in os.walk(template_dir):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            rel_path = Path(os.path.relpath(file_path, template_dir)).as_posix()
+            if is_library_path(rel_path):
+                entries.append((rel_path, os.stat(file_path)))
+    return entries
+
+
+def template_fingerprint(template_dir: Path) -> str:
+    """Return a content hash of the template library files
+
+    The hash covers relative paths and file bytes. It is memoised on the
+    path, size and mtime of every file so repeated builds only pay for a
+    directory walk.
+    """
+    template_dir = Path(template_dir)
+    entries = list_template_files(template_dir)
+    stat_key = (str(template_dir),) + tuple(
+        (rel_path, st.st_size, st.st_mtime_ns) for rel_path, st in entries
+    )
+
+    with _cache_lock:
+        cached = _fingerprint_memo.get(stat_key)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    for rel_path, _ in entries:
+        digest.update(rel_path.encode('utf-8') + b'\0')
+        with open(template_dir / rel_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    fingerprint = digest.hexdigest()
+
+    with _cache_lock:
+        _fingerprint_memo[stat_key] = fingerprint
+    return fingerprint
+
+
+def library_string(dependency: Dict) -> str:
+    """Return ``"<machineName> <major>.<minor>"`` for a library or dependency entry"""
+    return f"{dependency['machineName']} {dependency['majorVersion']}.{dependency['minorVersion']}"
+
+
+def read_library_index(template_dir: Path) -> Dict[str, Dict]:
+    """Map each library of a template to its directory and its preloaded and editor dependencies"""
+    index = {}
+    for library_dir in sorted(Path(template_dir).iterdir()):
+        library_json = library_dir / 'library.json'
+        if not library_json.is_file():
+            continue
+        with open(library_json, 'r', encoding='utf-8') as f:
+            library = json.load(f)
+        index[library_string(library)] = {
+            'directory': library_dir.name,
+            'machineName': library['machineName'],
+            'majorVersion': library['majorVersion'],
+            'minorVersion': library['minorVersion'],
+            'dependencies': [library_string(dependency)
+                             for dependency in library.get('preloadedDependencies', [])],
+            'editor_dependencies': [library_string(dependency)
+                                    for dependency in library.get('editorDependencies', [])],
+        }
+    return index
+
+
+def content_libraries(content) -> Set[str]:
+    """Return the library strings referenced anywhere in a content.json structure"""
+    libraries = set()
+    if isinstance(content, dict):
+        library = content.get('library')
+        if isinstance(library, str) and LIBRARY_STRING.match(library):
+            libraries.add(library)
+        for value in content.values():
+            libraries |= content_libraries(value)
+    elif isinstance(content, list):
+        for value in content:
+            libraries |= content_libraries(value)
+    return libraries
+
+
+def resolve_libraries(index: Dict[str, Dict], roots: Iterable[str],
+                      editor: bool = True) -> Tuple[List[str], Set[str]]:
+    """Return the dependency closure of ``roots``
+
+    Walks the ``preloadedDependencies`` and, with ``editor``, the
+    ``editorDependencies`` of every library reached. H5P rejects a package
+    declaring a dependency that is neither in it nor installed, so the
+    whole closure is packaged; only libraries nothing in it references are
+    left out. Returns the libraries found in ``index`` with dependencies
+    before the libraries using them, and the names of dependencies the
+    template does not contain, which the LMS must provide.
+    """
+    ordered: List[str] = []
+    missing: Set[str] = set()
+    seen: Set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in seen:
+            return
+        seen.add(name)
+        library = index.get(name)
+        if library is None:
+            missing.add(name)
+            return
+        for dependency in library['dependencies']:
+            visit(dependency)
+        if editor:
+            for dependency in library['editor_dependencies']:
+                visit(dependency)
+        ordered.append(name)
+
+    for root in roots:
+        visit(root)
+    return ordered, missing
+
+
+def main_library(index: Dict[str, Dict], machine_name: str) -> Optional[str]:
+    """Return the newest version of ``machine_name`` in ``index``"""
+    versions = [(library['majorVersion'], library['minorVersion'], name)
+                for name, library in index.items() if library['machineName'] == machine_name]
+    return max(versions)[2] if versions else None
+
+
+def read_raw_entry(f, info: zip.ZipInfo) -> bytes:
+    """Read the compressed payload of ``info`` from the open archive file ``f``"""
+    f.seek(info.header_offset)
+    header = LOCAL_HEADER_STRUCT.unpack(f.read(LOCAL_HEADER_SIZE))
+    name_length, extra_length = header[-2], header[-1]
+    f.seek(name_length + extra_length, os.SEEK_CUR)
+    return f.read(info.compress_size)
+
+
+def read_raw_entries(archive_path: Path) -> List[Tuple[zip.ZipInfo, bytes]]:
+    """Read the compressed payload of every entry in a ZIP archive"""
+    with zip.ZipFile(archive_path, 'r') as archive, open(archive_path, 'rb') as f:
+        return [(info, read_raw_entry(f, info)) for info in archive.infolist()]
+
+
+def write_raw_entry(zipf: zip.ZipFile, info: zip.ZipInfo, raw: bytes) -> None:
+    """Append an already-compressed entry to an open ZipFile
+
+    The payload is copied as-is, so CRC, sizes and compression method are
+    taken from ``info``. Works for seekable files and write-only streams.
+    """
+    info = copy.copy(info)
+    info.flag_bits &= ~0x08  # sizes are known, no data descriptor needed
+    info.extra = b''
+    with zipf._lock:
+        if zipf._writing:
+            raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+        zipf._writecheck(info)
+        zipf._didModify = True
+        info.header_offset = zipf.fp.tell()
+        zipf.fp.write(info.FileHeader())
+        zipf.fp.write(raw)
+        zipf.filelist.append(info)
+        zipf.NameToInfo[info.filename] = info
+        zipf.start_dir = zipf.fp.tell()
+
+
+@contextmanager
+def open_source(source):
+    """Open a media source for binary reading
+
+    ``source`` is a file path or an object whose ``open()`` returns a
+    context manager yielding a binary stream (such as a PPTX ZipMember).
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as stream:
+            yield stream
+    else:
+        with source.open() as stream:
+            yield stream
+
+
+class BytesSource:
+    """In-memory media source, e.g. a slide PDF that never touched disk"""
+
+    def __init__(self, data: bytes, name: str = ''):
+        self.data = data
+        self.name = name
+
+    @contextmanager
+    def open(self):
+        """Open the data as a binary stream"""
+        yield io.BytesIO(self.data)
+
+
+def hash_source(source, chunk_size: int = 1024 * 1024) -> Tuple[str, int]:
+    """Return the SHA-256 hex digest and size of a media source"""
+    digest = hashlib.sha256()
+    size = 0
+    with open_source(source) as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class RawArchive:
+    """Read access to the compressed entries of an existing archive
+
+    Used to carry entries of a previous package over into a new one
+    without decompressing or recompressing them.
+    """
+
+    def __init__(self, archive_path: Path):
+        self.archive_path = Path(archive_path)
+        self.zipf = zip.ZipFile(self.archive_path, 'r')
+        self.f = open(self.archive_path, 'rb')
+
+    def __enter__(self) -> 'RawArchive':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.f.close()
+        self.zipf.close()
+
+    def get(self, arcname: str) -> Optional[zip.ZipInfo]:
+        """Return the entry called ``arcname``, if the archive has one"""
+        return self.zipf.NameToInfo.get(arcname)
+
+    def read_raw(self, info: zip.ZipInfo) -> bytes:
+        """Return the compressed payload of an entry"""
+        return read_raw_entry(self.f, info)
+
+
+class CompressionPolicy:
+    """Per-entry compression rules for a package
+
+    Already-compressed media is stored, PDFs depend on the profile and all
+    other entries (JSON, JS, CSS, SVG, ...) are deflated at the profile level.
+    """
+
+    def __init__(self, profile: str = DEFAULT_COMPRESSION_PROFILE, level: Optional[int] = None):
+        if profile not in COMPRESSION_PROFILES:
+            raise ValueError(f"Unknown compression profile: {profile}")
+        settings = COMPRESSION_PROFILES[profile]
+        self.profile = profile
+        self.level = settings['level'] if level is None else level
+        self.store_pdf = settings['store_pdf']
+
+    @property
+    def key(self) -> str:
+        """Short identifier used to key caches built with this policy"""
+        return f"{'s' if self.store_pdf else 'd'}{self.level}"
+
+    def for_name(self, arcname: str) -> Tuple[int, Optional[int]]:
+        """Return (compress_type, compresslevel) for an archive entry"""
+        extension = os.path.splitext(arcname)[1].lower()
+        if extension in STORED_EXTENSIONS or (extension == '.pdf' and self.store_pdf):
+            return zip.ZIP_STORED, None
+        return zip.ZIP_DEFLATED, self.level
+
+    def zip_info(self, arcname: str) -> zip.ZipInfo:
+        """Create a ZipInfo for a new entry with this policy applied"""
+        info = zip.ZipInfo(arcname, date_time=_now())
+        info.compress_type, level = self.for_name(arcname)
+        info._compresslevel = level
+        return info
+
+
+class TemplateCache:
+    """Compressed library entries of a template directory
+
+    The libraries are compressed once per compression policy into
+    ``<cache_dir>/template-<hash>-<policy>.zip`` and kept in memory afterwards. ``splice_into`` copies the compressed
+    bytes into a new package without recompressing anything.
+    """
+
+    def __init__(self, template_dir: Path, fingerprint: str, cache_dir: Path,
+                 policy: CompressionPolicy):
+        self.template_dir = Path(template_dir)
+        self.fingerprint = fingerprint
+        self.cache_dir = Path(cache_dir)
+        self.policy = policy
+        self.archive_path = self.cache_dir / f"template-{fingerprint[:16]}-{policy.key}.zip"
+        self.entries: List[Tuple[zip.ZipInfo, bytes]] = []
+        # Library string -> directory, dependencies and sub-content options
+        self.libraries: Dict[str, Dict] = {}
+
+    @classmethod
+    def get(cls, template_dir: Path, cache_dir: Path,
+            policy: Optional[CompressionPolicy] = None) -> 'TemplateCache':
+        """Return the cache for the current template contents, building it if needed"""
+        policy = policy or CompressionPolicy()
+        fingerprint = template_fingerprint(template_dir)
+        with _cache_lock:
+            cache = _template_caches.get((fingerprint, policy.key))
+            if cache is None:
+                cache = cls(template_dir, fingerprint, cache_dir, policy)
+                cache.load()
+                _template_caches[(fingerprint, policy.key)] = cache
+        return cache
+
+    def load(self) -> None:
+        """Load the cached archive, building it first if it does not exist"""
+        if not self.archive_path.exists():
+            self.build()
+        self.entries = read_raw_entries(self.archive_path)
+        self.libraries = read_library_index(self.template_dir)
+
+    def build(self) -> None:
+        """Compress the template libraries into the cache archive"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write to a private file first so concurrent builders never see a partial archive
+        temp_path = self.archive_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with zip.ZipFile(temp_path, 'w', zip.ZIP_DEFLATED) as zipf:
+                for rel_path, _ in list_template_files(self.template_dir):
+                    compress_type, level = self.policy.for_name(rel_path)
+                    zipf.write(self.template_dir / rel_path, rel_path,
+                               compress_type=compress_type, compresslevel=level)
+            os.replace(temp_path, self.archive_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    @property
+    def compressed_size(self) -> int:
+        """Total size of the compressed library payloads"""
+        return sum(info.compress_size for info, _ in self.entries)
+
+    def resolve(self, content: Dict, main_machine_name: str,
+                editor: bool = True) -> Tuple[List[str], Set[str]]:
+        """Return the libraries ``content`` needs and the dependencies missing from the template
+
+        Without ``editor`` only the preloaded dependencies are followed.
+        """
+        roots = sorted(content_libraries(content))
+        main = main_library(self.libraries, main_machine_name)
+        return resolve_libraries(self.libraries, ([main] if main else []) + roots, editor)
+
+    def splice_into(self, zipf: zip.ZipFile, libraries: Optional[Iterable[str]] = None) -> int:
+        """Copy cached library entries into ``zipf``, returning the entry count
+
+        With ``libraries``, only the entries of those libraries are copied.
+        """
+        directories = None
+        if libraries is not None:
+            directories = {self.libraries[name]['directory'] for name in libraries}
+        count = 0
+        for info, raw in self.entries:
+            if directories is None or info.filename.split('/', 1)[0] in directories:
+                write_raw_entry(zipf, info, raw)
+                count += 1
+        return count
+
+
+class H5PPackageWriter:
+    """Streams an .h5p package straight into its destination
+
+    ``destination`` is a file path or any writable file-like object. Entries
+    are written directly into the archive, no staging directory is used, and
+    each entry is compressed according to ``policy``.
+
+    Slide media added with ``add_media`` is content-addressed: the entry is
+    named after the hash of its bytes and written only once, however many
+    slides use it.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+    # Hex digits of the content hash kept in media file names
+    HASH_LENGTH = 16
+
+    def __init__(self, destination, policy: Optional[CompressionPolicy] = None):
+        self.destination = destination
+        self.policy = policy or CompressionPolicy()
+        self.zipf = zip.ZipFile(destination, 'w', zip.ZIP_DEFLATED)
+        # Content hash -> path relative to content/
+        self.media_paths: Dict[str, str] = {}
+        # Media source -> (content hash, size), so a shared source is hashed once
+        self._source_digests: Dict[object, Tuple[str, int]] = {}
+        self.dedup_count = 0
+        self.dedup_bytes = 0
+
+    def __enter__(self) -> 'H5PPackageWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Write the central directory and close the archive"""
+        self.zipf.close()
+
+    def add_template(self, template_cache: TemplateCache,
+                     libraries: Optional[Iterable[str]] = None) -> int:
+        """Splice the cached template libraries, or only ``libraries``, into the package"""
+        return template_cache.splice_into(self.zipf, libraries)
+
+    def add_file(self, arcname: str, path: Path) -> None:
+        """Add a file from disk"""
+        compress_type, level = self.policy.for_name(arcname)
+        self.zipf.write(path, arcname, compress_type=compress_type, compresslevel=level)
+
+    def add_stream(self, arcname: str, stream) -> None:
+        """Add the contents of a readable binary stream, copied in chunks"""
+        info = self.policy.zip_info(arcname)
+        with self.zipf.open(info, 'w') as entry:
+            for chunk in iter(lambda: stream.read(self.CHUNK_SIZE), b''):
+                entry.write(chunk)
+
+    def source_digest(self, source) -> Tuple[str, int]:
+        """Return (content hash, size) of a media source, hashing it at most once"""
+        if source not in self._source_digests:
+            self._source_digests[source] = hash_source(source, self.CHUNK_SIZE)
+        return self._source_digests[source]
+
+    def add_media(self, folder: str, prefix: str, source, extension: str) -> str:
+        """Add slide media under ``content/<folder>/``, named by its content hash
+
+        Returns the path relative to ``content/`` to reference from
+        content.json. Media identical to an earlier entry is not written
+        again; the earlier path is returned and the bytes are counted in
+        ``dedup_bytes``.
+        """
+        digest, size = self.source_digest(source)
+
+        media_path = self.media_paths.get(digest)
+        if media_path is not None:
+            self.dedup_count += 1
+            self.dedup_bytes += size
+            return media_path
+
+        media_path = f"{folder}/{prefix}-{digest[:self.HASH_LENGTH]}{extension}"
+        with open_source(source) as stream:
+            self.add_stream(f"content/{media_path}", stream)
+        self.media_paths[digest] = media_path
+        return media_path
+
+    def copy_media(self, archive: RawArchive, media_path: str, digest: str) -> Optional[str]:
+        """Copy media with a known content hash from an earlier package
+
+        The compressed entry is spliced in as-is and, like ``add_media``,
+        only once per hash. Returns the path relative to ``content/``, or
+        None when ``archive`` has no such entry and the caller must add the
+        media from its source instead.
+        """
+        info = archive.get(f"content/{media_path}")
+        if info is None:
+            return None
+
+        if digest in self.media_paths:
+            self.dedup_count += 1
+            self.dedup_bytes += info.file_size
+            return self.media_paths[digest]
+
+        write_raw_entry(self.zipf, info, archive.read_raw(info))
+        self.media_paths[digest] = media_path
+        return media_path
+
+    def add_bytes(self, arcname: str, data: bytes) -> None:
+        """Add an in-memory file"""
+        self.zipf.writestr(self.policy.zip_info(arcname), data)
+
+    def add_json(self, arcname: str, data, **dump_kwargs) -> None:
+        """Serialise ``data`` as JSON and add it to the package"""
+        self.add_bytes(arcname, json.dumps(data, **dump_kwargs).encode('utf-8'))
+
+
+def _now() -> Tuple[int, int, int, int, int, int]:
+    """Current local time in the ZIP date_time format"""
+    return time.localtime(time.time())[:6]
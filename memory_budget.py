@@ -0,0 +1,68 @@
+"""
+Memory Budget
+
+A resident memory ceiling for memory-bounded builds. Under a budget the
+source PDF is read from disk as needed instead of being loaded whole,
+and whenever the process is over the ceiling the pipeline sheds what it
+can hold elsewhere: the PDF objects parsed so far are dropped by
+reopening the reader, MuPDF's object store is emptied, and slides of
+in-memory builds are spilled to files.
+
+The ceiling applies to each process on its own, so PDF split workers
+each get the full budget.
+"""
+
+from pathlib import Path
+from typing import Optional, Union
+
+from build_metrics import current_rss
+
+
+MB = 1024 * 1024
+# Share of the ceiling RSS must grow by before memory is shed again; RSS
+# seldom drops once objects are freed, so without it every step past the
+# ceiling would shed again
+SHED_GROWTH = 1 / 8
+
+
+class MemoryBudget:
+    """An RSS ceiling of ``limit_mb`` MB, spilling to ``spill_dir`` when it is reached
+
+    Plain values only, so it can be handed to worker processes.
+    """
+
+    def __init__(self, limit_mb: int, spill_dir: Path):
+        self.limit = limit_mb * MB
+        self.spill_dir = Path(spill_dir)
+        # Times the source PDF reader was reopened to drop parsed objects
+        self.reopens = 0
+
+    def __repr__(self) -> str:
+        return f"MemoryBudget({self.limit // MB} MB)"
+
+    def exceeded(self) -> bool:
+        """Whether the process is at or over the ceiling (never, where RSS is unknown)"""
+        rss: Optional[int] = current_rss()
+        return rss is not None and rss >= self.limit
+
+    def shed_point(self, baseline: Optional[int]) -> Optional[int]:
+        """Return the RSS if memory should be shed now, else None
+
+        That is when the process is over the ceiling and, if memory was
+        shed before at RSS ``baseline``, has grown well past it since.
+        """
+        rss = current_rss()
+        if rss is None or rss < self.limit:
+            return None
+        if baseline is not None and rss < baseline + self.limit * SHED_GROWTH:
+            return None
+        return rss
+
+    def keep(self, name: str, data: bytes) -> Union[bytes, Path]:
+        """Return ``data`` to keep in memory, or the file it was spilled to when over the ceiling"""
+        if not self.exceeded():
+            return data
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / name
+        path.write_bytes(data)
+        return path
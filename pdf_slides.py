@@ -0,0 +1,372 @@
+"""
+PDF Slide Helpers
+
+Splits a source PDF into one ``SlideN.pdf`` per page, either in the calling
+process or spread over a pool of worker processes, and either to disk or
+into memory. Optionally prunes the
+shared resource dictionaries so each slide only carries the fonts, images
+and other resources its own content uses.
+
+Pages can be fingerprinted by content, so an incremental build only
+rewrites the slides whose page actually changed.
+
+Under a ``MemoryBudget`` the source is read from an open file rather
+than loaded whole, the reader is reopened to drop the objects parsed so
+far whenever the process is over the ceiling, and in-memory slides are
+spilled to files.
+
+PyPDF2 is imported by the functions that need it, so the worker-count
+helpers can be used without loading it.
+"""
+
+import io
+import os
+import re
+import hashlib
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import (TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Set,
+                    Tuple, Union)
+
+if TYPE_CHECKING:
+    from PyPDF2 import PdfReader
+    from memory_budget import MemoryBudget
+
+# An in-memory slide: its bytes, or the file it was spilled to
+SlideData = Union[bytes, Path]
+
+
+# Pages handed to a worker at once; small enough to keep all workers busy
+# on short decks, large enough that each worker parses the source PDF rarely
+MIN_PAGES_PER_RANGE = 4
+
+# Resource categories whose entries are referenced by name from content streams
+PRUNABLE_RESOURCES = ('/Font', '/XObject', '/ExtGState', '/Pattern', '/Shading',
+                      '/ColorSpace', '/Properties')
+
+# Name tokens in a content stream, e.g. the ``/F1`` in ``/F1 12 Tf``
+NAME_TOKEN = re.compile(rb'/([^\s/\[\]<>(){}%]+)')
+# Resource names needing no #xx escapes; any other name is always kept
+SIMPLE_NAME = re.compile(r'^/[A-Za-z0-9_.+\-]+$')
+
+
+def slide_filename(page_num: int) -> str:
+    """Return the file name of the slide PDF for a zero-based page number"""
+    return f"Slide{page_num + 1}.pdf"
+
+
+def resolve_workers(workers: int) -> int:
+    """Turn a requested worker count into an actual one (0 means one per CPU)"""
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def page_ranges(total_pages: int, workers: int) -> List[Tuple[int, int]]:
+    """Divide ``total_pages`` pages into contiguous (start, stop) ranges for ``workers``
+
+    Every worker gets about two ranges so a slow range does not leave the
+    others idle at the end.
+    """
+    if total_pages <= 0:
+        return []
+    range_size = max(MIN_PAGES_PER_RANGE, -(-total_pages // (workers * 2)))
+    return [(start, min(start + range_size, total_pages))
+            for start in range(0, total_pages, range_size)]
+
+
+@contextmanager
+def open_reader(source_pdf: Path, budget: Optional['MemoryBudget'] = None) -> Iterator['PdfReader']:
+    """Open a reader on ``source_pdf``
+
+    PdfReader loads a PDF given by path into memory in one piece; under
+    a ``budget`` it reads from an open file instead.
+    """
+    from PyPDF2 import PdfReader
+
+    if budget is None:
+        yield PdfReader(source_pdf)
+        return
+    with open(source_pdf, 'rb') as f:
+        yield PdfReader(f)
+
+
+def iter_pages(source_pdf: Path, page_nums: Optional[Iterable[int]] = None,
+               budget: Optional['MemoryBudget'] = None, reader: Optional['PdfReader'] = None
+               ) -> Iterator[Tuple[int, 'PdfReader']]:
+    """Yield (zero-based page number, reader) for ``page_nums``, or every page
+
+    ``reader`` is used when given, else one is opened. Under a ``budget``
+    a fresh reader replaces it before the next page when the process is
+    over the ceiling, dropping every object parsed for earlier pages. After
+    a reopen RSS must grow again before the next one (see
+    ``MemoryBudget.shed_point``), so the xref is not re-parsed for every
+    page. Reopens are counted in ``budget.reopens``.
+    """
+    baseline = None
+    with ExitStack() as stack:
+        if reader is None:
+            reader = stack.enter_context(open_reader(source_pdf, budget))
+        if page_nums is None:
+            page_nums = range(len(reader.pages))
+        for done, page_num in enumerate(page_nums):
+            if done and budget is not None:
+                rss = budget.shed_point(baseline)
+                if rss is not None:
+                    baseline = rss
+                    budget.reopens += 1
+                    stack.close()
+                    reader = stack.enter_context(open_reader(source_pdf, budget))
+            yield page_num, reader
+
+
+def page_fingerprint(page) -> str:
+    """Return a hash of everything that can change how a page looks
+
+    Covers the page dictionary, its content streams and every object they
+    reach (fonts, images, forms, ...), but not object numbers, so the same
+    page in a re-exported PDF keeps its fingerprint.
+    """
+    from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject
+
+    digest = hashlib.sha256()
+    seen: Set[Tuple[int, int]] = set()
+    pending = [page]
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key in seen:
+                digest.update(b'R')
+                continue
+            seen.add(key)
+            obj = obj.get_object()
+        if isinstance(obj, DictionaryObject):
+            digest.update(b'<<')
+            digest.update(getattr(obj, '_data', b'') or b'')
+            for key, value in sorted(obj.items(), reverse=True):
+                if key != '/Parent':
+                    pending.extend((value, NameObject(key)))
+        elif isinstance(obj, ArrayObject):
+            digest.update(b'[')
+            pending.extend(reversed(obj))
+        else:
+            digest.update(str(obj).encode('utf-8') + b' ')
+    return digest.hexdigest()
+
+
+def page_fingerprints(source_pdf: Path, budget: Optional['MemoryBudget'] = None) -> List[str]:
+    """Return the fingerprint of every page of ``source_pdf`` in order"""
+    return [page_fingerprint(reader.pages[page_num])
+            for page_num, reader in iter_pages(source_pdf, budget=budget)]
+
+
+def used_names(page) -> Set[str]:
+    """Return every name token (``/F1``, ``/Im3``, ...) in a page's content stream"""
+    contents = page.get_contents()
+    if contents is None:
+        return set()
+    return {'/' + token.decode('latin-1') for token in NAME_TOKEN.findall(contents.get_data())}
+
+
+def stream_bytes(objects: Iterable, seen: Set[Tuple[int, int]]) -> int:
+    """Sum the encoded stream sizes reachable from ``objects``
+
+    Indirect objects already in ``seen`` are skipped and new ones are added,
+    so an object shared between several roots is only counted once.
+    """
+    from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+
+    total = 0
+    pending = list(objects)
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key in seen:
+                continue
+            seen.add(key)
+            obj = obj.get_object()
+        if isinstance(obj, DictionaryObject):
+            total += len(getattr(obj, '_data', b'') or b'')
+            pending.extend(value for key, value in obj.items() if key != '/Parent')
+        elif isinstance(obj, ArrayObject):
+            pending.extend(obj)
+    return total
+
+
+def prune_resources(page) -> int:
+    """Drop resources that ``page``'s content stream never names
+
+    The source PDF often shares one resource dictionary between all pages,
+    so every slide would otherwise embed every font and image of the deck.
+    A new dictionary is attached to the page; the shared one is left alone.
+    Call this on the source page before it is added to a writer, which
+    would otherwise copy the unused objects along with it. Returns the
+    encoded stream bytes no longer referenced by the page.
+    """
+    from PyPDF2.generic import DictionaryObject, NameObject
+
+    resources = page.get('/Resources')
+    if resources is None:
+        return 0
+    resources = resources.get_object()
+    names = used_names(page)
+
+    pruned = DictionaryObject()
+    kept, dropped = [], []
+    for category, entries in resources.items():
+        entries = entries.get_object()
+        if category not in PRUNABLE_RESOURCES or not isinstance(entries, DictionaryObject):
+            pruned[NameObject(category)] = resources[category]
+            kept.append(resources[category])
+            continue
+        subset = DictionaryObject()
+        for name, value in entries.items():
+            if name in names or not SIMPLE_NAME.match(name):
+                subset[NameObject(name)] = value
+                kept.append(value)
+            else:
+                dropped.append(value)
+        pruned[NameObject(category)] = subset
+
+    page[NameObject('/Resources')] = pruned
+
+    # Objects still used by the page are not savings, even if also dropped
+    seen: Set[Tuple[int, int]] = set()
+    stream_bytes(kept + [page.get('/Contents')], seen)
+    return stream_bytes(dropped, seen)
+
+
+def render_page(reader: 'PdfReader', page_num: int, prune: bool = False) -> Tuple[bytes, int]:
+    """Render a single page of ``reader`` as a standalone PDF
+
+    Returns the PDF bytes and the bytes saved by pruning unused resources
+    (0 without ``prune``).
+    """
+    from PyPDF2 import PdfWriter
+
+    page = reader.pages[page_num]
+    saved = prune_resources(page) if prune else 0
+
+    writer = PdfWriter()
+    writer.add_page(page)
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue(), saved
+
+
+def store_page(reader: 'PdfReader', page_num: int, output_dir: Optional[Path],
+               prune: bool, slides: Dict[int, SlideData],
+               budget: Optional['MemoryBudget'] = None) -> int:
+    """Render a page and write it to ``output_dir``, or keep it in ``slides``
+
+    Under a ``budget`` a slide kept in memory may be spilled to a file
+    instead. Returns the bytes saved by resource pruning.
+    """
+    data, saved = render_page(reader, page_num, prune)
+    if output_dir is None:
+        slides[page_num] = data if budget is None else budget.keep(slide_filename(page_num), data)
+    else:
+        (Path(output_dir) / slide_filename(page_num)).write_bytes(data)
+    return saved
+
+
+def split_pages(source_pdf: str, output_dir: Optional[str], page_nums: List[int],
+                prune: bool = False, budget: Optional['MemoryBudget'] = None,
+                progress: Optional[Callable[[int, int], None]] = None,
+                reader: Optional['PdfReader'] = None) -> Tuple[int, Dict[int, SlideData], int]:
+    """Render the slide PDFs for the zero-based pages in ``page_nums``
+
+    Opens its own reader on the source unless one is given, as it is in
+    the serial path; worker processes always open their own. Returns the
+    bytes saved by resource pruning, the rendered slides without an
+    ``output_dir``, and the times the reader was reopened under ``budget``.
+    """
+    slides: Dict[int, SlideData] = {}
+    saved = 0
+    reopens = budget.reopens if budget is not None else 0
+    for done, (page_num, page_reader) in enumerate(
+            iter_pages(source_pdf, page_nums, budget, reader), 1):
+        saved += store_page(page_reader, page_num, output_dir, prune, slides, budget)
+        if progress:
+            progress(done, len(page_nums))
+    return saved, slides, (budget.reopens - reopens if budget is not None else 0)
+
+
+def remove_stale_slides(output_dir: Path, total_pages: int) -> None:
+    """Delete slide PDFs left over from an earlier, longer version of the deck"""
+    for path in Path(output_dir).glob('Slide*.pdf'):
+        number = path.stem[len('Slide'):]
+        if not number.isdigit() or int(number) > total_pages:
+            path.unlink()
+
+
+def split_pdf(source_pdf: Path, output_dir: Optional[Path], workers: int = 1,
+              prune: bool = False, pages: Optional[Iterable[int]] = None,
+              progress: Optional[Callable[[int, int], None]] = None,
+              budget: Optional['MemoryBudget'] = None
+              ) -> Tuple[int, int, Dict[int, SlideData]]:
+    """Split ``source_pdf`` into per-page slide PDFs in ``output_dir``
+
+    With more than one worker, page ranges are rendered by a process pool.
+    Each page is rendered exactly as the serial path would render it, so the
+    output does not depend on the worker count. With ``prune`` every slide
+    keeps only the resources its content uses. ``pages`` limits the split
+    to the given zero-based pages; the other slide files are left as they
+    are. ``progress(done, total)`` is called as slides are rendered, per page
+    in the serial path and per finished range in the parallel one.
+
+    Without an ``output_dir`` nothing is written to disk and the slides are
+    returned as {zero-based page number: PDF bytes}. Under a ``budget``,
+    slides rendered while the process is over the ceiling are spilled to
+    the budget's directory and returned as their path instead.
+
+    Returns (page count, bytes saved by pruning, in-memory slides).
+    """
+    if output_dir is not None:
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    with open_reader(source_pdf, budget) as reader:
+        total_pages = len(reader.pages)
+        if output_dir is not None:
+            remove_stale_slides(output_dir, total_pages)
+
+        page_nums = list(range(total_pages)) if pages is None else sorted(pages)
+        workers = min(resolve_workers(workers), len(page_nums))
+
+        progress = progress or (lambda done, total: None)
+        progress(0, len(page_nums))
+
+        ranges = page_ranges(len(page_nums), workers)
+        if workers <= 1 or len(ranges) <= 1:
+            # Under a budget the split opens its own reader, so it can drop it
+            saved, slides, _ = split_pages(source_pdf, output_dir, page_nums, prune, budget,
+                                           progress, reader if budget is None else None)
+            return total_pages, saved, slides
+
+    slides: Dict[int, SlideData] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(split_pages, str(source_pdf),
+                                   str(output_dir) if output_dir is not None else None,
+                                   page_nums[start:stop], prune, budget): stop - start
+                   for start, stop in ranges}
+        saved = done = 0
+        for future in as_completed(futures):
+            # Propagate the first worker error, if any
+            range_saved, range_slides, reopens = future.result()
+            saved += range_saved
+            if budget is not None:
+                # Workers count their reopens on their own copy of the budget
+                budget.reopens += reopens
+            for page_num, data in range_slides.items():
+                # The workers' budgets do not count the slides collected here
+                if budget is not None and isinstance(data, bytes):
+                    data = budget.keep(slide_filename(page_num), data)
+                slides[page_num] = data
+            done += futures[future]
+            progress(done, len(page_nums))
+    return total_pages, saved, slides
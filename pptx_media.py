@@ -0,0 +1,195 @@
+"""
+PPTX Media Helpers
+
+Reads speaker notes and narration audio from a PPTX in a single pass over
+its ZIP container. Only the XML parts needed for the notes and the audio
+entries themselves are touched; audio is streamed in chunks, either to
+disk or straight into a package writer.
+
+Audio is assigned to slides through each slide's relationships part, not
+through the media file names, which PowerPoint does not number by slide.
+"""
+
+import shutil
+import posixpath
+import zipfile as zip
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+CHUNK_SIZE = 1024 * 1024
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a')
+
+NAMESPACES = {
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+
+NOTES_SLIDE_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide'
+
+
+class ZipMember:
+    """An entry inside a ZIP file that can be streamed without extracting it"""
+
+    def __init__(self, archive_path: Path, name: str, file_size: int = 0, crc: int = 0):
+        self.archive_path = Path(archive_path)
+        self.name = name
+        self.file_size = file_size
+        self.crc = crc
+
+    def __repr__(self) -> str:
+        return f"ZipMember({self.archive_path.name}!{self.name})"
+
+    @property
+    def suffix(self) -> str:
+        """Lower-case file extension of the entry"""
+        return posixpath.splitext(self.name)[1].lower()
+
+    @property
+    def fingerprint(self) -> str:
+        """Cheap change marker from the central directory (CRC-32 and size)"""
+        return f"{self.crc:08x}-{self.file_size}"
+
+    @contextmanager
+    def open(self):
+        """Open the entry for reading, keeping its archive open while in use"""
+        with zip.ZipFile(self.archive_path, 'r') as archive, archive.open(self.name, 'r') as stream:
+            yield stream
+
+    def copy_to(self, destination: Path) -> None:
+        """Stream the entry to ``destination`` in chunks"""
+        with self.open() as source, open(destination, 'wb') as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+
+def part_rels_name(part: str) -> str:
+    """Return the relationships part of ``part`` (ppt/slides/_rels/slide1.xml.rels)"""
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, '_rels', f"{name}.rels")
+
+
+def resolve_target(part: str, target: str) -> str:
+    """Resolve a relationship target relative to the part that declares it"""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+
+
+def read_rels(zipf: zip.ZipFile, part: str) -> Dict[str, Tuple[str, str]]:
+    """Read the relationships of ``part`` as {rId: (type, resolved target)}
+
+    External targets (links to other files or URLs) are skipped.
+    """
+    rels_name = part_rels_name(part)
+    if rels_name not in zipf.NameToInfo:
+        return {}
+    with zipf.open(rels_name) as f:
+        root = ET.parse(f).getroot()
+    rels = {}
+    for rel in root.findall('rel:Relationship', NAMESPACES):
+        if rel.get('TargetMode') == 'External':
+            continue
+        rels[rel.get('Id')] = (rel.get('Type'), resolve_target(part, rel.get('Target')))
+    return rels
+
+
+def read_slide_parts(zipf: zip.ZipFile) -> List[str]:
+    """Return the slide part names in presentation order"""
+    presentation = 'ppt/presentation.xml'
+    rels = read_rels(zipf, presentation)
+    with zipf.open(presentation) as f:
+        root = ET.parse(f).getroot()
+    slides = []
+    for slide_id in root.iterfind('p:sldIdLst/p:sldId', NAMESPACES):
+        rel_id = slide_id.get(f"{{{NAMESPACES['r']}}}id")
+        if rel_id in rels:
+            slides.append(rels[rel_id][1])
+    return slides
+
+
+def read_notes_text(zipf: zip.ZipFile, notes_part: str) -> str:
+    """Return the text of the body placeholder of a notes slide
+
+    Paragraphs and line breaks become newlines. Header, slide number and
+    slide image placeholders are ignored.
+    """
+    with zipf.open(notes_part) as f:
+        root = ET.parse(f).getroot()
+    paragraphs = []
+    for shape in root.iter(f"{{{NAMESPACES['p']}}}sp"):
+        placeholder = shape.find('p:nvSpPr/p:nvPr/p:ph', NAMESPACES)
+        if placeholder is None or placeholder.get('type') != 'body':
+            continue
+        for paragraph in shape.iterfind('p:txBody/a:p', NAMESPACES):
+            parts = []
+            for node in paragraph:
+                tag = node.tag.rsplit('}', 1)[-1]
+                if tag in ('r', 'fld'):
+                    parts.append(''.join(node.itertext()))
+                elif tag == 'br':
+                    parts.append('\n')
+            paragraphs.append(''.join(parts))
+    return '\n'.join(paragraphs).strip()
+
+
+class PptxMedia:
+    """Speaker notes and narration audio of a PPTX, read in one pass
+
+    ``read`` opens the archive once, parses the presentation, slide and
+    notes parts, and indexes the audio entries. The audio itself is not
+    read until it is streamed with ``ZipMember.copy_to`` or ``open``.
+    """
+
+    def __init__(self, pptx_path: Path):
+        self.pptx_path = Path(pptx_path)
+        self.slide_notes: Dict[int, str] = {}
+        self.audio: Dict[int, ZipMember] = {}
+        # Audio entry name -> slides referencing it, in presentation order
+        self.references: Dict[str, List[int]] = {}
+        self.media_count = 0
+        self.slide_count = 0
+
+    def read(self, notes: bool = True) -> 'PptxMedia':
+        """Index notes and audio entries, returning ``self``
+
+        Each slide's relationships are read once. Its notes slide gives the
+        notes text, and the first audio entry it links gives its narration.
+        An entry linked from several slides maps to one shared ``ZipMember``.
+        Without ``notes`` only the central directory and the relationship
+        parts are read.
+        """
+        with zip.ZipFile(self.pptx_path, 'r') as zipf:
+            members: Dict[str, ZipMember] = {}
+            slide_parts = read_slide_parts(zipf)
+            self.slide_count = len(slide_parts)
+            for idx, slide_part in enumerate(slide_parts, 1):
+                for rel_type, target in read_rels(zipf, slide_part).values():
+                    info = zipf.NameToInfo.get(target)
+                    if info is None:
+                        continue
+                    if rel_type == NOTES_SLIDE_REL:
+                        notes_text = read_notes_text(zipf, target) if notes else ''
+                        if notes_text:
+                            self.slide_notes[idx] = notes_text
+                    elif target.lower().endswith(AUDIO_EXTENSIONS) and idx not in self.audio:
+                        if target not in members:
+                            members[target] = ZipMember(self.pptx_path, target, info.file_size, info.CRC)
+                        self.audio[idx] = members[target]
+                        self.references.setdefault(target, []).append(idx)
+
+            self.media_count = sum(1 for name in zipf.NameToInfo if name.startswith('ppt/media/'))
+        return self
+
+    @property
+    def shared_audio(self) -> Dict[str, List[int]]:
+        """Audio entries referenced by more than one slide"""
+        return {name: slides for name, slides in self.references.items() if len(slides) > 1}
+
+    def audio_for(self, slide_num: int) -> Optional[ZipMember]:
+        """Return the audio entry of a slide, if it has one"""
+        return self.audio.get(slide_num)
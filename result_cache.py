@@ -0,0 +1,148 @@
+"""
+Build Result Cache
+
+Finished packages stored under a key derived from everything that goes
+into a build: the bytes of the uploaded PDF, PPTX and notes DOCX, the title, the build
+settings and the generator version. An identical upload is then served
+from the cache without running the pipeline.
+
+The cache is bounded by total size on disk. Each hit refreshes the
+entry's modification time, and the least recently used packages are
+evicted first.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from h5p_package import hash_source, template_fingerprint
+
+
+# Modules whose code determines the package contents
+PIPELINE_MODULES = ('SD_Generator.py', 'h5p_package.py', 'pdf_slides.py', 'pptx_media.py',
+                    'slide_images.py', 'audio_transcode.py', 'slide_notes.py')
+
+_version_lock = threading.Lock()
+_version: Optional[str] = None
+
+
+def generator_version() -> str:
+    """Hash of the pipeline source files and the H5P template
+
+    Any change to the code or the template libraries gives new cache
+    keys, so stale packages are never served after an upgrade.
+    """
+    global _version
+    with _version_lock:
+        if _version is None:
+            root = Path(__file__).resolve().parent
+            digest = hashlib.sha256()
+            for name in PIPELINE_MODULES:
+                digest.update(name.encode('utf-8') + b'\0' + (root / name).read_bytes())
+            digest.update(template_fingerprint(root / 'Template_SD').encode('ascii'))
+            _version = digest.hexdigest()
+        return _version
+
+
+def build_key(pdf_path: Path, pptx_path: Optional[Path], title: str, settings: Dict,
+              digests: Optional[Dict[str, str]] = None, notes_path: Optional[Path] = None) -> str:
+    """Return the cache key of a build
+
+    ``digests`` holds SHA-256 digests already computed for the ``pdf``,
+    ``pptx`` or ``notes`` (e.g. while a chunked upload arrived); other
+    files are hashed.
+    """
+    digests = digests or {}
+
+    def file_digest(kind: str, path: Optional[Path]) -> Optional[str]:
+        if not path:
+            return None
+        return digests.get(kind) or hash_source(Path(path))[0]
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'generator': generator_version(),
+        'pdf': file_digest('pdf', pdf_path),
+        'pptx': file_digest('pptx', pptx_path),
+        'notes': file_digest('notes', notes_path),
+        'title': title,
+        'settings': settings,
+    }, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Packages in ``<cache_dir>/<key>.h5p``, at most ``max_bytes`` in total"""
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.h5p"
+
+    def get(self, key: str) -> Optional[Path]:
+        """Return the cached package for ``key``, marking it recently used"""
+        path = self.path(key)
+        with self._lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+        return path
+
+    def put(self, key: str, package_path: Path) -> None:
+        """Store a finished package, then evict old entries over the size limit"""
+        if self.max_bytes <= 0 or Path(package_path).stat().st_size > self.max_bytes:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Copy to a private file first so readers never see a partial package
+        fd, partial = tempfile.mkstemp(dir=self.cache_dir, suffix='.partial')
+        os.close(fd)
+        try:
+            shutil.copyfile(package_path, partial)
+            os.replace(partial, self.path(key))
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
+        self.evict()
+
+    def copy_to(self, key: str, destination: Path) -> Optional[Path]:
+        """Link or copy the cached package for ``key`` to ``destination``
+
+        The copy keeps the package available even if the cache entry is
+        evicted while it is being downloaded.
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            os.link(path, destination)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            shutil.copyfile(path, destination)
+        return Path(destination)
+
+    def evict(self) -> None:
+        """Delete least recently used packages until the cache fits ``max_bytes``"""
+        with self._lock:
+            entries = []
+            for path in self.cache_dir.glob('*.h5p'):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
@@ -0,0 +1,158 @@
+"""
+Slide Image Helpers
+
+Rasterises PDF pages to WebP or PNG slide images for H5P.Image, spread
+over a pool of worker processes like the PDF split. Rendering needs the
+optional PyMuPDF package; Pillow encodes the images.
+
+Under a ``MemoryBudget`` MuPDF's object store is emptied, and images
+kept in memory are spilled to files, whenever the process is over the
+ceiling.
+"""
+
+import io
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from pdf_slides import page_ranges, resolve_workers
+
+if TYPE_CHECKING:
+    from memory_budget import MemoryBudget
+
+
+# Slide formats: file extension, MIME type and Pillow save options
+IMAGE_FORMATS = {
+    'webp': ('.webp', 'image/webp', {'format': 'WEBP', 'quality': 85, 'method': 4}),
+    'png': ('.png', 'image/png', {'format': 'PNG', 'optimize': True}),
+}
+SLIDE_FORMATS = ('pdf',) + tuple(IMAGE_FORMATS)
+DEFAULT_DPI = 150
+
+# A rendered slide: (encoded image or the file it was spilled to, width, height)
+RenderedSlide = Tuple[Union[bytes, Path], int, int]
+
+
+def load_renderer():
+    """Import PyMuPDF, explaining how to get it when it is missing"""
+    try:
+        import pymupdf
+    except ImportError:
+        raise RuntimeError("Slide images need PyMuPDF: pip install PyMuPDF") from None
+    return pymupdf
+
+
+def image_filename(page_num: int, image_format: str) -> str:
+    """Return the file name of the slide image for a zero-based page number"""
+    return f"Slide{page_num + 1}{IMAGE_FORMATS[image_format][0]}"
+
+
+def render_image(document, page_num: int, dpi: int, image_format: str) -> RenderedSlide:
+    """Rasterise one page of an open PyMuPDF document"""
+    from PIL import Image
+
+    pixmap = document[page_num].get_pixmap(dpi=dpi, alpha=False)
+    image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    output = io.BytesIO()
+    image.save(output, **IMAGE_FORMATS[image_format][2])
+    return output.getvalue(), pixmap.width, pixmap.height
+
+
+def store_image(document, page_num: int, output_dir: Optional[str], dpi: int,
+                image_format: str, budget: Optional['MemoryBudget'] = None) -> RenderedSlide:
+    """Rasterise a page and write it to ``output_dir``, if given
+
+    Image bytes written to disk are not kept; only the size is returned.
+    Under a ``budget`` an image kept in memory may be spilled to a file.
+    """
+    data, width, height = render_image(document, page_num, dpi, image_format)
+    if output_dir is not None:
+        (Path(output_dir) / image_filename(page_num, image_format)).write_bytes(data)
+        data = b''
+    elif budget is not None:
+        data = budget.keep(image_filename(page_num, image_format), data)
+    if budget is not None and budget.exceeded():
+        # Drop the fonts, images and pages MuPDF has cached so far
+        load_renderer().TOOLS.store_shrink(100)
+    return data, width, height
+
+
+def render_pages(source_pdf: str, output_dir: Optional[str], page_nums: List[int],
+                 dpi: int, image_format: str, budget: Optional['MemoryBudget'] = None
+                 ) -> Dict[int, RenderedSlide]:
+    """Rasterise the zero-based pages in ``page_nums``
+
+    Runs inside a worker process, so it opens its own document.
+    """
+    pymupdf = load_renderer()
+    with pymupdf.open(source_pdf) as document:
+        return {page_num: store_image(document, page_num, output_dir, dpi, image_format, budget)
+                for page_num in page_nums}
+
+
+def remove_stale_images(output_dir: Path, total_pages: int, image_format: str) -> None:
+    """Delete slide images left over from a longer deck or another format"""
+    extension = IMAGE_FORMATS[image_format][0]
+    for path in Path(output_dir).glob('Slide*'):
+        number = path.stem[len('Slide'):]
+        if path.suffix != extension or not number.isdigit() or int(number) > total_pages:
+            path.unlink()
+
+
+def rasterise_pdf(source_pdf: Path, output_dir: Optional[Path], dpi: int = DEFAULT_DPI,
+                  image_format: str = 'webp', workers: int = 1,
+                  pages: Optional[Iterable[int]] = None,
+                  progress: Optional[Callable[[int, int], None]] = None,
+                  budget: Optional['MemoryBudget'] = None
+                  ) -> Tuple[int, Dict[int, RenderedSlide]]:
+    """Rasterise ``source_pdf`` into one slide image per page
+
+    Works like ``pdf_slides.split_pdf``: page ranges go to a process pool
+    when there is more than one worker, ``pages`` limits the work to the
+    given zero-based pages, and without ``output_dir`` the images are kept
+    in memory (or spilled to files under a ``budget``).
+
+    Returns (page count, {zero-based page number: (image bytes, width, height)}).
+    Image bytes are empty for images written to ``output_dir``.
+    """
+    pymupdf = load_renderer()
+    with pymupdf.open(source_pdf) as document:
+        total_pages = document.page_count
+
+    if output_dir is not None:
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        remove_stale_images(output_dir, total_pages, image_format)
+
+    page_nums = list(range(total_pages)) if pages is None else sorted(pages)
+    workers = min(resolve_workers(workers), len(page_nums))
+    output = str(output_dir) if output_dir is not None else None
+
+    progress = progress or (lambda done, total: None)
+    progress(0, len(page_nums))
+
+    slides: Dict[int, RenderedSlide] = {}
+    ranges = page_ranges(len(page_nums), workers)
+    if workers <= 1 or len(ranges) <= 1:
+        with pymupdf.open(source_pdf) as document:
+            for done, page_num in enumerate(page_nums, 1):
+                slides[page_num] = store_image(document, page_num, output, dpi, image_format,
+                                               budget)
+                progress(done, len(page_nums))
+        return total_pages, slides
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render_pages, str(source_pdf), output,
+                                   page_nums[start:stop], dpi, image_format, budget): stop - start
+                   for start, stop in ranges}
+        done = 0
+        for future in as_completed(futures):
+            # Propagate the first worker error, if any
+            for page_num, (data, width, height) in future.result().items():
+                # The workers' budgets do not count the images collected here
+                if budget is not None and isinstance(data, bytes) and output is None:
+                    data = budget.keep(image_filename(page_num, image_format), data)
+                slides[page_num] = data, width, height
+            done += futures[future]
+            progress(done, len(page_nums))
+    return total_pages, slides
@@ -0,0 +1,257 @@
+"""
+Slide Notes
+
+Speaker notes as the HTML shown in the SlideDeck notes panel, from either
+source: the plain text of PPTX notes slides, or a notes document
+(``<project>_NOTES.docx``) with a ``Slide N`` heading before each slide's
+notes.
+
+The DOCX is read with a single streaming pass over ``word/document.xml``.
+Each paragraph is converted and dropped as soon as it ends, and embedded
+images and other parts are never read, so memory stays flat however long
+the document is. Bold and italic runs, bulleted and numbered lists and
+line breaks are kept.
+"""
+
+import re
+import html
+import zipfile as zip
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+DOCUMENT_PART = 'word/document.xml'
+STYLES_PART = 'word/styles.xml'
+NUMBERING_PART = 'word/numbering.xml'
+
+# Heading that starts the notes of a slide, e.g. "Slide 12"
+SLIDE_HEADING = re.compile(r'[Ss]lide\s*(\d+)')
+
+# Containers whose runs belong to the paragraph around them
+RUN_CONTAINERS = {f"{W}{tag}" for tag in ('hyperlink', 'ins', 'smartTag', 'fldSimple', 'sdtContent')}
+
+
+def text_to_html(text: str) -> str:
+    """Convert plain notes text to HTML: one paragraph per line"""
+    return ''.join(f"<p>{html.escape(line)}</p>" for line in text.splitlines() if line.strip())
+
+
+def is_on(element: Optional[ET.Element]) -> bool:
+    """Whether a toggle property such as ``<w:b/>`` is present and not switched off"""
+    return element is not None and element.get(f"{W}val", 'true') not in ('0', 'false', 'none')
+
+
+def numbering_key(properties: Optional[ET.Element]) -> Optional[Tuple[str, Optional[str]]]:
+    """Return (numbering id, level) of paragraph or style properties, if they have one"""
+    numbering = properties.find(f"{W}numPr") if properties is not None else None
+    if numbering is None:
+        return None
+    num_id = numbering.find(f"{W}numId")
+    level = numbering.find(f"{W}ilvl")
+    return (num_id.get(f"{W}val") if num_id is not None else None,
+            level.get(f"{W}val") if level is not None else None)
+
+
+def read_styles(zipf: zip.ZipFile) -> Tuple[set, Dict[str, Tuple[str, Optional[str]]]]:
+    """Return the ids of the heading paragraph styles and the numbering of list styles
+
+    List styles such as "List Bullet" carry their numbering in the style,
+    not in each paragraph; it is inherited through ``basedOn``.
+    """
+    if STYLES_PART not in zipf.NameToInfo:
+        return set(), {}
+    with zipf.open(STYLES_PART) as f:
+        root = ET.parse(f).getroot()
+    headings = set()
+    numbering = {}
+    based_on = {}
+    for style in root.iter(f"{W}style"):
+        style_id = style.get(f"{W}styleId", '')
+        name = style.find(f"{W}name")
+        name = name.get(f"{W}val", '') if name is not None else ''
+        # Built-in heading styles are named "heading N" whatever the language of their id
+        if style_id.startswith('Heading') or name.lower().startswith('heading'):
+            headings.add(style_id)
+        key = numbering_key(style.find(f"{W}pPr"))
+        if key:
+            numbering[style_id] = key
+        parent = style.find(f"{W}basedOn")
+        if parent is not None:
+            based_on[style_id] = parent.get(f"{W}val")
+    for style_id in based_on:
+        parent, seen = style_id, set()
+        while parent not in numbering and parent in based_on and parent not in seen:
+            seen.add(parent)
+            parent = based_on[parent]
+        if parent in numbering:
+            numbering.setdefault(style_id, numbering[parent])
+    return headings, numbering
+
+
+def read_ordered_lists(zipf: zip.ZipFile) -> Dict[Tuple[str, str], bool]:
+    """Map (numbering id, level) to True for numbered and False for bulleted lists"""
+    if NUMBERING_PART not in zipf.NameToInfo:
+        return {}
+    with zipf.open(NUMBERING_PART) as f:
+        root = ET.parse(f).getroot()
+    formats = {}
+    for abstract in root.iter(f"{W}abstractNum"):
+        for level in abstract.iter(f"{W}lvl"):
+            number_format = level.find(f"{W}numFmt")
+            ordered = number_format is not None and number_format.get(f"{W}val") not in ('bullet', 'none')
+            formats[(abstract.get(f"{W}abstractNumId"), level.get(f"{W}ilvl"))] = ordered
+    ordered_lists = {}
+    for num in root.iter(f"{W}num"):
+        abstract = num.find(f"{W}abstractNumId")
+        if abstract is None:
+            continue
+        for (abstract_id, level), ordered in formats.items():
+            if abstract_id == abstract.get(f"{W}val"):
+                ordered_lists[(num.get(f"{W}numId"), level)] = ordered
+    return ordered_lists
+
+
+def list_tag(properties: Optional[ET.Element], style_key: Optional[Tuple[str, Optional[str]]],
+             ordered_lists: Dict[Tuple[str, str], bool]) -> Optional[str]:
+    """Return 'ul' or 'ol' for a list paragraph, None for other paragraphs
+
+    The paragraph's own numbering overrides that of its style, and
+    numbering id 0 removes it.
+    """
+    num_id, level = style_key or (None, None)
+    own = numbering_key(properties)
+    if own:
+        num_id = own[0] or num_id
+        level = own[1] or level
+    if num_id in (None, '0'):
+        return None
+    return 'ol' if ordered_lists.get((num_id, level or '0')) else 'ul'
+
+
+def run_html(run: ET.Element) -> str:
+    """Convert one ``<w:r>`` to HTML, keeping bold, italics and line breaks"""
+    properties = run.find(f"{W}rPr")
+    bold = properties is not None and is_on(properties.find(f"{W}b"))
+    italic = properties is not None and is_on(properties.find(f"{W}i"))
+    parts = []
+    for node in run:
+        if node.tag == f"{W}t":
+            parts.append(html.escape(node.text or ''))
+        elif node.tag in (f"{W}br", f"{W}cr"):
+            # Page and column breaks do not belong in the notes
+            if node.get(f"{W}type", 'textWrapping') == 'textWrapping':
+                parts.append('<br>')
+        elif node.tag == f"{W}tab":
+            parts.append(' ')
+    text = ''.join(parts)
+    if not text.strip():
+        return text
+    if bold:
+        text = f"<strong>{text}</strong>"
+    if italic:
+        text = f"<em>{text}</em>"
+    return text
+
+
+def paragraph_html(paragraph: ET.Element) -> str:
+    """Return the HTML of a paragraph's runs, without the paragraph tag"""
+    parts = []
+    for child in paragraph:
+        if child.tag == f"{W}r":
+            parts.append(run_html(child))
+        elif child.tag in RUN_CONTAINERS:
+            parts.extend(run_html(run) for run in child.iter(f"{W}r"))
+    return ''.join(parts).strip()
+
+
+def paragraph_text(paragraph: ET.Element) -> str:
+    return ''.join(node.text or '' for node in paragraph.iter(f"{W}t"))
+
+
+class NotesBuilder:
+    """Collects the notes HTML of one slide, grouping list items into lists"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.list_tag: Optional[str] = None
+
+    def close_list(self) -> None:
+        if self.list_tag:
+            self.parts.append(f"</{self.list_tag}>")
+            self.list_tag = None
+
+    def add(self, content: str, list_tag: Optional[str] = None) -> None:
+        if list_tag != self.list_tag:
+            self.close_list()
+            if list_tag:
+                self.parts.append(f"<{list_tag}>")
+                self.list_tag = list_tag
+        self.parts.append(f"<li>{content}</li>" if list_tag else f"<p>{content}</p>")
+
+    def html(self) -> str:
+        self.close_list()
+        return ''.join(self.parts)
+
+
+def read_notes_docx(docx_path: Path) -> Dict[int, str]:
+    """Return the notes HTML of each slide in a notes document
+
+    Paragraphs after a heading that names a slide (``Slide 3``) are the
+    notes of that slide, up to the next heading. Other headings end the
+    current slide's notes; text before the first slide heading is ignored.
+    """
+    slide_notes: Dict[int, str] = {}
+    with zip.ZipFile(docx_path, 'r') as zipf:
+        heading_styles, style_numbering = read_styles(zipf)
+        ordered_lists = read_ordered_lists(zipf)
+
+        current_slide: Optional[int] = None
+        notes = NotesBuilder()
+
+        def finish_slide() -> None:
+            content = notes.html()
+            if current_slide is not None and content:
+                slide_notes[current_slide] = content
+
+        body = None
+        # <w:document> is at depth 1, <w:body> at 2 and its blocks at 3
+        depth = 0
+        # Paragraphs in text boxes belong to the drawing, not the notes
+        text_box_depth = 0
+        with zipf.open(DOCUMENT_PART) as f:
+            for event, element in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if element.tag == f"{W}body":
+                        body = element
+                    elif element.tag == f"{W}txbxContent":
+                        text_box_depth += 1
+                    continue
+
+                if element.tag == f"{W}txbxContent":
+                    text_box_depth -= 1
+                elif element.tag == f"{W}p" and not text_box_depth:
+                    properties = element.find(f"{W}pPr")
+                    style = properties.find(f"{W}pStyle") if properties is not None else None
+                    style_id = style.get(f"{W}val") if style is not None else None
+                    if style_id in heading_styles:
+                        finish_slide()
+                        match = SLIDE_HEADING.search(paragraph_text(element))
+                        current_slide = int(match.group(1)) if match else None
+                        notes = NotesBuilder()
+                    elif current_slide is not None:
+                        content = paragraph_html(element)
+                        if content:
+                            notes.add(content, list_tag(properties, style_numbering.get(style_id),
+                                                        ordered_lists))
+
+                # Drop each top-level block (paragraph, table) once it has been read
+                if depth == 3 and body is not None:
+                    body.remove(element)
+                depth -= 1
+
+        finish_slide()
+    return slide_notes